@@ -1,5 +1,7 @@
 import sqlite3
 
+import db
+
 # Список угроз для вставки
 threats = [
     "Пожар",
@@ -55,7 +57,7 @@ threats = [
 
 def populate_threats():
     # Подключение к базе данных
-    with sqlite3.connect('risk_assessment.db') as conn:
+    with db.connect() as conn:
         cursor = conn.cursor()
         
         # Проверка наличия таблицы threats
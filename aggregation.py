@@ -0,0 +1,227 @@
+import risk_engine
+import rollups
+
+# Агрегирование оценок экспертов по активу в таблице assets (критерии и вероятность угроз)
+# и вероятностей по парам (актив, угроза) в таблице threat_likelihoods.
+# Способ агрегирования хранится в таблице aggregation_settings:
+#   mean     — среднее арифметическое (SQL AVG);
+#   median   — медиана;
+#   trimmed  — усечённое среднее: с каждой стороны отбрасывается доля trim оценок (с округлением вниз);
+#   weighted — среднее, взвешенное по компетентности экспертов (experts.competence).
+# Для mean пересчёт выполняется агрегирующим UPDATE в SQLite, для остальных способов — векторно в numpy
+# по всем строкам затронутых активов сразу. Функции работают на переданном соединении и не фиксируют транзакцию.
+
+STRATEGIES = ('mean', 'median', 'trimmed', 'weighted')
+STRATEGY_LABELS = {
+    'mean': 'Среднее',
+    'median': 'Медиана',
+    'trimmed': 'Усечённое среднее',
+    'weighted': 'Среднее, взвешенное по компетентности экспертов',
+}
+DEFAULT_STRATEGY = 'mean'
+DEFAULT_TRIM = 0.2
+
+
+# Текущий способ агрегирования: (strategy, trim)
+def load_settings(conn):
+    row = conn.execute('SELECT strategy, trim FROM aggregation_settings WHERE id = 1').fetchone()
+    return tuple(row) if row else (DEFAULT_STRATEGY, DEFAULT_TRIM)
+
+
+# Смена способа агрегирования с пересчётом всех активов; снимок рисков обновляет вызывающий код
+def set_strategy(conn, strategy, trim=DEFAULT_TRIM):
+    if strategy not in STRATEGIES:
+        raise ValueError(f'Неизвестный способ агрегирования: {strategy}')
+    if not (0 <= trim < 0.5):
+        raise ValueError('Доля усечения должна быть в диапазоне от 0 до 0.5')
+    conn.execute('UPDATE aggregation_settings SET strategy = ?, trim = ? WHERE id = 1', (strategy, trim))
+    return recompute(conn)
+
+
+# Статистика по группам: groups — id актива для каждого значения, weights — веса (компетентность).
+# Значения NaN (NULL) не учитываются. Возвращает (id групп, значения статистики).
+def group_statistic(groups, values, weights, strategy, trim=DEFAULT_TRIM):
+    import numpy as np
+
+    valid = ~np.isnan(values)
+    groups, values, weights = groups[valid], values[valid], weights[valid]
+    if len(groups) == 0:
+        return groups, values
+    if strategy in ('median', 'trimmed'):
+        order = np.lexsort((values, groups))
+    else:
+        order = np.argsort(groups, kind='stable')
+    groups, values, weights = groups[order], values[order], weights[order]
+    ids, starts, counts = np.unique(groups, return_index=True, return_counts=True)
+
+    if strategy == 'mean':
+        result = np.add.reduceat(values, starts) / counts
+    elif strategy == 'weighted':
+        result = np.add.reduceat(values * weights, starts) / np.add.reduceat(weights, starts)
+    elif strategy == 'median':
+        result = (values[starts + (counts - 1) // 2] + values[starts + counts // 2]) / 2
+    elif strategy == 'trimmed':
+        trimmed = np.floor(trim * counts).astype(np.int64)
+        cumulative = np.concatenate(([0.0], np.cumsum(values)))
+        result = (cumulative[starts + counts - trimmed] - cumulative[starts + trimmed]) / (counts - 2 * trimmed)
+    else:
+        raise ValueError(f'Неизвестный способ агрегирования: {strategy}')
+    return ids, result
+
+
+# Идентификаторы активов для пересчёта во временной таблице, чтобы обойтись без ограничения на число параметров
+def _stage_asset_ids(conn, asset_ids):
+    conn.execute('CREATE TEMP TABLE IF NOT EXISTS recompute_assets (asset_id INTEGER PRIMARY KEY)')
+    conn.execute('DELETE FROM temp.recompute_assets')
+    conn.executemany('INSERT OR IGNORE INTO temp.recompute_assets (asset_id) VALUES (?)', ((asset_id,) for asset_id in asset_ids))
+
+
+# Строки оценок (или вероятностей) с компетентностью эксперта: массив [asset_id, competence, значения...]
+def _load_rows(conn, table, columns, asset_ids):
+    import numpy as np
+
+    where = ''
+    if asset_ids is not None:
+        _stage_asset_ids(conn, asset_ids)
+        where = 'WHERE t.asset_id IN (SELECT asset_id FROM temp.recompute_assets)'
+    rows = conn.execute(f'''
+        SELECT t.asset_id, IFNULL(e.competence, 1), {', '.join(f't.{column}' for column in columns)}
+        FROM {table} t
+        LEFT JOIN experts e ON e.id = t.expert_id
+        {where}
+    ''').fetchall()
+    return np.array(rows, dtype=float).reshape(-1, len(columns) + 2)
+
+
+# Пересчёт оценок по критериям способом strategy в numpy; активы без оценок не изменяются
+def _recompute_scores(conn, asset_ids, strategy, trim):
+    import numpy as np
+
+    rows = _load_rows(conn, 'asset_evaluations', risk_engine.CRITERIA, asset_ids)
+    groups = rows[:, 0].astype(np.int64)
+    aggregated = {}
+    for column, _ in enumerate(risk_engine.CRITERIA):
+        ids, values = group_statistic(groups, rows[:, column + 2], rows[:, 1], strategy, trim)
+        for asset_id, value in zip(ids.tolist(), values.tolist()):
+            aggregated.setdefault(asset_id, [None] * len(risk_engine.CRITERIA))[column] = value
+    conn.executemany(f'''
+        UPDATE assets
+        SET {', '.join(f'{criterion} = ?' for criterion in risk_engine.CRITERIA)}
+        WHERE id = ?
+    ''', (tuple(values) + (asset_id,) for asset_id, values in aggregated.items()))
+    return len(aggregated)
+
+
+# Пересчёт вероятности угроз способом strategy в numpy; активы без вероятностей не изменяются
+def _recompute_probabilities(conn, asset_ids, strategy, trim):
+    import numpy as np
+
+    rows = _load_rows(conn, 'threat_probabilities', ('probability',), asset_ids)
+    ids, values = group_statistic(rows[:, 0].astype(np.int64), rows[:, 2], rows[:, 1], strategy, trim)
+    conn.executemany('UPDATE assets SET threat_probability = ? WHERE id = ?', zip(values.tolist(), ids.tolist()))
+    return len(ids)
+
+
+# Пересчёт оценок по критериям для актива текущим способом; возвращает True, если актив обновлён
+def refresh_asset_scores(conn, asset_id):
+    strategy, trim = load_settings(conn)
+    if strategy != 'mean':
+        return _recompute_scores(conn, [asset_id], strategy, trim) > 0
+    averages = conn.execute(f'''
+        SELECT {', '.join(f'AVG({criterion})' for criterion in risk_engine.CRITERIA)}
+        FROM asset_evaluations
+        WHERE asset_id = ?
+    ''', (asset_id,)).fetchone()
+    if averages and any(avg is not None for avg in averages):
+        conn.execute(f'''
+            UPDATE assets
+            SET {', '.join(f'{criterion} = ?' for criterion in risk_engine.CRITERIA)}
+            WHERE id = ?
+        ''', averages + (asset_id,))
+        return True
+    return False
+
+
+# Пересчёт вероятности угроз для актива текущим способом; возвращает True, если актив обновлён
+def refresh_threat_probability(conn, asset_id):
+    strategy, trim = load_settings(conn)
+    if strategy != 'mean':
+        return _recompute_probabilities(conn, [asset_id], strategy, trim) > 0
+    avg_probability = conn.execute('''
+        SELECT AVG(probability)
+        FROM threat_probabilities
+        WHERE asset_id = ?
+    ''', (asset_id,)).fetchone()[0]
+    if avg_probability is not None:
+        conn.execute('''
+            UPDATE assets
+            SET threat_probability = ?
+            WHERE id = ?
+        ''', (avg_probability, asset_id))
+        return True
+    return False
+
+
+# Пересчёт средних по всем критериям и средней вероятности угроз одним агрегирующим UPDATE на каждую таблицу.
+# asset_ids=None — по всем активам. Как и в refresh_asset_scores/refresh_threat_probability,
+# активы без оценок (вероятностей) не изменяются. Возвращает (число активов с оценками, число с вероятностями).
+def recompute_all(conn, asset_ids=None):
+    restrict = ''
+    if asset_ids is not None:
+        _stage_asset_ids(conn, asset_ids)
+        restrict = ' AND id IN (SELECT asset_id FROM temp.recompute_assets)'
+    columns = ', '.join(risk_engine.CRITERIA)
+    averages = ', '.join(f'AVG(ae.{criterion})' for criterion in risk_engine.CRITERIA)
+    any_score = ' OR '.join(f'{criterion} IS NOT NULL' for criterion in risk_engine.CRITERIA)
+    scores_updated = conn.execute(f'''
+        UPDATE assets
+        SET ({columns}) = (SELECT {averages} FROM asset_evaluations ae WHERE ae.asset_id = assets.id)
+        WHERE id IN (SELECT asset_id FROM asset_evaluations WHERE {any_score}){restrict}
+    ''').rowcount
+    probabilities_updated = conn.execute(f'''
+        UPDATE assets
+        SET threat_probability = (SELECT AVG(tp.probability) FROM threat_probabilities tp WHERE tp.asset_id = assets.id)
+        WHERE id IN (SELECT asset_id FROM threat_probabilities WHERE probability IS NOT NULL){restrict}
+    ''').rowcount
+    return scores_updated, probabilities_updated
+
+
+# Вероятности угроз по парам (актив, угроза) из asset_threat_probabilities в таблицу threat_likelihoods
+# текущим способом агрегирования для всех (asset_ids=None) или указанных активов. Возвращает число пар.
+def refresh_threat_likelihoods(conn, asset_ids=None):
+    import numpy as np
+
+    strategy, trim = load_settings(conn)
+    rollups.invalidate(conn)
+    where = ''
+    if asset_ids is not None:
+        _stage_asset_ids(conn, asset_ids)
+        where = 'WHERE asset_id IN (SELECT asset_id FROM temp.recompute_assets)'
+    conn.execute(f'DELETE FROM threat_likelihoods {where}')
+    if strategy == 'mean':
+        return conn.execute(f'''
+            INSERT INTO threat_likelihoods (asset_id, threat_id, probability)
+            SELECT asset_id, threat_id, AVG(probability)
+            FROM asset_threat_probabilities
+            {where}
+            GROUP BY asset_id, threat_id
+        ''').rowcount
+
+    # Строки [asset_id, competence, threat_id, probability]; группа — номер пары (актив, угроза)
+    rows = _load_rows(conn, 'asset_threat_probabilities', ('threat_id', 'probability'), asset_ids)
+    pairs, groups = np.unique(rows[:, [0, 2]].astype(np.int64), axis=0, return_inverse=True)
+    ids, values = group_statistic(groups.reshape(-1), rows[:, 3], rows[:, 1], strategy, trim)
+    conn.executemany('INSERT INTO threat_likelihoods (asset_id, threat_id, probability) VALUES (?, ?, ?)',
+                     zip(pairs[ids, 0].tolist(), pairs[ids, 1].tolist(), values.tolist()))
+    return len(ids)
+
+
+# Пересчёт оценок и вероятностей (в том числе по угрозам) текущим способом для всех (asset_ids=None)
+# или указанных активов. Возвращает (число активов с оценками, число с вероятностями).
+def recompute(conn, asset_ids=None):
+    strategy, trim = load_settings(conn)
+    refresh_threat_likelihoods(conn, asset_ids)
+    if strategy == 'mean':
+        return recompute_all(conn, asset_ids)
+    return (_recompute_scores(conn, asset_ids, strategy, trim),
+            _recompute_probabilities(conn, asset_ids, strategy, trim))
@@ -0,0 +1,225 @@
+import json
+import math
+
+import risk_engine
+import risk_snapshot
+
+# Метод анализа иерархий (AHP) для весов критериев.
+# Эксперт заполняет матрицу парных сравнений 6 × 6; хранится верхний треугольник (15 суждений, PAIRS).
+# Веса эксперта — главный собственный вектор матрицы, согласованность — отношение CR = CI / RI.
+# Групповая матрица — поэлементное среднее геометрическое матриц экспертов; в таблице ahp_group хранится
+# сумма логарифмов суждений, поэтому при изменении одной матрицы группа пересчитывается без чтения остальных.
+# Результаты (веса и CR каждого эксперта, групповые веса) хранятся в базе и пересчитываются только при изменении матриц.
+#
+# Наборы весов (weight_sets): исходные веса ('manual') и групповые веса AHP ('ahp'). Активный набор
+# копируется в criteria_weights, откуда веса читают все расчёты (снимок рисков, моделирование, сценарии).
+
+CRITERIA_LABELS = {
+    'life_health': 'Жизнь/Здоровье',
+    'economy': 'Экономика',
+    'ecology': 'Экология',
+    'dependency': 'Зависимость',
+    'social': 'Социальное',
+    'international': 'Международное',
+}
+
+# Пары критериев (i, j), i < j, в порядке хранения суждений
+PAIRS = tuple((i, j) for i in range(len(risk_engine.CRITERIA)) for j in range(i + 1, len(risk_engine.CRITERIA)))
+
+# Шкала Саати: во сколько раз первый критерий пары важнее второго
+SCALE = (9, 8, 7, 6, 5, 4, 3, 2, 1, 1 / 2, 1 / 3, 1 / 4, 1 / 5, 1 / 6, 1 / 7, 1 / 8, 1 / 9)
+
+# Случайный индекс согласованности для матрицы 6 × 6 (Саати)
+RANDOM_INDEX = 1.24
+# Матрица считается согласованной при CR не выше порога
+CONSISTENCY_THRESHOLD = 0.1
+
+MANUAL_SET = 'Исходные веса'
+GROUP_SET = 'AHP: группа экспертов'
+
+
+# Полная обратно-симметричная матрица по суждениям верхнего треугольника
+def full_matrix(judgments):
+    import numpy as np
+
+    matrix = np.ones((len(risk_engine.CRITERIA), len(risk_engine.CRITERIA)))
+    for (i, j), value in zip(PAIRS, judgments):
+        matrix[i, j] = value
+        matrix[j, i] = 1 / value
+    return matrix
+
+
+# Веса (главный собственный вектор), lambda_max и CR для суждений верхнего треугольника
+def priorities(judgments):
+    import numpy as np
+
+    matrix = full_matrix(judgments)
+    values, vectors = np.linalg.eig(matrix)
+    principal = int(np.argmax(values.real))
+    vector = np.abs(vectors[:, principal].real)
+    lambda_max = float(values[principal].real)
+    size = len(matrix)
+    consistency_index = max(lambda_max - size, 0) / (size - 1)
+    return (vector / vector.sum()).tolist(), lambda_max, consistency_index / RANDOM_INDEX
+
+
+# Проверка суждений: 15 положительных чисел в пределах шкалы Саати
+def validate(judgments):
+    if len(judgments) != len(PAIRS):
+        raise ValueError(f'Нужно {len(PAIRS)} парных сравнений')
+    result = []
+    for value in judgments:
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            raise ValueError('Сравнение должно быть числом')
+        if not (SCALE[-1] - 1e-9 <= value <= SCALE[0] + 1e-9):
+            raise ValueError('Сравнение должно быть в диапазоне от 1/9 до 9')
+        result.append(value)
+    return result
+
+
+def _weight_columns():
+    return ', '.join(risk_engine.CRITERIA)
+
+
+# Копирование набора весов в criteria_weights и пересчёт снимка рисков
+def _apply(conn, set_id):
+    weights = conn.execute(f'SELECT {_weight_columns()} FROM weight_sets WHERE id = ?', (set_id,)).fetchone()
+    if conn.execute('SELECT 1 FROM criteria_weights LIMIT 1').fetchone():
+        conn.execute(f'UPDATE criteria_weights SET {", ".join(f"{c} = ?" for c in risk_engine.CRITERIA)}', weights)
+    else:
+        conn.execute(f'INSERT INTO criteria_weights ({_weight_columns()}) VALUES ({", ".join("?" * len(weights))})', weights)
+    risk_snapshot.refresh_all(conn)
+
+
+# Исходные веса из criteria_weights как активный набор, если наборов ещё нет (первый запуск)
+def ensure_manual_set(conn):
+    if conn.execute('SELECT 1 FROM weight_sets LIMIT 1').fetchone():
+        return
+    weights = conn.execute(f'SELECT {_weight_columns()} FROM criteria_weights ORDER BY id LIMIT 1').fetchone()
+    if weights:
+        conn.execute(f'''
+            INSERT INTO weight_sets (name, source, {_weight_columns()}, active)
+            VALUES (?, 'manual', {', '.join('?' * len(weights))}, 1)
+        ''', (MANUAL_SET,) + tuple(weights))
+
+
+# Активация набора весов; возвращает False, если набор не найден
+def activate(conn, set_id):
+    if not conn.execute('SELECT 1 FROM weight_sets WHERE id = ?', (set_id,)).fetchone():
+        return False
+    conn.execute('UPDATE weight_sets SET active = 0 WHERE active = 1')
+    conn.execute('UPDATE weight_sets SET active = 1 WHERE id = ?', (set_id,))
+    _apply(conn, set_id)
+    return True
+
+
+# Обновление группового набора по сумме логарифмов; если он активен — применение новых весов
+def _update_group(conn, log_sum, experts):
+    conn.execute('INSERT OR REPLACE INTO ahp_group (id, experts, log_sum) VALUES (1, ?, ?)', (experts, json.dumps(log_sum)))
+    if experts == 0:
+        # Без матриц групповой набор сохраняет последние рассчитанные веса
+        conn.execute('UPDATE weight_sets SET experts = 0 WHERE name = ?', (GROUP_SET,))
+        return
+    weights, _, consistency_ratio = priorities([math.exp(value / experts) for value in log_sum])
+    conn.execute(f'''
+        INSERT INTO weight_sets (name, source, {_weight_columns()}, consistency_ratio, experts)
+        VALUES (?, 'ahp', {', '.join('?' * len(weights))}, ?, ?)
+        ON CONFLICT (name) DO UPDATE SET
+            {', '.join(f'{c} = excluded.{c}' for c in risk_engine.CRITERIA)},
+            consistency_ratio = excluded.consistency_ratio,
+            experts = excluded.experts,
+            updated_at = CURRENT_TIMESTAMP
+    ''', (GROUP_SET, *weights, consistency_ratio, experts))
+    group = conn.execute('SELECT id, active FROM weight_sets WHERE name = ?', (GROUP_SET,)).fetchone()
+    if group[1]:
+        _apply(conn, group[0])
+
+
+def _group_state(conn):
+    row = conn.execute('SELECT experts, log_sum FROM ahp_group WHERE id = 1').fetchone()
+    if row is None:
+        return [0.0] * len(PAIRS), 0
+    return json.loads(row[1]), row[0]
+
+
+# Сохранение матрицы эксперта: пересчёт его весов и групповых весов (с учётом прежней матрицы эксперта).
+# Возвращает (веса, lambda_max, CR) эксперта. Фиксация транзакции остаётся за вызывающим кодом.
+def save_comparison(conn, expert_id, judgments):
+    judgments = validate(judgments)
+    weights, lambda_max, consistency_ratio = priorities(judgments)
+    previous = conn.execute('SELECT judgments FROM ahp_comparisons WHERE expert_id = ?', (expert_id,)).fetchone()
+    conn.execute(f'''
+        INSERT OR REPLACE INTO ahp_comparisons (expert_id, judgments, {_weight_columns()}, lambda_max, consistency_ratio)
+        VALUES (?, ?, {', '.join('?' * len(weights))}, ?, ?)
+    ''', (expert_id, json.dumps(judgments), *weights, lambda_max, consistency_ratio))
+
+    log_sum, experts = _group_state(conn)
+    if previous:
+        log_sum = [total - math.log(value) for total, value in zip(log_sum, json.loads(previous[0]))]
+    else:
+        experts += 1
+    log_sum = [total + math.log(value) for total, value in zip(log_sum, judgments)]
+    _update_group(conn, log_sum, experts)
+    return weights, lambda_max, consistency_ratio
+
+
+# Удаление матрицы эксперта с пересчётом групповых весов; возвращает False, если матрицы не было
+def delete_comparison(conn, expert_id):
+    previous = conn.execute('SELECT judgments FROM ahp_comparisons WHERE expert_id = ?', (expert_id,)).fetchone()
+    if previous is None:
+        return False
+    conn.execute('DELETE FROM ahp_comparisons WHERE expert_id = ?', (expert_id,))
+    log_sum, experts = _group_state(conn)
+    log_sum = [total - math.log(value) for total, value in zip(log_sum, json.loads(previous[0]))]
+    _update_group(conn, log_sum if experts > 1 else [0.0] * len(PAIRS), experts - 1)
+    return True
+
+
+# Суждения эксперта (список из 15 значений) или None
+def load_judgments(conn, expert_id):
+    row = conn.execute('SELECT judgments FROM ahp_comparisons WHERE expert_id = ?', (expert_id,)).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+# Сохранённые результаты: матрицы экспертов (или одного эксперта) и наборы весов
+def load_summary(conn, expert_id=None):
+    where = 'WHERE c.expert_id = ?' if expert_id is not None else ''
+    experts = [
+        {
+            'expert_id': row[0],
+            'expert': row[1],
+            'weights': dict(zip(risk_engine.CRITERIA, row[2:8])),
+            'lambda_max': row[8],
+            'consistency_ratio': row[9],
+            'consistent': row[9] <= CONSISTENCY_THRESHOLD,
+            'updated_at': row[10],
+        }
+        for row in conn.execute(f'''
+            SELECT c.expert_id, e.name, {', '.join(f'c.{c}' for c in risk_engine.CRITERIA)},
+                   c.lambda_max, c.consistency_ratio, c.updated_at
+            FROM ahp_comparisons c
+            JOIN experts e ON e.id = c.expert_id
+            {where}
+            ORDER BY e.name
+        ''', () if expert_id is None else (expert_id,))
+    ]
+    weight_sets = [
+        {
+            'id': row[0],
+            'name': row[1],
+            'source': row[2],
+            'weights': dict(zip(risk_engine.CRITERIA, row[3:9])),
+            'consistency_ratio': row[9],
+            'experts': row[10],
+            'updated_at': row[11],
+            'active': bool(row[12]),
+        }
+        for row in conn.execute(f'''
+            SELECT id, name, source, {_weight_columns()}, consistency_ratio, experts, updated_at, active
+            FROM weight_sets
+            ORDER BY id
+        ''')
+    ]
+    return {'experts': experts, 'weight_sets': weight_sets}
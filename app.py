@@ -1,220 +1,59 @@
-# Set Matplotlib backend to Agg before importing pyplot
-import matplotlib
-matplotlib.use('Agg')  # Non-interactive backend
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session, Response, abort, stream_with_context
 from functools import wraps
 from werkzeug.security import generate_password_hash, check_password_hash
+import click
+import json
+import secrets
 import sqlite3
-import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-import os
-import uuid
-from matplotlib.colors import ListedColormap, BoundaryNorm
+import time
+import aggregation
+import ahp
+import bootstrap
+import bulk_import
+import controls
+import db
+import export
+import heatmap
+import migrations
+import pagination
+import portfolio
+import propagation
+import reference_data
+import risk_engine
+import risk_scenarios
+import risk_snapshot
+import rollups
+import scenario
+import sensitivity
+import simulation
 
 app = Flask(__name__)
 app.secret_key = 'supersecretkey'
+# Максимальное число тепловых карт, хранимых в static/ (вытесняются по LRU)
+app.config['HEATMAP_CACHE_SIZE'] = 64
+# Способ отрисовки тепловой карты: 'svg' (встроенный) или 'matplotlib' (PNG через matplotlib/seaborn)
+app.config['HEATMAP_BACKEND'] = 'svg'
+# Число процессов, отрисовывающих тепловые карты matplotlib вне потока запроса
+app.config['HEATMAP_RENDER_WORKERS'] = 1
+# Путь к базе данных: переменная окружения RISK_ASSESSMENT_DB или risk_assessment.db
+db.init_app(app)
 
-# Инициализация базы данных SQLite
-def init_db():
-    with sqlite3.connect('risk_assessment.db') as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS assets (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL UNIQUE,
-                life_health REAL,
-                economy REAL,
-                ecology REAL,
-                dependency REAL,
-                social REAL,
-                international REAL,
-                threat_probability REAL
-            )
-        ''')
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT NOT NULL UNIQUE,
-                password_hash TEXT NOT NULL,
-                role TEXT NOT NULL CHECK(role IN ('admin', 'expert')),
-                expert_id INTEGER,
-                FOREIGN KEY (expert_id) REFERENCES experts(id)
-            )
-        ''')
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS experts (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL UNIQUE
-            )
-        ''')
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS asset_evaluations (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                asset_id INTEGER,
-                expert_id INTEGER,
-                life_health REAL,
-                economy REAL,
-                ecology REAL,
-                dependency REAL,
-                social REAL,
-                international REAL,
-                FOREIGN KEY (asset_id) REFERENCES assets(id),
-                FOREIGN KEY (expert_id) REFERENCES experts(id)
-            )
-        ''')
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS criteria_weights (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                life_health REAL,
-                economy REAL,
-                ecology REAL,
-                dependency REAL,
-                social REAL,
-                international REAL
-            )
-        ''')
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS threat_probabilities (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                asset_id INTEGER,
-                expert_id INTEGER,
-                probability REAL,
-                FOREIGN KEY (asset_id) REFERENCES assets(id),
-                FOREIGN KEY (expert_id) REFERENCES experts(id)
-            )
-        ''')
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS asset_owners (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL UNIQUE
-            )
-        ''')
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS threats (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL UNIQUE
-            )
-        ''')
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS vulnerabilities (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL UNIQUE,
-                category TEXT NOT NULL
-            )
-        ''')
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS taken_measures (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL UNIQUE
-            )
-        ''')
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS control_measures (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL UNIQUE
-            )
-        ''')
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS risk_analysis (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                asset_id INTEGER,
-                asset_owner_id INTEGER,
-                threat_id INTEGER,
-                vulnerability_id INTEGER,
-                taken_measure_id INTEGER,
-                control_measure_id INTEGER,
-                control_effectiveness REAL,
-                FOREIGN KEY (asset_id) REFERENCES assets(id),
-                FOREIGN KEY (asset_owner_id) REFERENCES asset_owners(id),
-                FOREIGN KEY (threat_id) REFERENCES threats(id),
-                FOREIGN KEY (vulnerability_id) REFERENCES vulnerabilities(id),
-                FOREIGN KEY (taken_measure_id) REFERENCES taken_measures(id),
-                FOREIGN KEY (control_measure_id) REFERENCES control_measures(id)
-            )
-        ''')
-        # Проверяем, есть ли веса критериев, и добавляем фиксированные веса, если таблица пуста
-        cursor.execute('SELECT COUNT(*) FROM criteria_weights')
-        if cursor.fetchone()[0] == 0:
-            cursor.execute('''
-                INSERT INTO criteria_weights (life_health, economy, ecology, dependency, social, international)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (0.419, 0.252, 0.099, 0.144, 0.051, 0.035))
-        # Добавляем начальные значения для реестров
-        cursor.execute('SELECT COUNT(*) FROM asset_owners')
-        if cursor.fetchone()[0] == 0:
-            cursor.executemany('INSERT INTO asset_owners (name) VALUES (?)', [
-                ('IT Department',), ('Operations',), ('Finance',)
-            ])
-        # cursor.execute('SELECT COUNT(*) FROM threats')
-        # if cursor.fetchone()[0] == 0:
-        #     cursor.executemany('INSERT INTO threats (name) VALUES (?)', [
-        #         ('Cyber attack',), ('Physical attack',), ('Data breach',)
-        #     ])
-        cursor.execute('SELECT COUNT(*) FROM taken_measures')
-        if cursor.fetchone()[0] == 0:
-            cursor.executemany('INSERT INTO taken_measures (name) VALUES (?)', [
-                ('Минимизация рисков и выбор контролей',),
-                ('Передача рисков третьей стороне (страхование)',),
-                ('Отказ от риска',),
-                ('Принятие риска',)
-            ])
-        cursor.execute('SELECT COUNT(*) FROM control_measures')
-        if cursor.fetchone()[0] == 0:
-            cursor.executemany('INSERT INTO control_measures (name) VALUES (?)', [
-                ('A.5.1.1 Policies for information Security',),
-                ('A.5.1.2 Review of the policies for information security',),
-                ('A.6.1.1 Information security roles and responsibilities',),
-                ('A.6.1.2 Segregation of duties',),
-                ('A.6.1.3 Contact with authorities',),
-                ('A.6.1.4 Contact with special interest groups',)
-            ])
-        # Создаём администратора по умолчанию, если его нет
-        cursor.execute('SELECT COUNT(*) FROM users WHERE role = ?', ('admin',))
-        if cursor.fetchone()[0] == 0:
-            admin_password = generate_password_hash('admin123')
-            cursor.execute('''
-                INSERT INTO users (username, password_hash, role)
-                VALUES (?, ?, ?)
-            ''', ('admin', admin_password, 'admin'))
-        conn.commit()
-
-init_db()
+# Схема и начальные данные создаются командой `flask init-db` (bootstrap.py);
+# рабочий процесс при запуске только проверяет версию схемы
+bootstrap.ensure_database(app.config['DATABASE'])
 
 # Функция для пересчёта средних оценок для актива
 def update_asset_scores(asset_id):
-    with sqlite3.connect('risk_assessment.db') as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT AVG(life_health), AVG(economy), AVG(ecology), AVG(dependency), AVG(social), AVG(international)
-            FROM asset_evaluations
-            WHERE asset_id = ?
-        ''', (asset_id,))
-        averages = cursor.fetchone()
-        if averages and any(avg is not None for avg in averages):
-            cursor.execute('''
-                UPDATE assets
-                SET life_health = ?, economy = ?, ecology = ?, dependency = ?, social = ?, international = ?
-                WHERE id = ?
-            ''', averages + (asset_id,))
+    with db.get_db() as conn:
+        if aggregation.refresh_asset_scores(conn, asset_id):
+            risk_snapshot.refresh_assets(conn, [asset_id])
             conn.commit()
 
 # Функция для пересчёта средней вероятности угроз для актива
 def update_threat_probability(asset_id):
-    with sqlite3.connect('risk_assessment.db') as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT AVG(probability)
-            FROM threat_probabilities
-            WHERE asset_id = ?
-        ''', (asset_id,))
-        avg_probability = cursor.fetchone()[0]
-        if avg_probability is not None:
-            cursor.execute('''
-                UPDATE assets
-                SET threat_probability = ?
-                WHERE id = ?
-            ''', (avg_probability, asset_id))
+    with db.get_db() as conn:
+        if aggregation.refresh_threat_probability(conn, asset_id):
+            risk_snapshot.refresh_assets(conn, [asset_id])
             conn.commit()
 
 # Расчёт риска
@@ -224,15 +63,7 @@ def calculate_risk(impact, probability, control_effectiveness=None):
         residual_risk = risk_score * (1 - control_effectiveness)
     else:
         residual_risk = risk_score
-    if 1 <= residual_risk <= 3.9:
-        risk_level = "Низкий"
-        risk_interpretation = "Допустимый, контрольный"
-    elif 4 <= residual_risk <= 6.9:
-        risk_level = "Средний"
-        risk_interpretation = "Требует мер по снижению"
-    else:
-        risk_level = "Высокий"
-        risk_interpretation = "Требует приоритетного устранения"
+    risk_level, risk_interpretation = risk_engine.risk_level(residual_risk)
     return risk_score, residual_risk, risk_level, risk_interpretation
 
 # Функции аутентификации
@@ -282,7 +113,7 @@ def login():
         username = request.form['username']
         password = request.form['password']
         
-        with sqlite3.connect('risk_assessment.db') as conn:
+        with db.get_db() as conn:
             cursor = conn.cursor()
             cursor.execute('SELECT id, username, password_hash, role, expert_id FROM users WHERE username = ?', (username,))
             user = cursor.fetchone()
@@ -308,7 +139,7 @@ def logout():
 @app.route('/users')
 @admin_required
 def list_users():
-    with sqlite3.connect('risk_assessment.db') as conn:
+    with db.get_db() as conn:
         cursor = conn.cursor()
         cursor.execute('''
             SELECT u.id, u.username, u.role, e.name
@@ -322,7 +153,7 @@ def list_users():
 @app.route('/users/add', methods=['GET', 'POST'])
 @admin_required
 def add_user():
-    with sqlite3.connect('risk_assessment.db') as conn:
+    with db.get_db() as conn:
         cursor = conn.cursor()
         cursor.execute('SELECT id, name FROM experts')
         experts = cursor.fetchall()
@@ -361,21 +192,33 @@ def add_user():
 @app.route('/experts')
 @admin_required
 def list_experts():
-    with sqlite3.connect('risk_assessment.db') as conn:
+    with db.get_db() as conn:
         cursor = conn.cursor()
-        cursor.execute('SELECT id, name FROM experts')
+        cursor.execute('SELECT id, name, competence FROM experts')
         experts = cursor.fetchall()
     return render_template('experts.html', experts=experts)
 
+# Компетентность эксперта из формы (вес во взвешенном среднем); None, если значение некорректно
+def _competence_from_form():
+    try:
+        competence = float(request.form.get('competence') or 1)
+    except ValueError:
+        return None
+    return competence if competence > 0 else None
+
 @app.route('/experts/add', methods=['GET', 'POST'])
 @admin_required
 def add_expert():
     if request.method == 'POST':
         name = request.form['name']
-        with sqlite3.connect('risk_assessment.db') as conn:
+        competence = _competence_from_form()
+        if competence is None:
+            flash('Ошибка: компетентность должна быть положительным числом!')
+            return redirect(url_for('add_expert'))
+        with db.get_db() as conn:
             cursor = conn.cursor()
             try:
-                cursor.execute('INSERT INTO experts (name) VALUES (?)', (name,))
+                cursor.execute('INSERT INTO experts (name, competence) VALUES (?, ?)', (name, competence))
                 conn.commit()
                 flash('Эксперт успешно добавлен!')
                 return redirect(url_for('list_experts'))
@@ -387,12 +230,28 @@ def add_expert():
 @app.route('/experts/edit/<int:id>', methods=['GET', 'POST'])
 @admin_required
 def edit_expert(id):
-    with sqlite3.connect('risk_assessment.db') as conn:
+    with db.get_db() as conn:
         cursor = conn.cursor()
         if request.method == 'POST':
             name = request.form['name']
+            competence = _competence_from_form()
+            if competence is None:
+                flash('Ошибка: компетентность должна быть положительным числом!')
+                return redirect(url_for('edit_expert', id=id))
             try:
-                cursor.execute('UPDATE experts SET name = ? WHERE id = ?', (name, id))
+                cursor.execute('SELECT competence FROM experts WHERE id = ?', (id,))
+                previous = cursor.fetchone()
+                cursor.execute('UPDATE experts SET name = ?, competence = ? WHERE id = ?', (name, competence, id))
+                # Компетентность влияет на агрегированные оценки активов, которые оценивал эксперт
+                if previous and previous[0] != competence and aggregation.load_settings(conn)[0] == 'weighted':
+                    cursor.execute('''
+                        SELECT asset_id FROM asset_evaluations WHERE expert_id = ?
+                        UNION SELECT asset_id FROM threat_probabilities WHERE expert_id = ?
+                        UNION SELECT asset_id FROM asset_threat_probabilities WHERE expert_id = ?
+                    ''', (id, id, id))
+                    asset_ids = [row[0] for row in cursor.fetchall()]
+                    aggregation.recompute(conn, asset_ids)
+                    risk_snapshot.refresh_assets(conn, asset_ids)
                 conn.commit()
                 flash('Эксперт успешно отредактирован!')
                 return redirect(url_for('list_experts'))
@@ -400,7 +259,7 @@ def edit_expert(id):
                 flash('Ошибка: эксперт с таким именем уже существует!')
                 return redirect(url_for('edit_expert', id=id))
         
-        cursor.execute('SELECT id, name FROM experts WHERE id = ?', (id,))
+        cursor.execute('SELECT id, name, competence FROM experts WHERE id = ?', (id,))
         expert = cursor.fetchone()
         if not expert:
             flash('Эксперт не найден!')
@@ -410,11 +269,14 @@ def edit_expert(id):
 @app.route('/experts/delete/<int:id>', methods=['POST'])
 @admin_required
 def delete_expert(id):
-    with sqlite3.connect('risk_assessment.db') as conn:
+    with db.get_db() as conn:
         cursor = conn.cursor()
         cursor.execute('SELECT COUNT(*) FROM asset_evaluations WHERE expert_id = ?', (id,))
         eval_count = cursor.fetchone()[0]
-        cursor.execute('SELECT COUNT(*) FROM threat_probabilities WHERE expert_id = ?', (id,))
+        cursor.execute('''
+            SELECT (SELECT COUNT(*) FROM threat_probabilities WHERE expert_id = ?)
+                 + (SELECT COUNT(*) FROM asset_threat_probabilities WHERE expert_id = ?)
+        ''', (id, id))
         prob_count = cursor.fetchone()[0]
         if eval_count > 0 or prob_count > 0:
             flash('Нельзя удалить эксперта, так как он имеет оценки активов или вероятности угроз!')
@@ -426,32 +288,49 @@ def delete_expert(id):
             flash('Эксперт не найден!')
             return redirect(url_for('list_experts'))
         
+        # Матрица парных сравнений эксперта исключается из групповых весов AHP
+        ahp.delete_comparison(conn, id)
         cursor.execute('DELETE FROM experts WHERE id = ?', (id,))
         conn.commit()
         flash('Эксперт успешно удалён!')
     return redirect(url_for('list_experts'))
 
+# Описание списка активов для постраничного вывода
+ASSET_LIST = {
+    'columns': 'a.id, a.name, a.life_health, a.economy, a.ecology, a.dependency, a.social, a.international, a.threat_probability',
+    'from': 'assets a',
+    'id': 'a.id',
+    'sorts': {
+        'id': 'a.id',
+        'name': 'a.name',
+        'threat_probability': 'IFNULL(a.threat_probability, 0)',
+    },
+    'default_sort': 'id',
+    'filters': {
+        'asset': ('a.name >= ? AND a.name < ?', pagination.prefix_range),
+    },
+}
+
 @app.route('/assets')
 @login_required
 def list_assets():
-    with sqlite3.connect('risk_assessment.db') as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT id, name, life_health, economy, ecology, dependency, social, international, threat_probability FROM assets')
-        assets = cursor.fetchall()
-    return render_template('assets.html', assets=assets)
+    with db.get_db() as conn:
+        page = pagination.paginate(conn, ASSET_LIST, request.args)
+    return render_template('assets.html', assets=page['rows'], page=page)
 
 @app.route('/assets/add', methods=['GET', 'POST'])
 @admin_required
 def add_asset():
     if request.method == 'POST':
         name = request.form['name']
-        with sqlite3.connect('risk_assessment.db') as conn:
+        with db.get_db() as conn:
             cursor = conn.cursor()
             try:
                 cursor.execute('''
                     INSERT INTO assets (name, life_health, economy, ecology, dependency, social, international, threat_probability)
                     VALUES (?, 0, 0, 0, 0, 0, 0, 0)
                 ''', (name,))
+                risk_snapshot.refresh_assets(conn, [cursor.lastrowid])
                 conn.commit()
                 flash('Актив успешно добавлен! Пожалуйста, добавьте оценки экспертов и вероятности угроз.')
                 return redirect(url_for('list_assets'))
@@ -463,7 +342,7 @@ def add_asset():
 @app.route('/assets/edit/<int:id>', methods=['GET', 'POST'])
 @admin_required
 def edit_asset(id):
-    with sqlite3.connect('risk_assessment.db') as conn:
+    with db.get_db() as conn:
         cursor = conn.cursor()
         if request.method == 'POST':
             name = request.form['name']
@@ -486,11 +365,14 @@ def edit_asset(id):
 @app.route('/assets/delete/<int:id>', methods=['POST'])
 @admin_required
 def delete_asset(id):
-    with sqlite3.connect('risk_assessment.db') as conn:
+    with db.get_db() as conn:
         cursor = conn.cursor()
         cursor.execute('SELECT COUNT(*) FROM asset_evaluations WHERE asset_id = ?', (id,))
         eval_count = cursor.fetchone()[0]
-        cursor.execute('SELECT COUNT(*) FROM threat_probabilities WHERE asset_id = ?', (id,))
+        cursor.execute('''
+            SELECT (SELECT COUNT(*) FROM threat_probabilities WHERE asset_id = ?)
+                 + (SELECT COUNT(*) FROM asset_threat_probabilities WHERE asset_id = ?)
+        ''', (id, id))
         prob_count = cursor.fetchone()[0]
         cursor.execute('SELECT COUNT(*) FROM risk_analysis WHERE asset_id = ?', (id,))
         risk_count = cursor.fetchone()[0]
@@ -504,43 +386,54 @@ def delete_asset(id):
             flash('Актив не найден!')
             return redirect(url_for('list_assets'))
         
+        # Зависимости актива удаляются вместе с ним; риски связанных активов пересчитываются
+        asset_ids = propagation.remove_asset(conn, id)
         cursor.execute('DELETE FROM assets WHERE id = ?', (id,))
+        risk_snapshot.refresh_assets(conn, asset_ids)
         conn.commit()
         flash('Актив успешно удалён!')
     return redirect(url_for('list_assets'))
 
+# Описание списка оценок активов для постраничного вывода
+ASSET_EVALUATION_LIST = {
+    'columns': 'ae.id, a.name, e.name, ae.life_health, ae.economy, ae.ecology, ae.dependency, ae.social, ae.international',
+    'from': 'asset_evaluations ae JOIN assets a ON ae.asset_id = a.id JOIN experts e ON ae.expert_id = e.id',
+    'id': 'ae.id',
+    'sorts': {
+        'id': 'ae.id',
+        'asset': 'a.name',
+        'expert': 'e.name',
+    },
+    'default_sort': 'id',
+    'filters': {
+        'asset': ('a.name >= ? AND a.name < ?', pagination.prefix_range),
+        'expert': ('ae.expert_id = ?', int),
+    },
+}
+
 @app.route('/asset_evaluations')
 @expert_required
 def list_asset_evaluations():
-    with sqlite3.connect('risk_assessment.db') as conn:
+    with db.get_db() as conn:
         cursor = conn.cursor()
         if session.get('role') == 'admin':
-            cursor.execute('''
-                SELECT ae.id, a.name, e.name, ae.life_health, ae.economy, ae.ecology, ae.dependency, ae.social, ae.international
-                FROM asset_evaluations ae
-                JOIN assets a ON ae.asset_id = a.id
-                JOIN experts e ON ae.expert_id = e.id
-            ''')
+            page = pagination.paginate(conn, ASSET_EVALUATION_LIST, request.args)
+            cursor.execute('SELECT id, name FROM experts ORDER BY name')
+            experts = cursor.fetchall()
         else:
             # Эксперты видят только свои оценки
             expert_id = session.get('expert_id')
             if not expert_id:
                 flash('Ошибка: не найден ID эксперта для вашего аккаунта.')
                 return redirect(url_for('index'))
-            cursor.execute('''
-                SELECT ae.id, a.name, e.name, ae.life_health, ae.economy, ae.ecology, ae.dependency, ae.social, ae.international
-                FROM asset_evaluations ae
-                JOIN assets a ON ae.asset_id = a.id
-                JOIN experts e ON ae.expert_id = e.id
-                WHERE ae.expert_id = ?
-            ''', (expert_id,))
-        evaluations = cursor.fetchall()
-    return render_template('asset_evaluations.html', evaluations=evaluations)
+            page = pagination.paginate(conn, ASSET_EVALUATION_LIST, request.args, ['ae.expert_id = ?'], [expert_id])
+            experts = []
+    return render_template('asset_evaluations.html', evaluations=page['rows'], page=page, experts=experts)
 
 @app.route('/asset_evaluations/add', methods=['GET', 'POST'])
 @expert_required
 def add_asset_evaluation():
-    with sqlite3.connect('risk_assessment.db') as conn:
+    with db.get_db() as conn:
         cursor = conn.cursor()
         cursor.execute('SELECT id, name FROM assets')
         assets = cursor.fetchall()
@@ -578,17 +471,16 @@ def add_asset_evaluation():
                 flash('Ошибка: значения должны быть в диапазоне от 0 до 10!')
                 return redirect(url_for('add_asset_evaluation'))
             
-            cursor.execute('SELECT COUNT(*) FROM asset_evaluations WHERE asset_id = ? AND expert_id = ?', (asset_id, expert_id))
-            if cursor.fetchone()[0] > 0:
+            try:
+                cursor.execute('''
+                    INSERT INTO asset_evaluations (asset_id, expert_id, life_health, economy, ecology, dependency, social, international)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (asset_id, expert_id, life_health, economy, ecology, dependency, social, international))
+                conn.commit()
+            except sqlite3.IntegrityError:
                 flash('Ошибка: этот эксперт уже оценил данный актив!')
                 return redirect(url_for('add_asset_evaluation'))
             
-            cursor.execute('''
-                INSERT INTO asset_evaluations (asset_id, expert_id, life_health, economy, ecology, dependency, social, international)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (asset_id, expert_id, life_health, economy, ecology, dependency, social, international))
-            conn.commit()
-            
             update_asset_scores(asset_id)
             flash('Оценка актива успешно добавлена!')
             return redirect(url_for('list_asset_evaluations'))
@@ -598,7 +490,7 @@ def add_asset_evaluation():
 @app.route('/asset_evaluations/edit/<int:id>', methods=['GET', 'POST'])
 @expert_required
 def edit_asset_evaluation(id):
-    with sqlite3.connect('risk_assessment.db') as conn:
+    with db.get_db() as conn:
         cursor = conn.cursor()
         cursor.execute('''
             SELECT id, asset_id, expert_id, life_health, economy, ecology, dependency, social, international
@@ -646,19 +538,20 @@ def edit_asset_evaluation(id):
                 flash('Ошибка: значения должны быть в диапазоне от 0 до 10!')
                 return redirect(url_for('edit_asset_evaluation', id=id))
             
-            cursor.execute('SELECT COUNT(*) FROM asset_evaluations WHERE asset_id = ? AND expert_id = ? AND id != ?', (asset_id, expert_id, id))
-            if cursor.fetchone()[0] > 0:
+            try:
+                cursor.execute('''
+                    UPDATE asset_evaluations
+                    SET asset_id = ?, expert_id = ?, life_health = ?, economy = ?, ecology = ?, dependency = ?, social = ?, international = ?
+                    WHERE id = ?
+                ''', (asset_id, expert_id, life_health, economy, ecology, dependency, social, international, id))
+                conn.commit()
+            except sqlite3.IntegrityError:
                 flash('Ошибка: этот эксперт уже оценил данный актив!')
                 return redirect(url_for('edit_asset_evaluation', id=id))
             
-            cursor.execute('''
-                UPDATE asset_evaluations
-                SET asset_id = ?, expert_id = ?, life_health = ?, economy = ?, ecology = ?, dependency = ?, social = ?, international = ?
-                WHERE id = ?
-            ''', (asset_id, expert_id, life_health, economy, ecology, dependency, social, international, id))
-            conn.commit()
-            
             update_asset_scores(asset_id)
+            if evaluation[1] != asset_id:
+                update_asset_scores(evaluation[1])
             flash('Оценка актива успешно отредактирована!')
             return redirect(url_for('list_asset_evaluations'))
     
@@ -667,7 +560,7 @@ def edit_asset_evaluation(id):
 @app.route('/asset_evaluations/delete/<int:id>', methods=['POST'])
 @expert_required
 def delete_asset_evaluation(id):
-    with sqlite3.connect('risk_assessment.db') as conn:
+    with db.get_db() as conn:
         cursor = conn.cursor()
         cursor.execute('SELECT asset_id, expert_id FROM asset_evaluations WHERE id = ?', (id,))
         evaluation = cursor.fetchone()
@@ -688,38 +581,69 @@ def delete_asset_evaluation(id):
         flash('Оценка актива успешно удалена!')
     return redirect(url_for('list_asset_evaluations'))
 
+# Описание списка вероятностей угроз для постраничного вывода
+THREAT_PROBABILITY_LIST = {
+    'columns': 'tp.id, a.name, e.name, tp.probability',
+    'from': 'threat_probabilities tp JOIN assets a ON tp.asset_id = a.id JOIN experts e ON tp.expert_id = e.id',
+    'id': 'tp.id',
+    'sorts': {
+        'id': 'tp.id',
+        'asset': 'a.name',
+        'expert': 'e.name',
+        'probability': 'tp.probability',
+    },
+    'default_sort': 'id',
+    'filters': {
+        'asset': ('a.name >= ? AND a.name < ?', pagination.prefix_range),
+        'expert': ('tp.expert_id = ?', int),
+    },
+}
+
+@app.route('/import', methods=['GET', 'POST'])
+@admin_required
+def bulk_import_view():
+    result = None
+    if request.method == 'POST':
+        kind = request.form.get('kind')
+        upload = request.files.get('file')
+        if kind not in bulk_import.KINDS or not upload or not upload.filename:
+            flash('Ошибка: выберите тип данных и файл для импорта!')
+            return redirect(url_for('bulk_import_view'))
+        try:
+            text = upload.read().decode('utf-8-sig')
+            rows = bulk_import.parse(text, bulk_import.detect_format(upload.filename))
+        except ValueError as e:
+            flash(f'Ошибка: не удалось прочитать файл: {e}')
+            return redirect(url_for('bulk_import_view'))
+        with db.get_db() as conn:
+            result = bulk_import.import_rows(conn, kind, rows)
+            conn.commit()
+        flash(f"Импортировано записей: {result['inserted']}, затронуто активов: {result['assets']}, ошибок: {len(result['errors'])}")
+    return render_template('bulk_import.html', result=result)
+
 @app.route('/threat_probabilities')
 @expert_required
 def list_threat_probabilities():
-    with sqlite3.connect('risk_assessment.db') as conn:
+    with db.get_db() as conn:
         cursor = conn.cursor()
         if session.get('role') == 'admin':
-            cursor.execute('''
-                SELECT tp.id, a.name, e.name, tp.probability
-                FROM threat_probabilities tp
-                JOIN assets a ON tp.asset_id = a.id
-                JOIN experts e ON tp.expert_id = e.id
-            ''')
+            page = pagination.paginate(conn, THREAT_PROBABILITY_LIST, request.args)
+            cursor.execute('SELECT id, name FROM experts ORDER BY name')
+            experts = cursor.fetchall()
         else:
             # Эксперты видят только свои оценки
             expert_id = session.get('expert_id')
             if not expert_id:
                 flash('Ошибка: не найден ID эксперта для вашего аккаунта.')
                 return redirect(url_for('index'))
-            cursor.execute('''
-                SELECT tp.id, a.name, e.name, tp.probability
-                FROM threat_probabilities tp
-                JOIN assets a ON tp.asset_id = a.id
-                JOIN experts e ON tp.expert_id = e.id
-                WHERE tp.expert_id = ?
-            ''', (expert_id,))
-        probabilities = cursor.fetchall()
-    return render_template('threat_probabilities.html', probabilities=probabilities)
+            page = pagination.paginate(conn, THREAT_PROBABILITY_LIST, request.args, ['tp.expert_id = ?'], [expert_id])
+            experts = []
+    return render_template('threat_probabilities.html', probabilities=page['rows'], page=page, experts=experts)
 
 @app.route('/threat_probabilities/add', methods=['GET', 'POST'])
 @expert_required
 def add_threat_probability():
-    with sqlite3.connect('risk_assessment.db') as conn:
+    with db.get_db() as conn:
         cursor = conn.cursor()
         cursor.execute('SELECT id, name FROM assets')
         assets = cursor.fetchall()
@@ -751,17 +675,16 @@ def add_threat_probability():
                 flash('Ошибка: вероятность должна быть в диапазоне от 1 до 3!')
                 return redirect(url_for('add_threat_probability'))
             
-            cursor.execute('SELECT COUNT(*) FROM threat_probabilities WHERE asset_id = ? AND expert_id = ?', (asset_id, expert_id))
-            if cursor.fetchone()[0] > 0:
+            try:
+                cursor.execute('''
+                    INSERT INTO threat_probabilities (asset_id, expert_id, probability)
+                    VALUES (?, ?, ?)
+                ''', (asset_id, expert_id, probability))
+                conn.commit()
+            except sqlite3.IntegrityError:
                 flash('Ошибка: этот эксперт уже оценил вероятность угрозы для данного актива!')
                 return redirect(url_for('add_threat_probability'))
             
-            cursor.execute('''
-                INSERT INTO threat_probabilities (asset_id, expert_id, probability)
-                VALUES (?, ?, ?)
-            ''', (asset_id, expert_id, probability))
-            conn.commit()
-            
             update_threat_probability(asset_id)
             flash('Вероятность угрозы успешно добавлена!')
             return redirect(url_for('list_threat_probabilities'))
@@ -771,7 +694,7 @@ def add_threat_probability():
 @app.route('/threat_probabilities/edit/<int:id>', methods=['GET', 'POST'])
 @expert_required
 def edit_threat_probability(id):
-    with sqlite3.connect('risk_assessment.db') as conn:
+    with db.get_db() as conn:
         cursor = conn.cursor()
         cursor.execute('SELECT id, asset_id, expert_id, probability FROM threat_probabilities WHERE id = ?', (id,))
         probability = cursor.fetchone()
@@ -810,19 +733,20 @@ def edit_threat_probability(id):
                 flash('Ошибка: вероятность должна быть в диапазоне от 1 до 3!')
                 return redirect(url_for('edit_threat_probability', id=id))
             
-            cursor.execute('SELECT COUNT(*) FROM threat_probabilities WHERE asset_id = ? AND expert_id = ? AND id != ?', (asset_id, expert_id, id))
-            if cursor.fetchone()[0] > 0:
+            try:
+                cursor.execute('''
+                    UPDATE threat_probabilities
+                    SET asset_id = ?, expert_id = ?, probability = ?
+                    WHERE id = ?
+                ''', (asset_id, expert_id, new_probability, id))
+                conn.commit()
+            except sqlite3.IntegrityError:
                 flash('Ошибка: этот эксперт уже оценил вероятность угрозы для данного актива!')
                 return redirect(url_for('edit_threat_probability', id=id))
             
-            cursor.execute('''
-                UPDATE threat_probabilities
-                SET asset_id = ?, expert_id = ?, probability = ?
-                WHERE id = ?
-            ''', (asset_id, expert_id, new_probability, id))
-            conn.commit()
-            
             update_threat_probability(asset_id)
+            if probability[1] != asset_id:
+                update_threat_probability(probability[1])
             flash('Вероятность угрозы успешно отредактирована!')
             return redirect(url_for('list_threat_probabilities'))
     
@@ -831,7 +755,7 @@ def edit_threat_probability(id):
 @app.route('/threat_probabilities/delete/<int:id>', methods=['POST'])
 @expert_required
 def delete_threat_probability(id):
-    with sqlite3.connect('risk_assessment.db') as conn:
+    with db.get_db() as conn:
         cursor = conn.cursor()
         cursor.execute('SELECT asset_id, expert_id FROM threat_probabilities WHERE id = ?', (id,))
         probability = cursor.fetchone()
@@ -852,41 +776,165 @@ def delete_threat_probability(id):
         flash('Вероятность угрозы успешно удалена!')
     return redirect(url_for('list_threat_probabilities'))
 
+# Описание списка вероятностей по угрозам для постраничного вывода
+THREAT_SCOPED_PROBABILITY_LIST = {
+    'columns': 'atp.id, a.name, t.name, e.name, atp.probability',
+    'from': '''asset_threat_probabilities atp
+        JOIN assets a ON atp.asset_id = a.id
+        JOIN threats t ON atp.threat_id = t.id
+        JOIN experts e ON atp.expert_id = e.id''',
+    'id': 'atp.id',
+    'sorts': {
+        'id': 'atp.id',
+        'asset': 'a.name',
+        'threat': 't.name',
+        'expert': 'e.name',
+        'probability': 'atp.probability',
+    },
+    'default_sort': 'id',
+    'filters': {
+        'asset': ('a.name >= ? AND a.name < ?', pagination.prefix_range),
+        'threat': ('atp.threat_id = ?', int),
+        'expert': ('atp.expert_id = ?', int),
+    },
+}
+
+@app.route('/threat_probabilities/by_threat')
+@expert_required
+def list_threat_scoped_probabilities():
+    with db.get_db() as conn:
+        cursor = conn.cursor()
+        if session.get('role') == 'admin':
+            page = pagination.paginate(conn, THREAT_SCOPED_PROBABILITY_LIST, request.args)
+            cursor.execute('SELECT id, name FROM experts ORDER BY name')
+            experts = cursor.fetchall()
+        else:
+            # Эксперты видят только свои оценки
+            expert_id = session.get('expert_id')
+            if not expert_id:
+                flash('Ошибка: не найден ID эксперта для вашего аккаунта.')
+                return redirect(url_for('index'))
+            page = pagination.paginate(conn, THREAT_SCOPED_PROBABILITY_LIST, request.args, ['atp.expert_id = ?'], [expert_id])
+            experts = []
+        cursor.execute('SELECT id, name FROM threats ORDER BY name')
+        threats = cursor.fetchall()
+    return render_template('threat_scoped_probabilities.html', probabilities=page['rows'], page=page, experts=experts, threats=threats)
+
+# Добавление вероятности угрозы для актива; повторная оценка той же пары экспертом заменяет прежнюю
+@app.route('/threat_probabilities/by_threat/add', methods=['GET', 'POST'])
+@expert_required
+def add_threat_scoped_probability():
+    with db.get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT id, name FROM assets ORDER BY name')
+        assets = cursor.fetchall()
+        cursor.execute('SELECT id, name FROM threats ORDER BY name')
+        threats = cursor.fetchall()
+        if session.get('role') == 'admin':
+            cursor.execute('SELECT id, name FROM experts')
+            experts = cursor.fetchall()
+        else:
+            # Эксперты могут оценивать только от своего имени
+            if not session.get('expert_id'):
+                flash('Ошибка: не найден ID эксперта для вашего аккаунта.')
+                return redirect(url_for('index'))
+            cursor.execute('SELECT id, name FROM experts WHERE id = ?', (session.get('expert_id'),))
+            experts = cursor.fetchall()
+        
+        if request.method == 'POST':
+            asset_id = int(request.form['asset_id'])
+            threat_id = int(request.form['threat_id'])
+            expert_id = int(request.form['expert_id']) if session.get('role') == 'admin' else session.get('expert_id')
+            probability = float(request.form['probability'])
+            if probability < 1 or probability > 3:
+                flash('Ошибка: вероятность должна быть в диапазоне от 1 до 3!')
+                return redirect(url_for('add_threat_scoped_probability'))
+            
+            try:
+                cursor.execute('''
+                    INSERT INTO asset_threat_probabilities (asset_id, threat_id, expert_id, probability)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT (asset_id, threat_id, expert_id) DO UPDATE SET probability = excluded.probability
+                ''', (asset_id, threat_id, expert_id, probability))
+            except sqlite3.IntegrityError:
+                flash('Ошибка: актив, угроза или эксперт не найдены!')
+                return redirect(url_for('add_threat_scoped_probability'))
+            aggregation.refresh_threat_likelihoods(conn, [asset_id])
+            conn.commit()
+            flash('Вероятность угрозы для актива сохранена!')
+            return redirect(url_for('list_threat_scoped_probabilities'))
+    
+    return render_template('add_threat_scoped_probability.html', assets=assets, threats=threats, experts=experts)
+
+@app.route('/threat_probabilities/by_threat/delete/<int:id>', methods=['POST'])
+@expert_required
+def delete_threat_scoped_probability(id):
+    with db.get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT asset_id, expert_id FROM asset_threat_probabilities WHERE id = ?', (id,))
+        probability = cursor.fetchone()
+        if not probability:
+            flash('Вероятность угрозы не найдена!')
+            return redirect(url_for('list_threat_scoped_probabilities'))
+        
+        # Проверяем права доступа: эксперты могут удалять только свои оценки
+        if session.get('role') == 'expert' and probability[1] != session.get('expert_id'):
+            flash('У вас нет прав для удаления этой оценки!')
+            return redirect(url_for('list_threat_scoped_probabilities'))
+        
+        cursor.execute('DELETE FROM asset_threat_probabilities WHERE id = ?', (id,))
+        aggregation.refresh_threat_likelihoods(conn, [probability[0]])
+        conn.commit()
+        flash('Вероятность угрозы успешно удалена!')
+    return redirect(url_for('list_threat_scoped_probabilities'))
+
+# Описание списка анализа рисков для постраничного вывода
+RISK_ANALYSIS_LIST = {
+    'columns': 'ra.id, a.name, ao.name, t.name, v.name, v.category, tm.name, cm.name, ra.control_effectiveness, '
+               '(SELECT COUNT(*) FROM risk_controls rc WHERE rc.risk_id = ra.id AND rc.implemented = 1)',
+    'from': '''risk_analysis ra
+        JOIN assets a ON ra.asset_id = a.id
+        JOIN asset_owners ao ON ra.asset_owner_id = ao.id
+        JOIN threats t ON ra.threat_id = t.id
+        JOIN vulnerabilities v ON ra.vulnerability_id = v.id
+        JOIN taken_measures tm ON ra.taken_measure_id = tm.id
+        LEFT JOIN control_measures cm ON ra.control_measure_id = cm.id''',
+    'id': 'ra.id',
+    'sorts': {
+        'id': 'ra.id',
+        'asset': 'a.name',
+        'owner': 'ao.name',
+        'threat': 't.name',
+        'category': 'v.category',
+        'effectiveness': 'IFNULL(ra.control_effectiveness, 0)',
+    },
+    'default_sort': 'id',
+    'filters': {
+        'asset': ('a.name >= ? AND a.name < ?', pagination.prefix_range),
+        'owner': ('ra.asset_owner_id = ?', int),
+        'threat': ('ra.threat_id = ?', int),
+        'category': ('ra.vulnerability_id IN (SELECT id FROM vulnerabilities WHERE category = ?)', str),
+    },
+}
+
 @app.route('/risk_analysis')
 @admin_required
 def list_risk_analysis():
-    with sqlite3.connect('risk_assessment.db') as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT ra.id, a.name, ao.name, t.name, v.name, v.category, tm.name, cm.name, ra.control_effectiveness
-            FROM risk_analysis ra
-            JOIN assets a ON ra.asset_id = a.id
-            JOIN asset_owners ao ON ra.asset_owner_id = ao.id
-            JOIN threats t ON ra.threat_id = t.id
-            JOIN vulnerabilities v ON ra.vulnerability_id = v.id
-            JOIN taken_measures tm ON ra.taken_measure_id = tm.id
-            LEFT JOIN control_measures cm ON ra.control_measure_id = cm.id
-        ''')
-        risk_analyses = cursor.fetchall()
-    return render_template('risk_analysis.html', risk_analyses=risk_analyses)
+    with db.get_db() as conn:
+        page = pagination.paginate(conn, RISK_ANALYSIS_LIST, request.args)
+        refdata = reference_data.get(conn, app.config['DATABASE'])
+    asset_owners = sorted(refdata['catalogs']['asset_owners'], key=lambda row: row[1])
+    threats = sorted(refdata['catalogs']['threats'], key=lambda row: row[1])
+    return render_template('risk_analysis.html', risk_analyses=page['rows'], page=page,
+                           asset_owners=asset_owners, threats=threats, categories=reference_data.categories(refdata))
 
 @app.route('/risk_analysis/add', methods=['GET', 'POST'])
 @admin_required
 def add_risk_analysis():
-    with sqlite3.connect('risk_assessment.db') as conn:
+    with db.get_db() as conn:
         cursor = conn.cursor()
-        cursor.execute('SELECT id, name FROM assets')
-        assets = cursor.fetchall()
-        cursor.execute('SELECT id, name FROM asset_owners')
-        asset_owners = cursor.fetchall()
-        cursor.execute('SELECT id, name FROM threats')
-        threats = cursor.fetchall()
-        cursor.execute('SELECT id, name, category FROM vulnerabilities ORDER BY category, name')
-        vulnerabilities = cursor.fetchall()
-        cursor.execute('SELECT id, name FROM taken_measures')
-        taken_measures = cursor.fetchall()
-        cursor.execute('SELECT id, name FROM control_measures')
-        control_measures = cursor.fetchall()
+        # Справочники берутся из кэша процесса, а в форму загружаются из /reference_data.json
+        refdata = reference_data.get(conn, app.config['DATABASE'])
         
         if request.method == 'POST':
             asset_id = int(request.form['asset_id'])
@@ -898,8 +946,7 @@ def add_risk_analysis():
             control_effectiveness = request.form.get('control_effectiveness', None)
             
             if taken_measure_id:
-                cursor.execute('SELECT name FROM taken_measures WHERE id = ?', (taken_measure_id,))
-                taken_measure_name = cursor.fetchone()[0]
+                taken_measure_name = reference_data.name_of(refdata, 'taken_measures', taken_measure_id)
                 if taken_measure_name != "Минимизация рисков и выбор контролей":
                     control_measure_id = None
             if control_effectiveness:
@@ -916,35 +963,33 @@ def add_risk_analysis():
                 INSERT INTO risk_analysis (asset_id, asset_owner_id, threat_id, vulnerability_id, taken_measure_id, control_measure_id, control_effectiveness)
                 VALUES (?, ?, ?, ?, ?, ?, ?)
             ''', (asset_id, asset_owner_id, threat_id, vulnerability_id, taken_measure_id, control_measure_id, control_effectiveness))
+            # Выбранная мера становится первой мерой контроля записи; другие меры добавляются на странице мер записи
+            if control_measure_id:
+                controls.set_primary(conn, [(cursor.lastrowid, None)], int(control_measure_id), control_effectiveness)
+            risk_snapshot.refresh_assets(conn, [asset_id])
             conn.commit()
             
             flash('Запись анализа рисков успешно добавлена!')
             return redirect(url_for('list_risk_analysis'))
     
-    return render_template('add_risk_analysis.html', assets=assets, asset_owners=asset_owners, threats=threats, vulnerabilities=vulnerabilities, taken_measures=taken_measures, control_measures=control_measures)
+    return render_template('add_risk_analysis.html', reference_etag=refdata['etag'])
 
 @app.route('/risk_analysis/edit/<int:id>', methods=['GET', 'POST'])
 @admin_required
 def edit_risk_analysis(id):
-    with sqlite3.connect('risk_assessment.db') as conn:
+    with db.get_db() as conn:
         cursor = conn.cursor()
+        # В форме редактируется основная мера записи, поэтому эффективность — её собственная, а не совокупная
         cursor.execute('''
-            SELECT id, asset_id, asset_owner_id, threat_id, vulnerability_id, taken_measure_id, control_measure_id, control_effectiveness
-            FROM risk_analysis WHERE id = ?
+            SELECT ra.id, ra.asset_id, ra.asset_owner_id, ra.threat_id, ra.vulnerability_id, ra.taken_measure_id,
+                   ra.control_measure_id, IFNULL(rc.effectiveness, ra.control_effectiveness)
+            FROM risk_analysis ra
+            LEFT JOIN risk_controls rc ON rc.risk_id = ra.id AND rc.control_measure_id = ra.control_measure_id
+            WHERE ra.id = ?
         ''', (id,))
         risk_analysis = cursor.fetchone()
-        cursor.execute('SELECT id, name FROM assets')
-        assets = cursor.fetchall()
-        cursor.execute('SELECT id, name FROM asset_owners')
-        asset_owners = cursor.fetchall()
-        cursor.execute('SELECT id, name FROM threats')
-        threats = cursor.fetchall()
-        cursor.execute('SELECT id, name, category FROM vulnerabilities ORDER BY category, name')
-        vulnerabilities = cursor.fetchall()
-        cursor.execute('SELECT id, name FROM taken_measures')
-        taken_measures = cursor.fetchall()
-        cursor.execute('SELECT id, name FROM control_measures')
-        control_measures = cursor.fetchall()
+        # Справочники берутся из кэша процесса, а в форму загружаются из /reference_data.json
+        refdata = reference_data.get(conn, app.config['DATABASE'])
         
         if not risk_analysis:
             flash('Запись анализа рисков не найдена!')
@@ -960,8 +1005,7 @@ def edit_risk_analysis(id):
             control_effectiveness = request.form.get('control_effectiveness', None)
             
             if taken_measure_id:
-                cursor.execute('SELECT name FROM taken_measures WHERE id = ?', (taken_measure_id,))
-                taken_measure_name = cursor.fetchone()[0]
+                taken_measure_name = reference_data.name_of(refdata, 'taken_measures', taken_measure_id)
                 if taken_measure_name != "Минимизация рисков и выбор контролей":
                     control_measure_id = None
             if control_effectiveness:
@@ -979,29 +1023,112 @@ def edit_risk_analysis(id):
                 SET asset_id = ?, asset_owner_id = ?, threat_id = ?, vulnerability_id = ?, taken_measure_id = ?, control_measure_id = ?, control_effectiveness = ?
                 WHERE id = ?
             ''', (asset_id, asset_owner_id, threat_id, vulnerability_id, taken_measure_id, control_measure_id, control_effectiveness, id))
+            # Меры контроля записи сохраняются только при «Минимизации рисков и выборе контролей»
+            if reference_data.name_of(refdata, 'taken_measures', taken_measure_id) == "Минимизация рисков и выбор контролей":
+                controls.set_primary(conn, [(id, risk_analysis[6])], int(control_measure_id) if control_measure_id else None,
+                                     control_effectiveness)
+            else:
+                controls.clear_controls(conn, [id])
+            # Пересчитываем снимок и для прежнего актива, если запись перенесена на другой актив
+            risk_snapshot.refresh_assets(conn, [risk_analysis[1], asset_id])
             conn.commit()
             
             flash('Запись анализа рисков успешно отредактирована!')
             return redirect(url_for('list_risk_analysis'))
     
-    return render_template('edit_risk_analysis.html', risk_analysis=risk_analysis, assets=assets, asset_owners=asset_owners, threats=threats, vulnerabilities=vulnerabilities, taken_measures=taken_measures, control_measures=control_measures)
+    return render_template('edit_risk_analysis.html', risk_analysis=risk_analysis, reference_etag=refdata['etag'])
+
+# Справочники для форм анализа рисков. Ответ с параметром v, совпадающим с текущим ETag,
+# кэшируется браузером без повторных запросов; без него — проверяется по ETag (304 Not Modified)
+@app.route('/reference_data.json')
+@login_required
+def reference_data_json():
+    with db.get_db() as conn:
+        refdata = reference_data.get(conn, app.config['DATABASE'])
+    response = app.response_class(refdata['payload'], mimetype='application/json')
+    response.set_etag(refdata['etag'])
+    if request.args.get('v') == refdata['etag']:
+        response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+    else:
+        response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
 
 @app.route('/risk_analysis/delete/<int:id>', methods=['POST'])
 @admin_required
 def delete_risk_analysis(id):
-    with sqlite3.connect('risk_assessment.db') as conn:
+    with db.get_db() as conn:
         cursor = conn.cursor()
-        cursor.execute('SELECT id FROM risk_analysis WHERE id = ?', (id,))
+        cursor.execute('SELECT id, asset_id FROM risk_analysis WHERE id = ?', (id,))
         risk_analysis = cursor.fetchone()
         if not risk_analysis:
             flash('Запись анализа рисков не найдена!')
             return redirect(url_for('list_risk_analysis'))
         
+        controls.clear_controls(conn, [id])
         cursor.execute('DELETE FROM risk_analysis WHERE id = ?', (id,))
+        risk_snapshot.refresh_assets(conn, [risk_analysis[1]])
         conn.commit()
         flash('Запись анализа рисков успешно удалена!')
     return redirect(url_for('list_risk_analysis'))
 
+# Меры контроля записи анализа рисков: совокупная эффективность 1 − Π(1 − eᵢ) (controls.py)
+@app.route('/risk_analysis/<int:id>/controls', methods=['GET', 'POST'])
+@admin_required
+def risk_analysis_controls(id):
+    with db.get_db() as conn:
+        risk_analysis = conn.execute('''
+            SELECT ra.id, a.name, t.name, v.name, tm.name, ra.control_measure_id, ra.control_effectiveness
+            FROM risk_analysis ra
+            LEFT JOIN assets a ON ra.asset_id = a.id
+            LEFT JOIN threats t ON ra.threat_id = t.id
+            LEFT JOIN vulnerabilities v ON ra.vulnerability_id = v.id
+            LEFT JOIN taken_measures tm ON ra.taken_measure_id = tm.id
+            WHERE ra.id = ?
+        ''', (id,)).fetchone()
+        if not risk_analysis:
+            flash('Запись анализа рисков не найдена!')
+            return redirect(url_for('list_risk_analysis'))
+        refdata = reference_data.get(conn, app.config['DATABASE'])
+
+        if request.method == 'POST':
+            if risk_analysis[4] != "Минимизация рисков и выбор контролей":
+                flash('Ошибка: меры контроля выбираются только для принятой меры «Минимизация рисков и выбор контролей»!')
+                return redirect(url_for('risk_analysis_controls', id=id))
+            try:
+                control_measure_id = int(request.form['control_measure_id'])
+                effectiveness = float(request.form['effectiveness'])
+            except (KeyError, ValueError):
+                flash('Ошибка: выберите меру контроля и укажите эффективность числом!')
+                return redirect(url_for('risk_analysis_controls', id=id))
+            if not (0 <= effectiveness <= 1):
+                flash('Ошибка: эффективность меры должна быть в диапазоне от 0 до 1!')
+                return redirect(url_for('risk_analysis_controls', id=id))
+            if reference_data.name_of(refdata, 'control_measures', control_measure_id) is None:
+                flash('Мера контроля не найдена!')
+                return redirect(url_for('risk_analysis_controls', id=id))
+            implemented = request.form.get('proposed') != '1'
+            risk_snapshot.refresh_assets(conn, controls.set_control(conn, id, control_measure_id, effectiveness, implemented))
+            conn.commit()
+            flash('Мера контроля записи сохранена!')
+            return redirect(url_for('risk_analysis_controls', id=id))
+
+        measures = controls.risk_controls(conn, id)
+    return render_template('risk_analysis_controls.html', risk_analysis=risk_analysis, measures=measures,
+                           control_measures=refdata['catalogs']['control_measures'])
+
+@app.route('/risk_analysis/<int:id>/controls/delete/<int:control_measure_id>', methods=['POST'])
+@admin_required
+def delete_risk_analysis_control(id, control_measure_id):
+    with db.get_db() as conn:
+        asset_ids = controls.remove_control(conn, id, control_measure_id)
+        if asset_ids is None:
+            flash('Мера контроля записи не найдена!')
+        else:
+            risk_snapshot.refresh_assets(conn, asset_ids)
+            conn.commit()
+            flash('Мера контроля записи удалена!')
+    return redirect(url_for('risk_analysis_controls', id=id))
+
 @app.route('/update_risk_analysis/<int:asset_id>', methods=['POST'])
 @admin_required
 def update_risk_analysis(asset_id):
@@ -1010,13 +1137,15 @@ def update_risk_analysis(asset_id):
     control_measure_id = data.get('control_measure_id')
     control_effectiveness = data.get('control_effectiveness')
     
-    with sqlite3.connect('risk_assessment.db') as conn:
+    with db.get_db() as conn:
         cursor = conn.cursor()
+        minimization = False
         if taken_measure_id:
             cursor.execute('SELECT name FROM taken_measures WHERE id = ?', (taken_measure_id,))
             taken_measure_name = cursor.fetchone()
             if taken_measure_name and taken_measure_name[0] != "Минимизация рисков и выбор контролей":
                 control_measure_id = None
+            minimization = bool(taken_measure_name) and taken_measure_name[0] == "Минимизация рисков и выбор контролей"
         if control_effectiveness:
             try:
                 control_effectiveness = float(control_effectiveness)
@@ -1025,19 +1154,120 @@ def update_risk_analysis(asset_id):
             except (ValueError, TypeError):
                 return jsonify({'success': False, 'error': 'Эффективность защиты должна быть числом!'})
     
+        rows = cursor.execute('SELECT id, control_measure_id FROM risk_analysis WHERE asset_id = ?', (asset_id,)).fetchall()
         cursor.execute('''
             UPDATE risk_analysis
             SET taken_measure_id = ?, control_measure_id = ?, control_effectiveness = ?
             WHERE asset_id = ?
         ''', (taken_measure_id, control_measure_id, control_effectiveness, asset_id))
+        # Основная мера заменяется во всех записях актива одним пакетом; остальные меры записей сохраняются
+        if minimization:
+            controls.set_primary(conn, rows, int(control_measure_id) if control_measure_id else None, control_effectiveness)
+        else:
+            controls.clear_controls(conn, [row[0] for row in rows])
+        risk_snapshot.refresh_assets(conn, [asset_id])
         conn.commit()
     
     return jsonify({'success': True})
 
+# Постановка тепловой карты на отрисовку; возвращает статус ('ready', 'pending', 'error') и имя файла
+def _request_heatmap(ranked_risks):
+    names = [asset[0] for asset in ranked_risks]
+    impacts = [asset[2] for asset in ranked_risks]
+    residual_risks = [asset[5] for asset in ranked_risks]
+    status, filename = heatmap.request_heatmap(app.static_folder, names, impacts, residual_risks,
+                                               app.config['HEATMAP_CACHE_SIZE'], app.config['HEATMAP_RENDER_WORKERS'],
+                                               app.config['HEATMAP_BACKEND'])
+    return status, filename
+
+# Эксперты, доступные пользователю на странице AHP, и выбранный эксперт (None, если экспертов нет)
+def _ahp_experts(conn):
+    if session.get('role') == 'admin':
+        experts = conn.execute('SELECT id, name FROM experts ORDER BY name').fetchall()
+        expert_id = request.values.get('expert_id', type=int)
+        if expert_id not in {expert[0] for expert in experts}:
+            expert_id = experts[0][0] if experts else None
+        return experts, expert_id
+    experts = conn.execute('SELECT id, name FROM experts WHERE id = ?', (session.get('expert_id'),)).fetchall()
+    return experts, experts[0][0] if experts else None
+
+@app.route('/ahp', methods=['GET', 'POST'])
+@expert_required
+def ahp_view():
+    with db.get_db() as conn:
+        experts, expert_id = _ahp_experts(conn)
+        if expert_id is None:
+            flash('Ошибка: не найден эксперт для заполнения матрицы сравнений.')
+            return redirect(url_for('index'))
+        if request.method == 'POST':
+            judgments = [request.form.get(f'pair_{i}_{j}') for i, j in ahp.PAIRS]
+            try:
+                _, _, consistency_ratio = ahp.save_comparison(conn, expert_id, judgments)
+            except ValueError as e:
+                flash(f'Ошибка: {e}!')
+                return redirect(url_for('ahp_view', expert_id=expert_id))
+            conn.commit()
+            if consistency_ratio > ahp.CONSISTENCY_THRESHOLD:
+                flash(f'Матрица сохранена, но несогласованна: CR = {consistency_ratio:.3f} > {ahp.CONSISTENCY_THRESHOLD}. Пересмотрите сравнения.')
+            else:
+                flash(f'Матрица сохранена, CR = {consistency_ratio:.3f}.')
+            return redirect(url_for('ahp_view', expert_id=expert_id))
+        judgments = ahp.load_judgments(conn, expert_id)
+        summary = ahp.load_summary(conn, None if session.get('role') == 'admin' else expert_id)
+    return render_template('ahp.html', experts=experts, expert_id=expert_id, judgments=judgments, summary=summary,
+                           pairs=ahp.PAIRS, criteria=risk_engine.CRITERIA, labels=ahp.CRITERIA_LABELS,
+                           scale=ahp.SCALE, threshold=ahp.CONSISTENCY_THRESHOLD)
+
+@app.route('/ahp.json')
+@expert_required
+def ahp_json():
+    with db.get_db() as conn:
+        expert_id = None if session.get('role') == 'admin' else session.get('expert_id')
+        return jsonify(ahp.load_summary(conn, expert_id))
+
+@app.route('/ahp/delete/<int:expert_id>', methods=['POST'])
+@admin_required
+def delete_ahp_comparison(expert_id):
+    with db.get_db() as conn:
+        if ahp.delete_comparison(conn, expert_id):
+            conn.commit()
+            flash('Матрица сравнений удалена, групповые веса пересчитаны!')
+        else:
+            flash('Матрица сравнений не найдена!')
+    return redirect(url_for('ahp_view'))
+
+@app.route('/ahp/weight_sets/<int:id>/activate', methods=['POST'])
+@admin_required
+def activate_weight_set(id):
+    with db.get_db() as conn:
+        start = time.perf_counter()
+        if ahp.activate(conn, id):
+            conn.commit()
+            flash(f'Набор весов активирован, риски всех активов пересчитаны за {time.perf_counter() - start:.2f} с.')
+        else:
+            flash('Набор весов не найден!')
+    return redirect(url_for('ahp_view'))
+
+# Записи анализа рисков на странице критичности (порядок по id записи)
+CRITICALITY_RISK_LIST = {
+    'columns': 'ra.id, a.id, a.name, ao.name, t.name, v.name, v.category, tm.name, cm.name, ra.control_effectiveness, ra.threat_id',
+    'from': '''risk_analysis ra
+        JOIN assets a ON ra.asset_id = a.id
+        JOIN asset_owners ao ON ra.asset_owner_id = ao.id
+        JOIN threats t ON ra.threat_id = t.id
+        JOIN vulnerabilities v ON ra.vulnerability_id = v.id
+        JOIN taken_measures tm ON ra.taken_measure_id = tm.id
+        LEFT JOIN control_measures cm ON ra.control_measure_id = cm.id''',
+    'id': 'ra.id',
+    'sorts': {'id': 'ra.id'},
+    'default_sort': 'id',
+    'filters': {},
+}
+
 @app.route('/criticality')
 @login_required
 def criticality():
-    with sqlite3.connect('risk_assessment.db') as conn:
+    with db.get_db() as conn:
         cursor = conn.cursor()
         cursor.execute('SELECT life_health, economy, ecology, dependency, social, international FROM criteria_weights')
         weights = cursor.fetchone()
@@ -1045,85 +1275,681 @@ def criticality():
             flash('Ошибка: веса критериев не заданы!')
             return redirect(url_for('list_assets'))
         
-        cursor.execute('SELECT id, name, life_health, economy, ecology, dependency, social, international, threat_probability FROM assets')
-        assets = cursor.fetchall()
+        cursor.execute('SELECT name FROM weight_sets WHERE active = 1')
+        weight_set = cursor.fetchone()
         
-        risks_data = []
-        for asset in assets:
-            asset_id, name, *scores, threat_probability = asset
-            if any(score is None for score in scores) or threat_probability is None:
-                continue
-            criticality = sum(score * weight for score, weight in zip(scores, weights))
-            impact = 1 + (criticality / 10) * 2
-            # Получаем эффективность защиты для данного актива
-            cursor.execute('SELECT control_effectiveness FROM risk_analysis WHERE asset_id = ?', (asset_id,))
-            control_effectiveness = cursor.fetchone()
-            control_effectiveness = control_effectiveness[0] if control_effectiveness and control_effectiveness[0] is not None else 0
-            risk_score, residual_risk, risk_level, risk_interpretation = calculate_risk(impact, threat_probability, control_effectiveness)
-            risks_data.append((name, round(criticality, 2), round(impact, 2), round(threat_probability, 2), round(risk_score, 2), round(residual_risk, 2), risk_level, risk_interpretation))
+        # Ранжированные риски читаются из материализованного снимка asset_risk
+        ranked_risks = risk_snapshot.ranked_rows(conn)
         
-        risks_data.sort(key=lambda x: x[1], reverse=True)
-        ranked_risks = [(name, criticality, impact, prob, risk_score, residual_risk, risk_level, risk_interpretation, i + 1) for i, (name, criticality, impact, prob, risk_score, residual_risk, risk_level, risk_interpretation) in enumerate(risks_data)]
-        
-        # Получение данных анализа рисков
-        cursor.execute('''
-            SELECT ra.id, a.id, a.name, ao.name, t.name, v.name, v.category, ra.taken_measure_id, ra.control_measure_id, ra.control_effectiveness
-            FROM risk_analysis ra
-            JOIN assets a ON ra.asset_id = a.id
-            JOIN asset_owners ao ON ra.asset_owner_id = ao.id
-            JOIN threats t ON ra.threat_id = t.id
-            JOIN vulnerabilities v ON ra.vulnerability_id = v.id
-            JOIN taken_measures tm ON ra.taken_measure_id = tm.id
-            LEFT JOIN control_measures cm ON ra.control_measure_id = cm.id
-        ''')
-        risk_analyses = cursor.fetchall()
+        # Таблица анализа рисков выводится постранично; риски считаются только для записей страницы
+        # (вероятность угрозы для актива и своя эффективность защиты), строки и риски — из одного чтения
+        page = pagination.paginate(conn, CRITICALITY_RISK_LIST, request.args)
+        scenarios = risk_scenarios.compute_rows(conn, [(row[0], row[1], row[10], row[9]) for row in page['rows']], weights)
         risk_analysis_data = []
-        for idx, ra in enumerate(risk_analyses, 1):
-            ra_id, asset_id, asset_name, asset_owner, threat, vulnerability, vuln_category, taken_measure_id, control_measure_id, control_effectiveness = ra
-            # Получаем текстовые значения для taken_measure и control_measure
-            cursor.execute('SELECT name FROM taken_measures WHERE id = ?', (taken_measure_id,))
-            taken_measure_name = cursor.fetchone()[0]
-            control_measure_name = None
-            if control_measure_id:
-                cursor.execute('SELECT name FROM control_measures WHERE id = ?', (control_measure_id,))
-                control_measure_name = cursor.fetchone()[0]
-            # Найти соответствующий риск для актива
-            for risk in ranked_risks:
-                if risk[0] == asset_name:
-                    impact = risk[2]
-                    likelihood = risk[3]
-                    risk_score = risk[4]
-                    residual_risk = risk[5]
-                    # Объединяем название уязвимости и категорию
-                    vulnerability_display = f"{vuln_category}: {vulnerability}"
-                    risk_analysis_data.append((asset_id, idx, asset_name, asset_owner, threat, vulnerability_display, impact, likelihood, risk_score, taken_measure_name, control_measure_name, control_effectiveness or 0, residual_risk))
-                    break
+        for i, ra in enumerate(page['rows']):
+            risk_id, asset_id, asset_name, asset_owner, threat, vulnerability, vuln_category, taken_measure_name, control_measure_name, control_effectiveness, _ = ra
+            if not scenarios['valid'][i]:
+                continue
+            # Объединяем название уязвимости и категорию
+            vulnerability_display = f"{vuln_category}: {vulnerability}"
+            risk_analysis_data.append((asset_id, risk_id, asset_name, asset_owner, threat, vulnerability_display,
+                                       round(float(scenarios['impact'][i]), 2), round(float(scenarios['probability'][i]), 2),
+                                       round(float(scenarios['risk_score'][i]), 2), taken_measure_name, control_measure_name,
+                                       control_effectiveness or 0, round(float(scenarios['residual_risk'][i]), 2),
+                                       bool(scenarios['scoped'][i])))
         
-        # Генерация тепловой карты на основе остаточных рисков
+        # Тепловая карта отрисовывается в фоне; страница показывает заглушку, пока файл не готов
         if ranked_risks:
-            names = [asset[0] for asset in ranked_risks]
-            impacts = [asset[2] for asset in ranked_risks]
-            residual_risks = [asset[5] for asset in ranked_risks]
-            data = np.array([impacts, residual_risks]).T
-            filename = f"heatmap_{uuid.uuid4()}.png"
-            
-            # Определяем кастомную цветовую палитру для тепловой карты
-            colors = ['#4CAF50', '#FFC107', '#F44336']  # Зелёный, Жёлтый, Красный
-            boundaries = [1.0, 3.9, 6.9, 9.0]  # Границы для Низкий (1.0–3.9), Средний (4.0–6.9), Высокий (7.0–9.0)
-            cmap = ListedColormap(colors)
-            norm = BoundaryNorm(boundaries, cmap.N, clip=True)
-            
-            plt.figure(figsize=(8, 4))
-            sns.heatmap(data, xticklabels=['Impact', 'Остаточный риск'], yticklabels=names, annot=True, cmap=cmap, norm=norm, cbar=False)
-            plt.title("Тепловая карта остаточных рисков")
-            plt.tight_layout()
-            plt.savefig(os.path.join("static", filename))
-            plt.close()
+            status, filename = _request_heatmap(ranked_risks)
+            if status != 'ready':
+                filename = None
         else:
             filename = None
             flash('Нет данных для расчёта рисков! Убедитесь, что для активов заданы оценки и вероятности угроз.')
     
-    return render_template('criticality.html', ranked_risks=ranked_risks, weights=weights, heatmap=filename, risk_analysis_data=risk_analysis_data)
+    return render_template('criticality.html', ranked_risks=ranked_risks, weights=weights, weight_set=weight_set[0] if weight_set else None,
+                           heatmap=filename, risk_analysis_data=risk_analysis_data, page=page)
+
+@app.route('/criticality/heatmap')
+@login_required
+def criticality_heatmap():
+    with db.get_db() as conn:
+        ranked_risks = risk_snapshot.ranked_rows(conn)
+    if not ranked_risks:
+        return jsonify({'status': 'empty'}), 404
+    status, filename = _request_heatmap(ranked_risks)
+    if status == 'pending':
+        return jsonify({'status': 'pending'}), 202
+    if status == 'error':
+        return jsonify({'status': 'error', 'error': 'Не удалось построить тепловую карту'}), 500
+    return jsonify({'status': 'ready', 'url': url_for('static', filename=filename)})
+
+# Риски всех сценариев (актив, угроза, уязвимость) и top наибольших по остаточному риску;
+# None, если веса критериев не заданы
+def run_risk_scenarios(conn, top, asset_id=None, threat_id=None):
+    weights = conn.execute('SELECT life_health, economy, ecology, dependency, social, international FROM criteria_weights').fetchone()
+    if not weights:
+        return None
+    start = time.perf_counter()
+    result = risk_scenarios.compute(risk_scenarios.load(conn), risk_engine.load_register(conn), weights)
+    rows = risk_scenarios.result_rows(conn, result, risk_scenarios.top_indices(result, top, asset_id, threat_id))
+    summary = risk_scenarios.summary(result)
+    summary['seconds'] = round(time.perf_counter() - start, 4)
+    return {'summary': summary, 'top': rows}
+
+@app.route('/risk_scenarios.json')
+@login_required
+def risk_scenarios_json():
+    top = max(1, min(request.args.get('top', risk_scenarios.DEFAULT_TOP, type=int), risk_scenarios.MAX_TOP))
+    with db.get_db() as conn:
+        result = run_risk_scenarios(conn, top, request.args.get('asset_id', type=int), request.args.get('threat_id', type=int))
+    if result is None:
+        return jsonify({'error': 'Веса критериев не заданы'}), 409
+    return jsonify(result)
+
+# Моделирование Монте-Карло по разбросу оценок экспертов. Без параметра seed зерно выбирается случайно
+# и возвращается вместе с результатом, чтобы отчёт можно было воспроизвести.
+def run_simulation(args):
+    try:
+        draws = int(args.get('draws', simulation.DEFAULT_DRAWS))
+    except (TypeError, ValueError):
+        draws = simulation.DEFAULT_DRAWS
+    draws = max(1, min(draws, simulation.MAX_DRAWS))
+    try:
+        seed = int(args['seed'])
+    except (KeyError, TypeError, ValueError):
+        seed = secrets.randbelow(2 ** 31)
+    with db.get_db() as conn:
+        weights = conn.execute('SELECT life_health, economy, ecology, dependency, social, international FROM criteria_weights').fetchone()
+        if not weights:
+            return None
+        inputs = simulation.load_inputs(conn, weights)
+        residual_risks = dict(conn.execute('SELECT asset_id, residual_risk FROM asset_risk'))
+    start = time.perf_counter()
+    rows = simulation.result_rows(simulation.simulate(inputs, draws, seed))
+    elapsed = time.perf_counter() - start
+    for row in rows:
+        residual_risk = residual_risks.get(row['asset_id'])
+        row['residual_risk'] = round(residual_risk, 4) if residual_risk is not None else None
+    return {'draws': draws, 'seed': seed, 'seconds': round(elapsed, 4), 'assets': rows}
+
+@app.route('/simulation')
+@login_required
+def simulation_view():
+    result = run_simulation(request.args)
+    if result is None:
+        flash('Ошибка: веса критериев не заданы!')
+        return redirect(url_for('list_assets'))
+    return render_template('simulation.html', result=result, percentiles=simulation.PERCENTILES, max_draws=simulation.MAX_DRAWS)
+
+@app.route('/simulation.json')
+@login_required
+def simulation_json():
+    result = run_simulation(request.args)
+    if result is None:
+        return jsonify({'error': 'Веса критериев не заданы'}), 409
+    return jsonify(result)
+
+# Анализ чувствительности рейтинга к весам критериев с параметрами из строки запроса; None, если веса не заданы
+def run_sensitivity(args):
+    def number(name, cast, default, low, high):
+        try:
+            value = cast(args.get(name, default))
+        except (TypeError, ValueError):
+            value = default
+        return max(low, min(value, high))
+
+    samples = number('samples', int, sensitivity.DEFAULT_SAMPLES, 1, sensitivity.MAX_SAMPLES)
+    concentration = number('concentration', float, sensitivity.DEFAULT_CONCENTRATION, 1.0, 100000.0)
+    top = number('top', int, sensitivity.DEFAULT_TOP, 1, 1000)
+    try:
+        seed = int(args['seed'])
+    except (KeyError, TypeError, ValueError):
+        seed = secrets.randbelow(2 ** 31)
+    with db.get_db() as conn:
+        weights = conn.execute('SELECT life_health, economy, ecology, dependency, social, international FROM criteria_weights').fetchone()
+        if not weights:
+            return None
+        register = risk_engine.load_register(conn)
+    start = time.perf_counter()
+    result = sensitivity.result_rows(sensitivity.analyze(register, weights, samples, concentration, top, seed), top)
+    result.update({'samples': samples, 'concentration': concentration, 'seed': seed,
+                   'seconds': round(time.perf_counter() - start, 4)})
+    return result
+
+@app.route('/sensitivity')
+@login_required
+def sensitivity_view():
+    result = run_sensitivity(request.args)
+    if result is None:
+        flash('Ошибка: веса критериев не заданы!')
+        return redirect(url_for('list_assets'))
+    return render_template('sensitivity.html', result=result, max_samples=sensitivity.MAX_SAMPLES)
+
+@app.route('/sensitivity.json')
+@login_required
+def sensitivity_json():
+    result = run_sensitivity(request.args)
+    if result is None:
+        return jsonify({'error': 'Веса критериев не заданы'}), 409
+    return jsonify(result)
+
+# Сводка остаточного риска по измерению by с отбором по параметрам запроса; None, если веса не заданы
+def run_rollups(args):
+    by = args.get('by', rollups.DEFAULT_DIMENSION)
+    if by not in rollups.DIMENSIONS:
+        by = rollups.DEFAULT_DIMENSION
+    start = time.perf_counter()
+    with db.get_db() as conn:
+        entry = rollups.get(conn, app.config['DATABASE'])
+    if entry is None:
+        return None
+    filters = rollups.parse_filters(entry['cube'], args)
+    result = rollups.rollup(entry['cube'], by, filters)
+    result.update({'by': by, 'filters': rollups.describe_filters(entry['cube'], filters),
+                   'version': entry['version'][0], 'build_seconds': round(entry['seconds'], 4),
+                   'seconds': round(time.perf_counter() - start, 4)})
+    return result
+
+@app.route('/rollups')
+@login_required
+def rollups_view():
+    result = run_rollups(request.args)
+    if result is None:
+        flash('Ошибка: веса критериев не заданы!')
+        return redirect(url_for('list_assets'))
+    query = {rollups.DIMENSIONS[item['dimension']][2]: request.args[rollups.DIMENSIONS[item['dimension']][2]]
+             for item in result['filters']}
+
+    # Ссылка на сводку по измерению by с текущим отбором; dimension и key добавляют отбор (key=None — снимают)
+    def rollup_url(by, dimension=None, key=None):
+        params = dict(query)
+        if dimension is not None:
+            params.pop(rollups.DIMENSIONS[dimension][2], None)
+            if key is not None:
+                params[rollups.DIMENSIONS[dimension][2]] = key
+        return url_for('rollups_view', by=by, **params)
+
+    return render_template('rollups.html', result=result, dimensions=rollups.DIMENSIONS, query=query,
+                           rollup_url=rollup_url, bins=rollups.HISTOGRAM_BINS)
+
+@app.route('/rollups.json')
+@login_required
+def rollups_json():
+    result = run_rollups(request.args)
+    if result is None:
+        return jsonify({'error': 'Веса критериев не заданы'}), 409
+    return jsonify(result)
+
+# Расчёт сценария «что если» по текущим данным без записи в базу; None, если веса критериев не заданы
+def run_scenario(conn, spec):
+    state = scenario.load_state(conn)
+    if state is None:
+        return None
+    overrides, weights = scenario.parse(state, spec)
+    start = time.perf_counter()
+    result = scenario.result_rows(scenario.run(state, overrides, weights))
+    result['summary']['seconds'] = round(time.perf_counter() - start, 4)
+    return result
+
+@app.route('/scenario.json', methods=['POST'])
+@admin_required
+def scenario_json():
+    spec = request.get_json(silent=True)
+    with db.get_db() as conn:
+        try:
+            result = run_scenario(conn, spec)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+    if result is None:
+        return jsonify({'error': 'Веса критериев не заданы'}), 409
+    return jsonify(result)
+
+# Подбор мер контроля в пределах бюджета (budget, method из args); None, если веса критериев не заданы.
+# ValueError — при некорректном бюджете или методе.
+def run_portfolio(conn, args):
+    try:
+        budget = float(args.get('budget', 0))
+    except (TypeError, ValueError):
+        raise ValueError('Бюджет должен быть числом')
+    start = time.perf_counter()
+    problem = portfolio.load(conn)
+    if problem is None:
+        return None
+    loaded = time.perf_counter()
+    selection, method, optimal = portfolio.optimize(problem, budget, args.get('method', 'auto'))
+    result = portfolio.result_rows(problem, selection, budget, method, optimal)
+    result['summary']['load_seconds'] = round(loaded - start, 4)
+    result['summary']['seconds'] = round(time.perf_counter() - loaded, 4)
+    return result
+
+# Подбор мер контроля: стоимость мер, расчёт по бюджету и внедрение выбранных мер
+@app.route('/portfolio')
+@admin_required
+def portfolio_view():
+    result = None
+    with db.get_db() as conn:
+        if request.args.get('budget'):
+            try:
+                result = run_portfolio(conn, request.args)
+            except ValueError as e:
+                flash(f'Ошибка: {e}!')
+            else:
+                if result is None:
+                    flash('Ошибка: веса критериев не заданы!')
+        control_measures = conn.execute('''
+            SELECT cm.id, cm.name, cm.cost,
+                   (SELECT COUNT(*) FROM risk_controls rc WHERE rc.control_measure_id = cm.id AND rc.implemented = 0)
+            FROM control_measures cm
+            ORDER BY cm.id
+        ''').fetchall()
+    return render_template('portfolio.html', result=result, control_measures=control_measures, methods=portfolio.METHODS,
+                           exact_limit=portfolio.EXACT_LIMIT, budget=request.args.get('budget', ''), method=request.args.get('method', 'auto'))
+
+@app.route('/portfolio.json')
+@admin_required
+def portfolio_json():
+    with db.get_db() as conn:
+        try:
+            result = run_portfolio(conn, request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+    if result is None:
+        return jsonify({'error': 'Веса критериев не заданы'}), 409
+    return jsonify(result)
+
+@app.route('/portfolio/costs', methods=['POST'])
+@admin_required
+def portfolio_costs():
+    with db.get_db() as conn:
+        costs = []
+        for (control_measure_id,) in conn.execute('SELECT id FROM control_measures').fetchall():
+            value = request.form.get(f'cost_{control_measure_id}', '').strip()
+            if not value:
+                costs.append((None, control_measure_id))
+                continue
+            try:
+                cost = float(value)
+            except ValueError:
+                cost = -1
+            if not cost >= 0:
+                flash('Ошибка: стоимость меры должна быть неотрицательным числом!')
+                return redirect(url_for('portfolio_view'))
+            costs.append((cost, control_measure_id))
+        conn.executemany('UPDATE control_measures SET cost = ? WHERE id = ? AND cost IS NOT ?',
+                         [(cost, control_measure_id, cost) for cost, control_measure_id in costs])
+        conn.commit()
+    flash('Стоимость мер контроля сохранена!')
+    return redirect(url_for('portfolio_view'))
+
+@app.route('/portfolio/apply', methods=['POST'])
+@admin_required
+def portfolio_apply():
+    with db.get_db() as conn:
+        try:
+            result = run_portfolio(conn, request.form)
+        except ValueError as e:
+            flash(f'Ошибка: {e}!')
+            return redirect(url_for('portfolio_view'))
+        if result is None:
+            flash('Ошибка: веса критериев не заданы!')
+            return redirect(url_for('portfolio_view'))
+        asset_ids = controls.implement(conn, [row['control_measure_id'] for row in result['controls']])
+        risk_snapshot.refresh_assets(conn, asset_ids)
+        conn.commit()
+    summary = result['summary']
+    flash(f"Внедрено мер: {summary['selected']}, стоимость {summary['spent']}, снижение остаточного риска {summary['risk_reduction']}")
+    return redirect(url_for('portfolio_view'))
+
+# Описание списка зависимостей активов для постраничного вывода
+ASSET_DEPENDENCY_LIST = {
+    'columns': 'd.id, a.name, b.name, d.weight',
+    'from': 'asset_dependencies d JOIN assets a ON a.id = d.asset_id JOIN assets b ON b.id = d.depends_on_id',
+    'id': 'd.id',
+    'sorts': {
+        'id': 'd.id',
+        'asset': 'a.name',
+        'depends_on': 'b.name',
+        'weight': 'd.weight',
+    },
+    'default_sort': 'id',
+    'filters': {
+        'asset': ('a.name >= ? AND a.name < ?', pagination.prefix_range),
+        'depends_on': ('b.name >= ? AND b.name < ?', pagination.prefix_range),
+    },
+}
+
+# Зависимости активов и риски, распространённые по ним
+@app.route('/dependencies')
+@admin_required
+def list_dependencies():
+    with db.get_db() as conn:
+        page = pagination.paginate(conn, ASSET_DEPENDENCY_LIST, request.args)
+        assets = conn.execute('SELECT id, name FROM assets ORDER BY name').fetchall()
+        propagated = propagation.result_rows(conn)
+    return render_template('dependencies.html', dependencies=page['rows'], page=page, assets=assets, propagated=propagated)
+
+@app.route('/dependencies/add', methods=['POST'])
+@admin_required
+def add_dependency():
+    try:
+        asset_id = int(request.form['asset_id'])
+        depends_on_id = int(request.form['depends_on_id'])
+        weight = float(request.form.get('weight') or 1)
+    except (KeyError, ValueError):
+        flash('Ошибка: выберите активы и укажите вес зависимости числом!')
+        return redirect(url_for('list_dependencies'))
+    with db.get_db() as conn:
+        try:
+            asset_ids = propagation.set_dependency(conn, asset_id, depends_on_id, weight)
+        except ValueError as e:
+            flash(f'Ошибка: {e}!')
+            return redirect(url_for('list_dependencies'))
+        except sqlite3.IntegrityError:
+            flash('Ошибка: актив не найден!')
+            return redirect(url_for('list_dependencies'))
+        propagation.refresh_assets(conn, asset_ids)
+        conn.commit()
+    flash('Зависимость сохранена!')
+    return redirect(url_for('list_dependencies'))
+
+@app.route('/dependencies/delete/<int:id>', methods=['POST'])
+@admin_required
+def delete_dependency(id):
+    with db.get_db() as conn:
+        asset_ids = propagation.remove_dependency(conn, id)
+        if not asset_ids:
+            flash('Зависимость не найдена!')
+            return redirect(url_for('list_dependencies'))
+        propagation.refresh_assets(conn, asset_ids)
+        conn.commit()
+    flash('Зависимость удалена!')
+    return redirect(url_for('list_dependencies'))
+
+@app.route('/dependencies/propagation.json')
+@login_required
+def propagation_json():
+    top = max(1, min(request.args.get('top', propagation.DEFAULT_TOP, type=int), propagation.MAX_TOP))
+    with db.get_db() as conn:
+        rows = propagation.result_rows(conn, top, request.args.get('asset_id', type=int))
+    return jsonify({'top': rows})
+
+@app.route('/export/risk_register.<fmt>')
+@admin_required
+def export_risk_register(fmt):
+    if fmt not in export.FORMATS:
+        abort(404)
+    serialize, mimetype = export.FORMATS[fmt]
+
+    # Соединение запроса используется внутри генератора и живёт, пока ответ отдаётся клиенту
+    def generate():
+        with db.get_db() as conn:
+            yield from serialize(export.iter_register(conn))
+
+    return Response(stream_with_context(generate()), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename=risk_register.{fmt}'})
+
+@app.cli.command('export-register')
+@click.option('--format', 'fmt', type=click.Choice(sorted(export.FORMATS)), default='ndjson', help='Формат выгрузки')
+@click.option('--output', '-o', type=click.File('w', encoding='utf-8', lazy=True), default='-', help='Файл (по умолчанию stdout)')
+def export_register_command(fmt, output):
+    serialize, _ = export.FORMATS[fmt]
+    with db.get_db() as conn:
+        for chunk in serialize(export.iter_register(conn)):
+            output.write(chunk)
+
+@app.cli.command('bulk-import')
+@click.argument('kind', type=click.Choice(bulk_import.KINDS))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+def bulk_import_command(kind, path):
+    try:
+        with open(path, encoding='utf-8-sig') as f:
+            rows = bulk_import.parse(f.read(), bulk_import.detect_format(path))
+    except ValueError as e:
+        raise click.ClickException(f'не удалось прочитать файл: {e}')
+    with db.get_db() as conn:
+        result = bulk_import.import_rows(conn, kind, rows)
+        conn.commit()
+    print(f"Импортировано записей: {result['inserted']}, затронуто активов: {result['assets']}")
+    for number, message in result['errors']:
+        print(f'Строка {number}: {message}')
+
+# Пересчёт агрегированных оценок и вероятностей для всех (или указанных) активов и обновление снимка рисков
+def recompute_scores(conn, asset_ids=None):
+    start = time.perf_counter()
+    scores_updated, probabilities_updated = aggregation.recompute(conn, asset_ids)
+    aggregated = time.perf_counter()
+    if asset_ids is None:
+        risk_snapshot.refresh_all(conn)
+    else:
+        risk_snapshot.refresh_assets(conn, asset_ids)
+    conn.commit()
+    finished = time.perf_counter()
+    return {
+        'scores_updated': scores_updated,
+        'probabilities_updated': probabilities_updated,
+        'aggregate_seconds': round(aggregated - start, 4),
+        'snapshot_seconds': round(finished - aggregated, 4),
+        'total_seconds': round(finished - start, 4),
+    }
+
+@app.route('/admin/recompute_scores', methods=['POST'])
+@admin_required
+def recompute_scores_view():
+    data = request.get_json(silent=True) or {}
+    asset_ids = data.get('asset_ids')
+    if asset_ids is not None:
+        try:
+            asset_ids = [int(asset_id) for asset_id in asset_ids]
+        except (TypeError, ValueError):
+            return jsonify({'success': False, 'error': 'asset_ids должен быть списком целых чисел!'}), 400
+    with db.get_db() as conn:
+        result = recompute_scores(conn, asset_ids)
+    return jsonify({'success': True, **result})
+
+@app.route('/admin/aggregation', methods=['GET', 'POST'])
+@admin_required
+def aggregation_settings():
+    with db.get_db() as conn:
+        if request.method == 'POST':
+            strategy = request.form.get('strategy')
+            try:
+                trim = float(request.form.get('trim') or aggregation.DEFAULT_TRIM)
+                start = time.perf_counter()
+                aggregation.set_strategy(conn, strategy, trim)
+            except ValueError as e:
+                flash(f'Ошибка: {e}')
+                return redirect(url_for('aggregation_settings'))
+            risk_snapshot.refresh_all(conn)
+            conn.commit()
+            flash(f'Способ агрегирования изменён, оценки всех активов пересчитаны за {time.perf_counter() - start:.2f} с.')
+            return redirect(url_for('aggregation_settings'))
+        strategy, trim = aggregation.load_settings(conn)
+    return render_template('aggregation_settings.html', strategy=strategy, trim=trim,
+                           strategies=aggregation.STRATEGY_LABELS)
+
+@app.cli.command('set-aggregation')
+@click.argument('strategy', type=click.Choice(aggregation.STRATEGIES))
+@click.option('--trim', type=float, default=aggregation.DEFAULT_TRIM, help='доля оценок, отбрасываемых с каждой стороны (для trimmed)')
+def set_aggregation_command(strategy, trim):
+    start = time.perf_counter()
+    with db.get_db() as conn:
+        try:
+            scores_updated, probabilities_updated = aggregation.set_strategy(conn, strategy, trim)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        risk_snapshot.refresh_all(conn)
+        conn.commit()
+    print(f'Способ агрегирования: {strategy} (trim {trim})')
+    print(f'Пересчитано активов: оценки {scores_updated}, вероятности {probabilities_updated}, {time.perf_counter() - start:.4f} с')
+
+@app.cli.command('what-if')
+@click.argument('scenario_file', type=click.File('r', encoding='utf-8'))
+@click.option('--all', 'show_all', is_flag=True, help='показать все активы, а не только изменившиеся')
+def what_if_command(scenario_file, show_all):
+    try:
+        spec = json.load(scenario_file)
+    except ValueError as e:
+        raise click.ClickException(f'Некорректный JSON: {e}')
+    with db.get_db() as conn:
+        try:
+            result = run_scenario(conn, spec)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+    if result is None:
+        raise click.ClickException('Веса критериев не заданы')
+    summary = result['summary']
+    print(f"Активов: {summary['assets']}, изменённых записей анализа рисков по переопределениям: {', '.join(map(str, summary['affected_rows'])) or '—'}")
+    print(f"Остаточный риск изменился у {summary['changed_residual_risk']}, уровень — у {summary['changed_level']}, ранг — у {summary['changed_rank']}")
+    for transition, count in summary['level_transitions'].items():
+        print(f'  {transition}: {count}')
+    if summary['ineffective_overrides']:
+        print(f"Переопределения без записей с рассчитанным риском: {', '.join(map(str, summary['ineffective_overrides']))}")
+    print(f"Суммарный остаточный риск: {summary['total_residual_risk_before']} → {summary['total_residual_risk_after']} ({summary['seconds']} с)")
+    print(f"Остаточный риск записей анализа рисков изменился у {summary['changed_rows']}, сумма по записям: "
+          f"{summary['total_scenario_residual_risk_before']} → {summary['total_scenario_residual_risk_after']}")
+    for row in result['assets']:
+        if show_all or row['residual_risk_delta'] or row['rank_delta'] or row['scenario_residual_risk_delta']:
+            print(f"{row['rank_after']:>5} ({row['rank_delta']:+d}) {row['asset']}: {row['residual_risk_before']} → {row['residual_risk_after']}, "
+                  f"{row['level_before']} → {row['level_after']}, записи: {row['scenario_residual_risk_before']} → {row['scenario_residual_risk_after']}")
+
+@app.cli.command('top-risks')
+@click.option('--top', type=int, default=20, show_default=True, help='число сценариев с наибольшим остаточным риском')
+@click.option('--asset', 'asset_id', type=int, help='только сценарии актива')
+@click.option('--threat', 'threat_id', type=int, help='только сценарии угрозы')
+def top_risks_command(top, asset_id, threat_id):
+    with db.get_db() as conn:
+        result = run_risk_scenarios(conn, max(1, top), asset_id, threat_id)
+    if result is None:
+        raise click.ClickException('Веса критериев не заданы')
+    summary = result['summary']
+    print(f"Сценариев: {summary['scenarios']}, рассчитано: {summary['computed']}, с вероятностью по угрозе: {summary['threat_scoped']} ({summary['seconds']} с)")
+    print(', '.join(f'{level}: {count}' for level, count in summary['levels'].items()))
+    for row in result['top']:
+        print(f"{row['residual_risk']:>8.2f}  {row['level']:<8} #{row['risk_id']} {row['asset']} / {row['threat']} / {row['vulnerability']}")
+
+@app.cli.command('rollups')
+@click.option('--by', type=click.Choice(sorted(rollups.DIMENSIONS)), default=rollups.DEFAULT_DIMENSION, show_default=True,
+              help='измерение сводки')
+@click.option('--owner', 'owner_id', help='только записи владельца (id)')
+@click.option('--threat', 'threat_id', help='только записи угрозы (id)')
+@click.option('--category', help='только уязвимости категории')
+def rollups_command(by, owner_id, threat_id, category):
+    result = run_rollups({'by': by, 'owner_id': owner_id, 'threat_id': threat_id, 'category': category})
+    if result is None:
+        raise click.ClickException('Веса критериев не заданы')
+    totals = result['totals']
+    print(f"Записей: {totals['records']}, рассчитано: {totals['computed']}, суммарный остаточный риск: {totals['residual_risk_sum']} "
+          f"(куб {result['build_seconds']} с, сводка {result['seconds']} с)")
+    for row in result['rows']:
+        share = f"{row['share'] * 100:5.1f}%" if row['share'] is not None else '    —'
+        print(f"{row['residual_risk_sum']:>10.2f} {share}  {row['computed']:>6}/{row['records']:<6} {row['name']}")
+
+@app.cli.command('recompute-controls')
+def recompute_controls_command():
+    start = time.perf_counter()
+    with db.get_db() as conn:
+        asset_ids = controls.refresh(conn)
+        risk_snapshot.refresh_assets(conn, asset_ids)
+        conn.commit()
+    print(f'Активов с изменённой эффективностью защиты: {len(asset_ids)}, {time.perf_counter() - start:.4f} с')
+
+@app.cli.command('optimize-controls')
+@click.option('--budget', type=float, required=True, help='бюджет на внедрение мер')
+@click.option('--method', type=click.Choice(portfolio.METHODS), default='auto', show_default=True)
+@click.option('--apply', 'apply_selection', is_flag=True, help='внедрить выбранные меры')
+def optimize_controls_command(budget, method, apply_selection):
+    with db.get_db() as conn:
+        try:
+            result = run_portfolio(conn, {'budget': budget, 'method': method})
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        if result is None:
+            raise click.ClickException('Веса критериев не заданы')
+        if apply_selection:
+            risk_snapshot.refresh_assets(conn, controls.implement(conn, [row['control_measure_id'] for row in result['controls']]))
+            conn.commit()
+    summary = result['summary']
+    print(f"Кандидатов: {summary['candidates']} (без стоимости: {summary['unpriced_candidates']}), метод: {summary['method']}"
+          f"{' (оптимально)' if summary['optimal'] else ''}, {summary['seconds']} с")
+    print(f"Выбрано мер: {summary['selected']}, стоимость {summary['spent']} из {summary['budget']}")
+    print(f"Суммарный остаточный риск: {summary['total_residual_risk_before']} → {summary['total_residual_risk_after']}")
+    for row in result['controls']:
+        print(f"{row['cost']:>10.2f}  −{row['risk_reduction']:<10}  записей {row['risks']:<5} {row['control_measure']}")
+    if apply_selection:
+        print('Выбранные меры внедрены')
+
+@app.cli.command('recompute-scores')
+@click.option('--asset', 'asset_ids', type=int, multiple=True, help='id актива (можно указать несколько раз); по умолчанию — все активы')
+def recompute_scores_command(asset_ids):
+    with db.get_db() as conn:
+        result = recompute_scores(conn, list(asset_ids) or None)
+    print(f"Активов с пересчитанными оценками: {result['scores_updated']}")
+    print(f"Активов с пересчитанной вероятностью: {result['probabilities_updated']}")
+    print(f"Агрегация: {result['aggregate_seconds']:.4f} с, снимок рисков: {result['snapshot_seconds']:.4f} с, всего: {result['total_seconds']:.4f} с")
+
+@app.cli.command('init-db')
+def init_db_command():
+    with db.get_db() as conn:
+        applied = bootstrap.initialize(conn)
+    for number, name in applied:
+        print(f'Применена миграция {number}: {name}')
+    print(f'База данных инициализирована: {app.config["DATABASE"]}')
+
+@app.cli.command('seed')
+def seed_command():
+    with db.get_db() as conn:
+        bootstrap.seed(conn)
+        conn.commit()
+    print('Начальные данные добавлены в пустые таблицы.')
+
+@app.cli.command('migrate')
+@click.option('--target', type=int, default=None, help='версия, до которой применить миграции (по умолчанию — последняя)')
+def migrate_command(target):
+    with db.get_db() as conn:
+        applied = migrations.migrate(conn, target)
+        version = migrations.current_version(conn)
+        # Производные данные пересчитываются, когда схема доведена до последней версии
+        if applied and version == migrations.LATEST_VERSION:
+            bootstrap.refresh_derived(conn)
+            conn.commit()
+    for number, name in applied:
+        print(f'Применена миграция {number}: {name}')
+    print(f'Версия схемы: {version} (последняя: {migrations.LATEST_VERSION})')
+
+@app.cli.command('check-query-plans')
+def check_query_plans_command():
+    with db.get_db() as conn:
+        results = migrations.check_query_plans(conn)
+    failed = 0
+    for name, index, uses_index, plan in results:
+        print(f"{'OK  ' if uses_index else 'FAIL'} {name}: {plan}")
+        if not uses_index:
+            failed += 1
+            print(f'     ожидался индекс {index}')
+    if failed:
+        raise click.ClickException(f'Запросов без ожидаемого индекса: {failed}')
+
+@app.cli.command('refresh-propagation')
+def refresh_propagation_command():
+    start = time.perf_counter()
+    with db.get_db() as conn:
+        result = propagation.refresh_all(conn)
+        conn.commit()
+    print(f"Распространённые риски пересчитаны: активов {result['assets']}, зависимостей {result['edges']}, "
+          f"{time.perf_counter() - start:.4f} с")
+
+@app.cli.command('refresh-risk-snapshot')
+def refresh_risk_snapshot_command():
+    with db.get_db() as conn:
+        risk_snapshot.refresh_all(conn)
+        conn.commit()
+    print('Снимок рисков активов перестроен.')
+
+@app.cli.command('cleanup-heatmaps')
+def cleanup_heatmaps_command():
+    removed = heatmap.cleanup(app.static_folder, app.config['HEATMAP_CACHE_SIZE'])
+    print(f'Удалено файлов тепловых карт: {removed}')
 
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
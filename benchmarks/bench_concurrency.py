@@ -0,0 +1,175 @@
+import argparse
+import multiprocessing
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+# Одновременные читатели и писатели на одной базе: пропускная способность, задержки и ошибки
+# «database is locked» для прежнего способа подключения (журнал отката, настройки по умолчанию)
+# и для db.connect (WAL, busy_timeout, synchronous=NORMAL, mmap_size, cache_size).
+# Каждый участник — отдельный процесс, как рабочий процесс сервера; каждая операция открывает
+# одно соединение на «запрос». База с синтетическими данными создаётся во временном каталоге.
+#
+#   python benchmarks/bench_concurrency.py [--readers 4] [--writers 2] [--duration 5] [--root <каталог с app.py>]
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODES = ('legacy', 'tuned')
+
+
+def _open(mode, path):
+    import db
+
+    if mode == 'legacy':
+        return sqlite3.connect(path)
+    return db.connect(path)
+
+
+def create_database(path, assets, experts, writers):
+    import aggregation
+    import migrations
+    import risk_engine
+    import risk_snapshot
+
+    rng = random.Random(1)
+    with sqlite3.connect(path) as conn:
+        migrations.migrate(conn)
+        conn.execute('''
+            INSERT INTO criteria_weights (life_health, economy, ecology, dependency, social, international)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (0.419, 0.252, 0.099, 0.144, 0.051, 0.035))
+        # Эксперты писателей (последние writers) не имеют начальных вероятностей
+        conn.executemany('INSERT INTO experts (name) VALUES (?)', [(f'expert{i}',) for i in range(experts + writers)])
+        conn.executemany('INSERT INTO assets (name) VALUES (?)', [(f'asset{i}',) for i in range(assets)])
+        conn.executemany(f'''
+            INSERT INTO asset_evaluations (asset_id, expert_id, {', '.join(risk_engine.CRITERIA)})
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [(asset_id, expert_id) + tuple(rng.uniform(0, 10) for _ in risk_engine.CRITERIA)
+              for asset_id in range(1, assets + 1) for expert_id in range(1, experts + 1)])
+        conn.executemany('INSERT INTO threat_probabilities (asset_id, expert_id, probability) VALUES (?, ?, ?)', [
+            (asset_id, expert_id, rng.uniform(1, 3))
+            for asset_id in range(1, assets + 1) for expert_id in range(1, experts + 1)])
+        conn.executemany('''
+            INSERT INTO risk_analysis (asset_id, asset_owner_id, threat_id, vulnerability_id, taken_measure_id, control_measure_id, control_effectiveness)
+            VALUES (?, NULL, NULL, NULL, NULL, NULL, ?)
+        ''', [(asset_id, rng.uniform(0, 0.9)) for asset_id in range(1, assets + 1)])
+        aggregation.recompute_all(conn)
+        risk_snapshot.refresh_all(conn)
+        conn.commit()
+
+
+# Чтение: страница критичности и оценки случайного актива
+def read_once(conn, rng, assets):
+    import risk_snapshot
+
+    risk_snapshot.ranked_rows(conn)
+    conn.execute('SELECT * FROM asset_evaluations WHERE asset_id = ?', (rng.randint(1, assets),)).fetchall()
+
+
+# Запись: добавление или удаление вероятности угрозы и пересчёт актива, как в маршрутах приложения
+def write_once(conn, rng, assets, expert_id):
+    import aggregation
+    import risk_snapshot
+
+    asset_id = rng.randint(1, assets)
+    cursor = conn.execute('DELETE FROM threat_probabilities WHERE asset_id = ? AND expert_id = ?', (asset_id, expert_id))
+    if cursor.rowcount == 0:
+        conn.execute('INSERT INTO threat_probabilities (asset_id, expert_id, probability) VALUES (?, ?, ?)',
+                     (asset_id, expert_id, rng.uniform(1, 3)))
+    conn.commit()
+    if aggregation.refresh_threat_probability(conn, asset_id):
+        risk_snapshot.refresh_assets(conn, [asset_id])
+        conn.commit()
+
+
+def worker(root, mode, path, role, number, assets, expert_id, start_at, duration, results):
+    sys.path.insert(0, root)
+    rng = random.Random(number)
+    latencies = []
+    errors = 0
+    while time.time() < start_at:
+        time.sleep(0.001)
+    deadline = start_at + duration
+    while time.time() < deadline:
+        started = time.perf_counter()
+        conn = _open(mode, path)
+        try:
+            if role == 'reader':
+                read_once(conn, rng, assets)
+            else:
+                write_once(conn, rng, assets, expert_id)
+        except sqlite3.OperationalError as e:
+            if 'locked' not in str(e):
+                raise
+            errors += 1
+            conn.rollback()
+        else:
+            latencies.append(time.perf_counter() - started)
+        finally:
+            conn.close()
+    results.put((role, latencies, errors))
+
+
+def run_mode(root, mode, args):
+    sys.path.insert(0, root)
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, 'risk_assessment.db')
+        create_database(path, args.assets, args.experts, args.writers)
+        if mode == 'legacy':
+            with sqlite3.connect(path) as conn:
+                conn.execute('PRAGMA journal_mode = DELETE')
+        else:
+            _open(mode, path).close()
+
+        context = multiprocessing.get_context('spawn')
+        results = context.Queue()
+        start_at = time.time() + 2
+        processes = [
+            context.Process(target=worker, args=(root, mode, path, 'reader', i, args.assets, None, start_at, args.duration, results))
+            for i in range(args.readers)
+        ] + [
+            context.Process(target=worker, args=(root, mode, path, 'writer', 1000 + i, args.assets,
+                                                 args.experts + i + 1, start_at, args.duration, results))
+            for i in range(args.writers)
+        ]
+        for process in processes:
+            process.start()
+        collected = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+
+    summary = {}
+    for role in ('reader', 'writer'):
+        latencies = sorted(value for r, values, _ in collected if r == role for value in values)
+        errors = sum(e for r, _, e in collected if r == role)
+        p95 = latencies[int(len(latencies) * 0.95)] if latencies else 0
+        summary[role] = (len(latencies) / args.duration, statistics.median(latencies) if latencies else 0, p95, errors)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Одновременные читатели и писатели SQLite')
+    parser.add_argument('--root', default=ROOT, help='каталог с app.py (например, рабочая копия другой ревизии)')
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--duration', type=float, default=5.0, help='длительность замера, с')
+    parser.add_argument('--assets', type=int, default=500)
+    parser.add_argument('--experts', type=int, default=10)
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES))
+    args = parser.parse_args()
+
+    root = os.path.abspath(args.root)
+    print(f'root: {root}')
+    print(f'readers: {args.readers}, writers: {args.writers}, duration: {args.duration} s, assets: {args.assets}, experts: {args.experts}')
+    print(f"{'mode':<8} {'role':<7} {'ops/s':>9} {'p50, ms':>9} {'p95, ms':>9} {'locked':>7}")
+    for mode in args.modes:
+        for role, (rate, p50, p95, errors) in run_mode(root, mode, args).items():
+            print(f'{mode:<8} {role:<7} {rate:>9.1f} {p50 * 1000:>9.2f} {p95 * 1000:>9.2f} {errors:>7}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+import argparse
+import itertools
+import os
+import sys
+import time
+
+# Подбор мер контроля в пределах бюджета (portfolio) на синтетической задаче:
+# жадный подбор с ленивой очередью в сравнении с жадным подбором, пересчитывающим снижения всех мер на каждом шаге,
+# и точный перебор с отсечениями в сравнении с полным перебором подмножеств.
+#
+#   python benchmarks/bench_portfolio.py [--controls 300] [--risks 5000] [--links 60000] [--exact-controls 12]
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_problem(rng, controls, risks, links):
+    import numpy as np
+
+    pairs = np.unique(np.stack([rng.integers(0, controls, links), rng.integers(0, risks, links)], axis=1), axis=0)
+    return {
+        'control_ids': np.arange(controls),
+        'names': [f'control{i}' for i in range(controls)],
+        'cost': rng.uniform(1, 20, controls),
+        'link_control': pairs[:, 0],
+        'offsets': np.searchsorted(pairs[:, 0], np.arange(controls + 1)),
+        'link_risk': pairs[:, 1],
+        'effectiveness': rng.uniform(0.05, 0.9, len(pairs)),
+        'residual': rng.uniform(0, 10, risks),
+        'current': np.zeros(risks),
+        'total_residual': 0.0,
+        'unpriced': 0,
+    }
+
+
+# Жадный подбор без ленивой очереди: на каждом шаге снижения всех мер пересчитываются заново
+def eager_greedy(portfolio, problem, budget):
+    residual = problem['residual'].copy()
+    cost = problem['cost']
+    selected, spent, gain_total = set(), 0.0, 0.0
+    while True:
+        gains = portfolio._gains(problem, residual)
+        best, best_ratio = None, 0.0
+        for control in range(len(cost)):
+            if control in selected or cost[control] > budget - spent + portfolio.EPSILON:
+                continue
+            if gains[control] > portfolio.EPSILON and gains[control] / cost[control] > best_ratio:
+                best, best_ratio = control, gains[control] / cost[control]
+        if best is None:
+            return gain_total
+        portfolio._apply(problem, residual, best)
+        selected.add(best)
+        spent += cost[best]
+        gain_total += gains[best]
+
+
+# Полный перебор подмножеств мер
+def brute_force(portfolio, problem, budget):
+    best = 0.0
+    controls = range(len(problem['control_ids']))
+    for size in range(1, len(controls) + 1):
+        for subset in itertools.combinations(controls, size):
+            if sum(problem['cost'][control] for control in subset) > budget:
+                continue
+            residual = problem['residual'].copy()
+            for control in subset:
+                portfolio._apply(problem, residual, control)
+            best = max(best, float(problem['residual'].sum() - residual.sum()))
+    return best
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    import numpy as np
+
+    parser = argparse.ArgumentParser(description='Подбор мер контроля в пределах бюджета')
+    parser.add_argument('--root', default=ROOT, help='каталог с portfolio.py')
+    parser.add_argument('--controls', type=int, default=300)
+    parser.add_argument('--risks', type=int, default=5000)
+    parser.add_argument('--links', type=int, default=60000)
+    parser.add_argument('--exact-controls', type=int, default=12)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.abspath(args.root))
+    import portfolio
+
+    rng = np.random.default_rng(1)
+    timings = {'greedy': [], 'eager_greedy': [], 'exact': [], 'brute_force': []}
+    ratios = []
+    for _ in range(args.runs):
+        problem = make_problem(rng, args.controls, args.risks, args.links)
+        budget = float(problem['cost'].sum() * 0.3)
+        selection, elapsed = timed(portfolio.greedy, problem, budget)
+        timings['greedy'].append(elapsed)
+        expected, elapsed = timed(eager_greedy, portfolio, problem, budget)
+        timings['eager_greedy'].append(elapsed)
+        # Ленивая очередь выбирает те же меры, что и полный пересчёт (кроме замены лучшей одиночной мерой)
+        assert sum(gain for _, gain in selection) >= expected - 1e-6 * max(expected, 1)
+
+        small = make_problem(rng, args.exact_controls, 500, 2000)
+        budget = float(small['cost'].sum() * rng.uniform(0.2, 0.8))
+        (selection, optimal), elapsed = timed(portfolio.exact, small, budget)
+        timings['exact'].append(elapsed)
+        best, elapsed = timed(brute_force, portfolio, small, budget)
+        timings['brute_force'].append(elapsed)
+        found = sum(gain for _, gain in selection)
+        assert not optimal or abs(found - best) <= 1e-6 * max(best, 1)
+        greedy_gain = sum(gain for _, gain in portfolio.greedy(small, budget))
+        ratios.append(greedy_gain / best if best else 1.0)
+
+    print(f'greedy: controls {args.controls}, risks {args.risks}, links {args.links}; '
+          f'exact: controls {args.exact_controls}, risks 500, links 2000')
+    for name, values in timings.items():
+        print(f'{name:<12} (s): min {min(values):.4f}  max {max(values):.4f}')
+    print(f'greedy / exact on small problems: min {min(ratios):.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+# Распространение риска по зависимостям активов (propagation) на синтетическом графе: полный пересчёт,
+# пересчёт после изменения одного ребра и одной строки снимка рисков в сравнении с итерацией по словарям в Python.
+# Граф слоистый (услуги → оборудование → помещения) с добавкой случайных рёбер, в том числе образующих циклы.
+#
+#   python benchmarks/bench_propagation.py [--assets 50000] [--edges 150000]
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def create_database(path, assets, edges):
+    import migrations
+
+    rng = random.Random(1)
+    with sqlite3.connect(path) as conn:
+        migrations.migrate(conn)
+        conn.executemany('INSERT INTO assets (name) VALUES (?)', [(f'asset{i}',) for i in range(assets)])
+        # Снимок рисков заполняется напрямую: у четверти активов (помещения без оценок) строки нет
+        rows = []
+        for asset_id in range(1, assets + 1):
+            if asset_id > assets * 3 // 4:
+                continue
+            criticality = rng.uniform(0, 10)
+            impact = 1 + criticality / 10 * 2
+            residual_risk = impact * rng.uniform(1, 3) * rng.uniform(0.2, 1)
+            rows.append((asset_id, criticality, impact, 2, impact * 2, residual_risk, 'Средний', asset_id))
+        conn.executemany('''
+            INSERT INTO asset_risk (asset_id, criticality, impact, probability, risk_score, residual_risk, level, rank)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+        # Слои: услуги [0, 1/4), оборудование [1/4, 3/4), помещения [3/4, 1); 10 % рёбер — случайные
+        layers = [(0, assets // 4), (assets // 4, assets * 3 // 4), (assets * 3 // 4, assets)]
+        pairs = {}
+        while len(pairs) < edges:
+            if rng.random() < 0.1:
+                asset_id, depends_on_id = rng.randrange(assets), rng.randrange(assets)
+            else:
+                upper = rng.randrange(2)
+                asset_id = rng.randrange(*layers[upper])
+                depends_on_id = rng.randrange(*layers[upper + 1])
+            if asset_id != depends_on_id:
+                pairs[(asset_id + 1, depends_on_id + 1)] = round(rng.uniform(0.1, 1), 2)
+        conn.executemany('INSERT INTO asset_dependencies (asset_id, depends_on_id, weight) VALUES (?, ?, ?)',
+                         [(asset_id, depends_on_id, weight) for (asset_id, depends_on_id), weight in pairs.items()])
+        conn.commit()
+
+
+# Итерация до неподвижной точки по словарям в Python: на каждом шаге обходятся все рёбра
+def python_propagation(conn):
+    base = {}
+    for asset_id, criticality, impact, residual_risk in conn.execute(
+            'SELECT asset_id, criticality, impact, residual_risk FROM asset_risk'):
+        base[asset_id] = (criticality, residual_risk / impact)
+    edges = conn.execute('SELECT asset_id, depends_on_id, weight FROM asset_dependencies').fetchall()
+    criticality, probability = {}, {}
+    for asset_id in set(base) | {a for a, _, _ in edges} | {b for _, b, _ in edges}:
+        criticality[asset_id], probability[asset_id] = base.get(asset_id, (0.0, 0.0))
+    changed = True
+    while changed:
+        changed = False
+        for asset_id, depends_on_id, weight in edges:
+            if weight * criticality[asset_id] > criticality[depends_on_id]:
+                criticality[depends_on_id] = weight * criticality[asset_id]
+                changed = True
+            if weight * probability[depends_on_id] > probability[asset_id]:
+                probability[asset_id] = weight * probability[depends_on_id]
+                changed = True
+    return criticality, probability
+
+
+def stored_values(conn):
+    return {asset_id: (criticality, probability) for asset_id, criticality, probability in conn.execute(
+        'SELECT asset_id, effective_criticality, effective_probability FROM asset_propagated_risk')}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Распространение риска по зависимостям активов')
+    parser.add_argument('--root', default=ROOT, help='каталог с propagation.py')
+    parser.add_argument('--assets', type=int, default=50000)
+    parser.add_argument('--edges', type=int, default=150000)
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.abspath(args.root))
+    import propagation
+
+    rng = random.Random(2)
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, 'risk_assessment.db')
+        create_database(path, args.assets, args.edges)
+        conn = sqlite3.connect(path)
+
+        timings = {'load': [], 'compute': [], 'refresh_all': [], 'edge': [], 'score': [], 'python': []}
+        affected = {'edge': [], 'score': []}
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            graph = propagation.load(conn)
+            middle = time.perf_counter()
+            propagation.compute(graph)
+            timings['load'].append(middle - start)
+            timings['compute'].append(time.perf_counter() - middle)
+
+            start = time.perf_counter()
+            propagation.refresh_all(conn)
+            timings['refresh_all'].append(time.perf_counter() - start)
+            conn.commit()
+
+            # Одно ребро: новое или с изменённым весом
+            asset_id, depends_on_id = rng.sample(range(1, args.assets + 1), 2)
+            start = time.perf_counter()
+            asset_ids = propagation.set_dependency(conn, asset_id, depends_on_id, round(rng.uniform(0.1, 1), 2))
+            affected['edge'].append(propagation.refresh_assets(conn, asset_ids))
+            timings['edge'].append(time.perf_counter() - start)
+
+            # Одна строка снимка рисков (как после новой оценки актива)
+            asset_id = rng.randrange(1, args.assets * 3 // 4)
+            conn.execute('UPDATE asset_risk SET criticality = ?, residual_risk = impact * ? WHERE asset_id = ?',
+                         (rng.uniform(0, 10), rng.uniform(0.2, 3), asset_id))
+            start = time.perf_counter()
+            affected['score'].append(propagation.refresh_assets(conn, [asset_id]))
+            timings['score'].append(time.perf_counter() - start)
+            conn.commit()
+
+        incremental = stored_values(conn)
+        propagation.refresh_all(conn)
+        full = stored_values(conn)
+        assert incremental.keys() == full.keys()
+        assert all(incremental[key] == value for key, value in full.items())
+
+        start = time.perf_counter()
+        criticality, probability = python_propagation(conn)
+        timings['python'].append(time.perf_counter() - start)
+        assert all(abs(criticality[key] - value[0]) <= 1e-9 and abs(probability[key] - value[1]) <= 1e-9
+                   for key, value in full.items())
+        edges = conn.execute('SELECT COUNT(*) FROM asset_dependencies').fetchone()[0]
+
+    print(f'assets: {args.assets}, edges: {edges}')
+    for name, values in timings.items():
+        print(f'{name:<12} (s): min {min(values):.3f}  max {max(values):.3f}')
+    for name, values in affected.items():
+        print(f'rows written after one {name} change: {values}')
+
+
+if __name__ == '__main__':
+    main()
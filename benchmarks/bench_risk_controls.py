@@ -0,0 +1,105 @@
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+# Совокупная эффективность нескольких мер контроля на запись анализа рисков (controls) на синтетической базе:
+# пакетный расчёт по плоскому массиву связей в сравнении с построчным циклом Python по записям.
+#
+#   python benchmarks/bench_risk_controls.py [--risks 20000] [--controls 93] [--per-risk 30]
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def create_database(path, risks, controls, per_risk):
+    import migrations
+
+    rng = random.Random(1)
+    with sqlite3.connect(path) as conn:
+        migrations.migrate(conn)
+        conn.executemany('INSERT INTO control_measures (name) VALUES (?)', [(f'control{i}',) for i in range(controls)])
+        conn.executemany('INSERT INTO risk_analysis (asset_id, control_measure_id) VALUES (?, ?)',
+                         [(i % 1000 + 1, 1) for i in range(risks)])
+        conn.executemany('INSERT INTO risk_controls (risk_id, control_measure_id, effectiveness) VALUES (?, ?, ?)',
+                         [(risk_id, control_measure_id, round(rng.uniform(0, 0.5), 2))
+                          for risk_id in range(1, risks + 1)
+                          for control_measure_id in rng.sample(range(1, controls + 1), rng.randint(1, per_risk))])
+        conn.commit()
+
+
+# Цикл по записям: запрос мер каждой записи и произведение (1 − e) в Python
+def per_risk_combined(conn):
+    result = {}
+    for (risk_id,) in conn.execute('SELECT id FROM risk_analysis ORDER BY id').fetchall():
+        remaining = 1.0
+        effectiveness = conn.execute('SELECT effectiveness FROM risk_controls WHERE risk_id = ?', (risk_id,)).fetchall()
+        for (value,) in effectiveness:
+            remaining *= 1 - value
+        if effectiveness:
+            result[risk_id] = round(1 - remaining, 6)
+    return result
+
+
+# Один проход по связям: произведение (1 − e) накапливается в словаре по записи
+def python_combined(conn):
+    remaining = {}
+    for risk_id, effectiveness in conn.execute('SELECT risk_id, effectiveness FROM risk_controls ORDER BY risk_id'):
+        remaining[risk_id] = remaining.get(risk_id, 1.0) * (1 - effectiveness)
+    return {risk_id: round(1 - value, 6) for risk_id, value in remaining.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Совокупная эффективность мер контроля')
+    parser.add_argument('--root', default=ROOT, help='каталог с controls.py')
+    parser.add_argument('--risks', type=int, default=20000)
+    parser.add_argument('--controls', type=int, default=93)
+    parser.add_argument('--per-risk', type=int, default=30)
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.abspath(args.root))
+    import controls
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, 'risk_assessment.db')
+        create_database(path, args.risks, args.controls, args.per_risk)
+        conn = sqlite3.connect(path)
+        links = conn.execute('SELECT COUNT(*) FROM risk_controls').fetchone()[0]
+
+        timings = {'load': [], 'combine': [], 'refresh': [], 'python': [], 'per_risk': []}
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            loaded = controls.load_links(conn)
+            middle = time.perf_counter()
+            ids, values = controls.combined_effectiveness(loaded)
+            timings['load'].append(middle - start)
+            timings['combine'].append(time.perf_counter() - middle)
+
+            # Полный пересчёт с записью в risk_analysis (эффективность сбрасывается, чтобы обновились все записи)
+            conn.execute('UPDATE risk_analysis SET control_effectiveness = NULL')
+            start = time.perf_counter()
+            controls.refresh(conn)
+            timings['refresh'].append(time.perf_counter() - start)
+            conn.rollback()
+
+            start = time.perf_counter()
+            expected = python_combined(conn)
+            timings['python'].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            assert per_risk_combined(conn) == expected
+            timings['per_risk'].append(time.perf_counter() - start)
+        combined = dict(zip(ids.tolist(), values.tolist()))
+        assert combined.keys() == expected.keys()
+        assert max(abs(combined[risk_id] - value) for risk_id, value in expected.items()) <= 2e-6
+
+    print(f'risks: {args.risks}, links: {links}, controls: {args.controls}')
+    for name, values in timings.items():
+        print(f'{name:<8} (s): min {min(values):.3f}  max {max(values):.3f}')
+
+
+if __name__ == '__main__':
+    main()
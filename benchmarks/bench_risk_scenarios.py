@@ -0,0 +1,118 @@
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+# Риски по сценариям (актив, угроза, уязвимость) на синтетической базе: загрузка, векторный расчёт
+# всех сценариев и выбор top (risk_scenarios) в сравнении с построчным расчётом в Python и полной сортировкой.
+#
+#   python benchmarks/bench_risk_scenarios.py [--scenarios 500000] [--assets 5000] [--threats 50] [--top 50]
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def create_database(path, scenarios, assets, threats, experts):
+    import aggregation
+    import migrations
+    import risk_engine
+
+    rng = random.Random(1)
+    with sqlite3.connect(path) as conn:
+        migrations.migrate(conn)
+        conn.execute('''
+            INSERT INTO criteria_weights (life_health, economy, ecology, dependency, social, international)
+            VALUES (0.419, 0.252, 0.099, 0.144, 0.051, 0.035)
+        ''')
+        conn.executemany('INSERT INTO experts (name) VALUES (?)', [(f'expert{i}',) for i in range(experts)])
+        conn.executemany('INSERT INTO threats (name) VALUES (?)', [(f'threat{i}',) for i in range(threats)])
+        conn.executemany('INSERT INTO vulnerabilities (name, category) VALUES (?, ?)',
+                         [(f'vulnerability{i}', f'category{i % 5}') for i in range(100)])
+        conn.executemany(f'''
+            INSERT INTO assets (name, {', '.join(risk_engine.CRITERIA)}, threat_probability)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [(f'asset{i}',) + tuple(rng.uniform(0, 10) for _ in risk_engine.CRITERIA) + (rng.uniform(1, 3),)
+              for i in range(assets)])
+        rows = [(rng.randint(1, assets), rng.randint(1, threats), rng.randint(1, 100), rng.uniform(0, 0.9))
+                for _ in range(scenarios)]
+        conn.executemany('''
+            INSERT INTO risk_analysis (asset_id, threat_id, vulnerability_id, control_effectiveness)
+            VALUES (?, ?, ?, ?)
+        ''', rows)
+        # Вероятности по угрозам для половины пар (актив, угроза), встречающихся в сценариях
+        pairs = sorted({(asset_id, threat_id) for asset_id, threat_id, _, _ in rows})
+        conn.executemany('''
+            INSERT INTO asset_threat_probabilities (asset_id, threat_id, expert_id, probability)
+            VALUES (?, ?, ?, ?)
+        ''', [(asset_id, threat_id, expert_id, rng.uniform(1, 3))
+              for asset_id, threat_id in pairs[::2] for expert_id in range(1, experts + 1)])
+        aggregation.refresh_threat_likelihoods(conn)
+        conn.commit()
+
+
+# Построчный расчёт: запись анализа рисков → словарь с вероятностью по угрозе или актива, полная сортировка
+def python_top(conn, weights, top):
+    assets = {row[0]: row[1:] for row in conn.execute('''
+        SELECT id, life_health, economy, ecology, dependency, social, international, threat_probability FROM assets
+    ''')}
+    likelihoods = {(row[0], row[1]): row[2] for row in conn.execute('SELECT asset_id, threat_id, probability FROM threat_likelihoods')}
+    risks = []
+    for risk_id, asset_id, threat_id, effectiveness in conn.execute('''
+        SELECT id, asset_id, threat_id, control_effectiveness FROM risk_analysis
+    '''):
+        asset = assets[asset_id]
+        impact = 1 + sum(score * weight for score, weight in zip(asset[:6], weights)) / 10 * 2
+        probability = likelihoods.get((asset_id, threat_id), asset[6])
+        risks.append((-(impact * probability * (1 - (effectiveness or 0))), risk_id))
+    risks.sort()
+    return [risk_id for _, risk_id in risks[:top]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Риски по сценариям (актив, угроза, уязвимость)')
+    parser.add_argument('--root', default=ROOT, help='каталог с risk_scenarios.py')
+    parser.add_argument('--scenarios', type=int, default=500000)
+    parser.add_argument('--assets', type=int, default=5000)
+    parser.add_argument('--threats', type=int, default=50)
+    parser.add_argument('--experts', type=int, default=3)
+    parser.add_argument('--top', type=int, default=50)
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.abspath(args.root))
+    import risk_engine
+    import risk_scenarios
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, 'risk_assessment.db')
+        create_database(path, args.scenarios, args.assets, args.threats, args.experts)
+        conn = sqlite3.connect(path)
+        weights = conn.execute(f'SELECT {", ".join(risk_engine.CRITERIA)} FROM criteria_weights').fetchone()
+
+        timings = {'load': [], 'compute': [], 'top': [], 'python': []}
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            scenarios = risk_scenarios.load(conn)
+            register = risk_engine.load_register(conn)
+            loaded = time.perf_counter()
+            result = risk_scenarios.compute(scenarios, register, weights)
+            computed = time.perf_counter()
+            rows = risk_scenarios.result_rows(conn, result, risk_scenarios.top_indices(result, args.top))
+            timings['load'].append(loaded - start)
+            timings['compute'].append(computed - loaded)
+            timings['top'].append(time.perf_counter() - computed)
+
+            start = time.perf_counter()
+            expected = python_top(conn, weights, args.top)
+            timings['python'].append(time.perf_counter() - start)
+        assert [row['risk_id'] for row in rows] == expected
+
+    print(f'scenarios: {args.scenarios}, assets: {args.assets}, threats: {args.threats}, top: {args.top}')
+    for name, values in timings.items():
+        print(f'{name:<8} (s): min {min(values):.3f}  max {max(values):.3f}')
+
+
+if __name__ == '__main__':
+    main()
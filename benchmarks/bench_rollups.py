@@ -0,0 +1,138 @@
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+# Сводки остаточного риска по владельцам, угрозам и категориям уязвимостей (rollups) на синтетической базе:
+# построение куба, сводка и детализация по кубу из кэша в сравнении с GROUP BY в SQLite на каждый запрос.
+#
+#   python benchmarks/bench_rollups.py [--scenarios 500000] [--assets 5000] [--owners 200] [--threats 50]
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def create_database(path, scenarios, assets, owners, threats, experts):
+    import aggregation
+    import migrations
+    import risk_engine
+
+    rng = random.Random(1)
+    with sqlite3.connect(path) as conn:
+        migrations.migrate(conn)
+        conn.execute('''
+            INSERT INTO criteria_weights (life_health, economy, ecology, dependency, social, international)
+            VALUES (0.419, 0.252, 0.099, 0.144, 0.051, 0.035)
+        ''')
+        conn.executemany('INSERT INTO experts (name) VALUES (?)', [(f'expert{i}',) for i in range(experts)])
+        conn.executemany('INSERT INTO asset_owners (name) VALUES (?)', [(f'owner{i}',) for i in range(owners)])
+        conn.executemany('INSERT INTO threats (name) VALUES (?)', [(f'threat{i}',) for i in range(threats)])
+        conn.executemany('INSERT INTO vulnerabilities (name, category) VALUES (?, ?)',
+                         [(f'vulnerability{i}', f'category{i % 5}') for i in range(100)])
+        conn.executemany(f'''
+            INSERT INTO assets (name, {', '.join(risk_engine.CRITERIA)}, threat_probability)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [(f'asset{i}',) + tuple(rng.uniform(0, 10) for _ in risk_engine.CRITERIA) + (rng.uniform(1, 3),)
+              for i in range(assets)])
+        # id владельцев смещены на число владельцев из начальных данных; у 5 % записей владелец не указан
+        first_owner = conn.execute('SELECT MIN(id) FROM asset_owners WHERE name = ?', ('owner0',)).fetchone()[0]
+        rows = [(rng.randint(1, assets), None if rng.random() < 0.05 else first_owner + rng.randrange(owners),
+                 rng.randint(1, threats), rng.randint(1, 100), rng.uniform(0, 0.9))
+                for _ in range(scenarios)]
+        conn.executemany('''
+            INSERT INTO risk_analysis (asset_id, asset_owner_id, threat_id, vulnerability_id, control_effectiveness)
+            VALUES (?, ?, ?, ?, ?)
+        ''', rows)
+        pairs = sorted({(asset_id, threat_id) for asset_id, _, threat_id, _, _ in rows})
+        conn.executemany('''
+            INSERT INTO asset_threat_probabilities (asset_id, threat_id, expert_id, probability)
+            VALUES (?, ?, ?, ?)
+        ''', [(asset_id, threat_id, expert_id, rng.uniform(1, 3))
+              for asset_id, threat_id in pairs[::2] for expert_id in range(1, experts + 1)])
+        aggregation.refresh_threat_likelihoods(conn)
+        conn.commit()
+
+
+# Сумма остаточного риска по владельцам одним запросом с расчётом риска сценария в SQL
+def sql_rollup(conn, weights, where='', params=()):
+    impact = ' + '.join(f'a.{name} * {weight}' for name, weight in zip(
+        ('life_health', 'economy', 'ecology', 'dependency', 'social', 'international'), weights))
+    return conn.execute(f'''
+        SELECT ra.asset_owner_id, COUNT(*),
+               SUM((1 + ({impact}) / 10 * 2) * COALESCE(tl.probability, a.threat_probability)
+                   * (1 - IFNULL(ra.control_effectiveness, 0)))
+        FROM risk_analysis ra
+        JOIN assets a ON a.id = ra.asset_id
+        LEFT JOIN threat_likelihoods tl ON tl.asset_id = ra.asset_id AND tl.threat_id = ra.threat_id
+        {where}
+        GROUP BY ra.asset_owner_id
+    ''', params).fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Сводки остаточного риска')
+    parser.add_argument('--root', default=ROOT, help='каталог с rollups.py')
+    parser.add_argument('--scenarios', type=int, default=500000)
+    parser.add_argument('--assets', type=int, default=5000)
+    parser.add_argument('--owners', type=int, default=200)
+    parser.add_argument('--threats', type=int, default=50)
+    parser.add_argument('--experts', type=int, default=3)
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.abspath(args.root))
+    import risk_engine
+    import rollups
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, 'risk_assessment.db')
+        create_database(path, args.scenarios, args.assets, args.owners, args.threats, args.experts)
+        conn = sqlite3.connect(path)
+        weights = conn.execute(f'SELECT {", ".join(risk_engine.CRITERIA)} FROM criteria_weights').fetchone()
+
+        timings = {'build': [], 'rollup': [], 'drill': [], 'invalidate': [], 'sql': [], 'sql_drill': []}
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            rollups.invalidate(conn)
+            conn.commit()
+            timings['invalidate'].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            entry = rollups.get(conn, path)
+            timings['build'].append(time.perf_counter() - start)
+
+            # Запрос сводки: проверка версий и группировка ячеек куба
+            start = time.perf_counter()
+            result = rollups.rollup(rollups.get(conn, path)['cube'], 'owner')
+            timings['rollup'].append(time.perf_counter() - start)
+
+            # Детализация по владельцу с наибольшим риском (записи без владельца пропускаются)
+            owner_id = next(row['key'] for row in result['rows'] if row['key'] is not None)
+            start = time.perf_counter()
+            drill = rollups.rollup(rollups.get(conn, path)['cube'], 'threat', {'owner': owner_id, 'category': 0})
+            timings['drill'].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            expected = sql_rollup(conn, weights)
+            timings['sql'].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            sql_rollup(conn, weights, 'WHERE ra.asset_owner_id = ?', (owner_id,))
+            timings['sql_drill'].append(time.perf_counter() - start)
+
+        sums = {row['key']: (row['records'], row['residual_risk_sum']) for row in result['rows']}
+        assert len(sums) == len(expected)
+        assert all(sums[owner_id][0] == count and abs(sums[owner_id][1] - total) <= 1e-3 * max(1.0, total)
+                   for owner_id, count, total in expected)
+        cells = len(entry['cube']['records'])
+
+    print(f'scenarios: {args.scenarios}, owners: {args.owners}, threats: {args.threats}, cube cells: {cells}, '
+          f'drill-down rows: {len(drill["rows"])}')
+    for name, values in timings.items():
+        print(f'{name:<11} (s): min {min(values):.4f}  max {max(values):.4f}')
+
+
+if __name__ == '__main__':
+    main()
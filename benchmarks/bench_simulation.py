@@ -0,0 +1,52 @@
+import argparse
+import os
+import sys
+import time
+
+# Время моделирования Монте-Карло (simulation.simulate) на синтетическом реестре
+# без базы данных: assets активов, у каждого experts оценок и experts вероятностей.
+#
+#   python benchmarks/bench_simulation.py [--assets 10000] [--experts 10] [--draws 100000] [--root <каталог с app.py>]
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def synthetic_inputs(assets, experts, seed):
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    return {
+        'ids': np.arange(1, assets + 1),
+        'names': [f'asset{i}' for i in range(assets)],
+        'criticality': rng.uniform(0, 10, (assets, experts)),
+        'evaluation_counts': rng.integers(1, experts + 1, assets),
+        'probability': rng.uniform(1, 3, (assets, experts)),
+        'probability_counts': rng.integers(1, experts + 1, assets),
+        'effectiveness': rng.uniform(0, 0.9, assets),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Время моделирования Монте-Карло')
+    parser.add_argument('--root', default=ROOT, help='каталог с simulation.py')
+    parser.add_argument('--assets', type=int, default=10000)
+    parser.add_argument('--experts', type=int, default=10)
+    parser.add_argument('--draws', type=int, default=100000)
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.abspath(args.root))
+    import simulation
+
+    inputs = synthetic_inputs(args.assets, args.experts, 0)
+    timings = []
+    for run in range(args.runs):
+        start = time.perf_counter()
+        simulation.simulate(inputs, args.draws, seed=run)
+        timings.append(time.perf_counter() - start)
+    print(f'assets: {args.assets}, experts: {args.experts}, draws: {args.draws}')
+    print(f'simulate (s): min {min(timings):.3f}  max {max(timings):.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+# Замер времени импорта app.py и потребления памяти рабочим процессом до первого запроса.
+# Каждый прогон выполняется в новом интерпретаторе на копии базы данных во временном каталоге.
+# С --fresh каждый прогон начинается без базы (холодный старт: создание схемы и начальных данных).
+#
+#   python benchmarks/bench_startup.py [--runs 10] [--fresh] [--root <каталог с app.py>]
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_PROBE = '''
+import json, resource, sys, time
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+import app
+import_time = time.perf_counter() - start
+import_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+client = app.app.test_client()
+start = time.perf_counter()
+client.get('/login')
+login_time = time.perf_counter() - start
+print(json.dumps({{
+    'import_s': import_time,
+    'import_rss_mb': import_rss / 1024,
+    'login_s': login_time,
+    'rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    'heavy_modules': sorted(m for m in ('numpy', 'matplotlib', 'seaborn') if m in sys.modules),
+}}))
+'''
+
+
+def run_probe(root, workdir):
+    output = subprocess.run(
+        [sys.executable, '-c', _PROBE.format(root=root)],
+        cwd=workdir, check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Время запуска и память рабочего процесса')
+    parser.add_argument('--root', default=ROOT, help='каталог с app.py (например, рабочая копия другой ревизии)')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--fresh', action='store_true', help='каждый прогон на пустом каталоге без базы данных')
+    args = parser.parse_args()
+
+    root = os.path.abspath(args.root)
+    with tempfile.TemporaryDirectory() as workdir:
+        database = os.path.join(root, 'risk_assessment.db')
+        if os.path.exists(database) and not args.fresh:
+            shutil.copy(database, workdir)
+        # Первый прогон прогревает кэш байткода и создаёт недостающие таблицы
+        run_probe(root, workdir)
+        if args.fresh:
+            results = []
+            for _ in range(args.runs):
+                with tempfile.TemporaryDirectory() as fresh_workdir:
+                    results.append(run_probe(root, fresh_workdir))
+        else:
+            results = [run_probe(root, workdir) for _ in range(args.runs)]
+
+    print(f'root: {root}')
+    print(f"runs: {args.runs}{' (fresh database)' if args.fresh else ''}")
+    for key, label in (('import_s', 'import app (s)'), ('login_s', 'first GET /login (s)'),
+                       ('import_rss_mb', 'RSS after import (MB)'), ('rss_mb', 'RSS after /login (MB)')):
+        values = [result[key] for result in results]
+        print(f'{label:<24} median {statistics.median(values):.3f}  min {min(values):.3f}  max {max(values):.3f}')
+    print(f"modules loaded: {', '.join(results[-1]['heavy_modules']) or '-'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+import os
+
+from werkzeug.security import generate_password_hash
+
+import aggregation
+import ahp
+import controls
+import db
+import migrations
+import risk_snapshot
+
+try:
+    import fcntl
+except ImportError:  # Windows: блокировка не нужна для единственного процесса разработки
+    fcntl = None
+
+# Однократная инициализация базы данных: миграции схемы, начальные данные и пересчёт производных данных.
+# Выполняется командой `flask init-db`. При запуске рабочего процесса проверяется только версия схемы;
+# если база не инициализирована или отстаёт, инициализацию выполняет один процесс под файловой
+# блокировкой <база>.lock, остальные дожидаются её и повторно проверяют версию.
+
+
+# Начальные данные: веса критериев, справочники и администратор по умолчанию.
+# Добавляются только в пустые таблицы, поэтому повторный вызов ничего не меняет.
+def seed(conn):
+    cursor = conn.cursor()
+    # Проверяем, есть ли веса критериев, и добавляем фиксированные веса, если таблица пуста
+    cursor.execute('SELECT COUNT(*) FROM criteria_weights')
+    if cursor.fetchone()[0] == 0:
+        cursor.execute('''
+            INSERT INTO criteria_weights (life_health, economy, ecology, dependency, social, international)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (0.419, 0.252, 0.099, 0.144, 0.051, 0.035))
+    # Фиксированные веса — исходный активный набор весов (ahp.py)
+    ahp.ensure_manual_set(conn)
+    # Добавляем начальные значения для реестров
+    cursor.execute('SELECT COUNT(*) FROM asset_owners')
+    if cursor.fetchone()[0] == 0:
+        cursor.executemany('INSERT INTO asset_owners (name) VALUES (?)', [
+            ('IT Department',), ('Operations',), ('Finance',)
+        ])
+    # cursor.execute('SELECT COUNT(*) FROM threats')
+    # if cursor.fetchone()[0] == 0:
+    #     cursor.executemany('INSERT INTO threats (name) VALUES (?)', [
+    #         ('Cyber attack',), ('Physical attack',), ('Data breach',)
+    #     ])
+    cursor.execute('SELECT COUNT(*) FROM taken_measures')
+    if cursor.fetchone()[0] == 0:
+        cursor.executemany('INSERT INTO taken_measures (name) VALUES (?)', [
+            ('Минимизация рисков и выбор контролей',),
+            ('Передача рисков третьей стороне (страхование)',),
+            ('Отказ от риска',),
+            ('Принятие риска',)
+        ])
+    cursor.execute('SELECT COUNT(*) FROM control_measures')
+    if cursor.fetchone()[0] == 0:
+        cursor.executemany('INSERT INTO control_measures (name) VALUES (?)', [
+            ('A.5.1.1 Policies for information Security',),
+            ('A.5.1.2 Review of the policies for information security',),
+            ('A.6.1.1 Information security roles and responsibilities',),
+            ('A.6.1.2 Segregation of duties',),
+            ('A.6.1.3 Contact with authorities',),
+            ('A.6.1.4 Contact with special interest groups',)
+        ])
+    # Создаём администратора по умолчанию, если его нет
+    cursor.execute('SELECT COUNT(*) FROM users WHERE role = ?', ('admin',))
+    if cursor.fetchone()[0] == 0:
+        admin_password = generate_password_hash('admin123')
+        cursor.execute('''
+            INSERT INTO users (username, password_hash, role)
+            VALUES (?, ?, ?)
+        ''', ('admin', admin_password, 'admin'))
+
+
+# Пересчёт производных данных текущим кодом после применения миграций: средние оценки и вероятности
+# (в том числе по угрозам), совокупная эффективность мер контроля, снимок рисков с распространёнными рисками.
+# Выполняется только на актуальной схеме. Фиксация транзакции остаётся за вызывающим кодом.
+def refresh_derived(conn):
+    aggregation.recompute(conn)
+    controls.refresh(conn)
+    risk_snapshot.refresh_all(conn)
+
+
+# Полная инициализация на переданном соединении; возвращает применённые миграции
+def initialize(conn):
+    applied = migrations.migrate(conn)
+    seed(conn)
+    if applied:
+        refresh_derived(conn)
+    else:
+        risk_snapshot.ensure_snapshot(conn)
+    conn.commit()
+    return applied
+
+
+# Проверка при запуске рабочего процесса: при актуальной схеме — один запрос к schema_version.
+# Возвращает True, если инициализация выполнялась в этом процессе.
+def ensure_database(path):
+    conn = db.connect(path)
+    try:
+        if migrations.is_current(conn):
+            return False
+        with open(f'{path}.lock', 'w') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            # Пока ждали блокировку, базу мог инициализировать другой процесс
+            if migrations.is_current(conn):
+                return False
+            initialize(conn)
+            return True
+    finally:
+        conn.close()
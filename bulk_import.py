@@ -0,0 +1,192 @@
+import csv
+import io
+import json
+
+import aggregation
+import propagation
+import risk_engine
+import risk_snapshot
+
+# Пакетный импорт оценок экспертов, вероятностей угроз и зависимостей активов из CSV или JSON.
+# Все строки проверяются заранее; корректные записываются одним executemany в одной транзакции,
+# ошибочные возвращаются списком с номером строки и не прерывают импорт.
+# Агрегированные оценки пересчитываются одним пакетом по всем затронутым активам.
+
+KINDS = ('evaluations', 'probabilities', 'dependencies')
+
+# Допустимые диапазоны значений (как в формах добавления)
+SCORE_RANGE = (0, 10)
+PROBABILITY_RANGE = (1, 3)
+
+# Ошибка строки с парой (актив, эксперт), которая уже есть в базе или выше в файле
+DUPLICATE_MESSAGE = 'этот эксперт уже оценил данный актив'
+
+
+# Разбор файла: список (номер строки, словарь значений).
+# Для CSV номер строки считается с учётом заголовка, для JSON — порядковый номер объекта.
+def parse(text, fmt):
+    if fmt == 'json':
+        data = json.loads(text)
+        if isinstance(data, dict):
+            data = [data]
+        if not isinstance(data, list):
+            raise ValueError('JSON должен содержать список объектов')
+        return [(number, item if isinstance(item, dict) else {}) for number, item in enumerate(data, 1)]
+    if fmt == 'csv':
+        reader = csv.DictReader(io.StringIO(text))
+        try:
+            return [(number, row) for number, row in enumerate(reader, 2)]
+        except csv.Error as e:
+            raise ValueError(f'некорректный CSV: {e}')
+    raise ValueError(f'Неизвестный формат: {fmt}')
+
+
+# Формат по расширению имени файла
+def detect_format(filename):
+    return 'json' if filename.lower().endswith('.json') else 'csv'
+
+
+# Поиск id по столбцу <name>_id или по названию в столбце <name>
+def _resolve(row, name, by_name, known_ids):
+    raw_id = row.get(f'{name}_id')
+    if raw_id not in (None, ''):
+        try:
+            value = int(raw_id)
+        except (TypeError, ValueError):
+            raise ValueError(f'некорректный {name}_id: {raw_id}')
+        if value not in known_ids:
+            raise ValueError(f'{name}_id {value} не найден')
+        return value
+    raw_name = row.get(name)
+    if raw_name in (None, ''):
+        raise ValueError(f'не указан {name} или {name}_id')
+    value = by_name.get(str(raw_name).strip())
+    if value is None:
+        raise ValueError(f'{name} «{raw_name}» не найден')
+    return value
+
+
+def _number(row, column, low, high):
+    raw = row.get(column)
+    if raw in (None, ''):
+        raise ValueError(f'не указано значение {column}')
+    try:
+        value = float(raw)
+    except (TypeError, ValueError):
+        raise ValueError(f'{column} должно быть числом')
+    if not (low <= value <= high):
+        raise ValueError(f'{column} должно быть в диапазоне от {low} до {high}')
+    return value
+
+
+def _lookup(conn, table):
+    by_name = dict(conn.execute(f'SELECT name, id FROM {table}').fetchall())
+    return by_name, set(by_name.values())
+
+
+# Пары (актив, эксперт), уже имеющиеся в таблице, для затронутых активов
+def _existing_pairs(conn, table, asset_ids):
+    asset_ids = sorted(asset_ids)
+    pairs = set()
+    for start in range(0, len(asset_ids), risk_engine.CHUNK_SIZE):
+        chunk = asset_ids[start:start + risk_engine.CHUNK_SIZE]
+        placeholders = ', '.join('?' * len(chunk))
+        pairs.update(conn.execute(
+            f'SELECT asset_id, expert_id FROM {table} WHERE asset_id IN ({placeholders})', chunk).fetchall())
+    return pairs
+
+
+# Строки, пропущенные при вставке: пару (актив, эксперт) записал другой запрос после проверки _existing_pairs.
+# После вставки транзакция удерживает блокировку записи, а id в таблицах с AUTOINCREMENT возрастают,
+# поэтому вставленные строки — последние inserted по id. Возвращает вставленные строки valid.
+def _skip_concurrent(conn, table, valid, inserted, numbers, errors):
+    ours = set(conn.execute(f'SELECT asset_id, expert_id FROM {table} ORDER BY id DESC LIMIT ?', (inserted,)).fetchall())
+    for row in valid:
+        if row[:2] not in ours:
+            errors.append((numbers[row[:2]], DUPLICATE_MESSAGE))
+    return [row for row in valid if row[:2] in ours]
+
+
+# Зависимости активов (asset, depends_on, weight — по умолчанию 1): существующая зависимость получает новый вес.
+# Распространённые риски пересчитываются один раз для всех затронутых активов.
+def _import_dependencies(conn, rows):
+    assets_by_name, asset_ids = _lookup(conn, 'assets')
+    errors = []
+    valid = {}
+    for number, row in rows:
+        try:
+            asset_id = _resolve(row, 'asset', assets_by_name, asset_ids)
+            depends_on_id = _resolve(row, 'depends_on', assets_by_name, asset_ids)
+            if asset_id == depends_on_id:
+                raise ValueError('актив не может зависеть от самого себя')
+            weight = 1.0 if row.get('weight') in (None, '') else _number(row, 'weight', *propagation.WEIGHT_RANGE)
+            if weight <= propagation.WEIGHT_RANGE[0]:
+                raise ValueError(f'weight должно быть больше {propagation.WEIGHT_RANGE[0]}')
+        except ValueError as e:
+            errors.append((number, str(e)))
+            continue
+        valid[(asset_id, depends_on_id)] = weight
+
+    conn.executemany('''
+        INSERT INTO asset_dependencies (asset_id, depends_on_id, weight) VALUES (?, ?, ?)
+        ON CONFLICT (asset_id, depends_on_id) DO UPDATE SET weight = excluded.weight
+    ''', ((asset_id, depends_on_id, weight) for (asset_id, depends_on_id), weight in valid.items()))
+    affected = sorted({asset_id for pair in valid for asset_id in pair})
+    propagation.refresh_assets(conn, affected)
+    errors.sort()
+    return {'inserted': len(valid), 'assets': len(affected), 'errors': errors}
+
+
+# Импорт разобранных строк вида kind ('evaluations', 'probabilities' или 'dependencies').
+# Возвращает {'inserted': число записей, 'assets': число затронутых активов, 'errors': [(строка, сообщение)]}.
+# Фиксация транзакции остаётся за вызывающим кодом.
+def import_rows(conn, kind, rows):
+    if kind not in KINDS:
+        raise ValueError(f'Неизвестный тип данных: {kind}')
+    if kind == 'dependencies':
+        return _import_dependencies(conn, rows)
+    assets_by_name, asset_ids = _lookup(conn, 'assets')
+    experts_by_name, expert_ids = _lookup(conn, 'experts')
+
+    errors = []
+    parsed = []
+    for number, row in rows:
+        try:
+            asset_id = _resolve(row, 'asset', assets_by_name, asset_ids)
+            expert_id = _resolve(row, 'expert', experts_by_name, expert_ids)
+            if kind == 'evaluations':
+                values = tuple(_number(row, criterion, *SCORE_RANGE) for criterion in risk_engine.CRITERIA)
+            else:
+                values = (_number(row, 'probability', *PROBABILITY_RANGE),)
+        except ValueError as e:
+            errors.append((number, str(e)))
+            continue
+        parsed.append((number, asset_id, expert_id, values))
+
+    table = 'asset_evaluations' if kind == 'evaluations' else 'threat_probabilities'
+    seen = _existing_pairs(conn, table, {asset_id for _, asset_id, _, _ in parsed})
+    valid = []
+    numbers = {}
+    for number, asset_id, expert_id, values in parsed:
+        if (asset_id, expert_id) in seen:
+            errors.append((number, DUPLICATE_MESSAGE))
+            continue
+        seen.add((asset_id, expert_id))
+        numbers[(asset_id, expert_id)] = number
+        valid.append((asset_id, expert_id) + values)
+
+    columns = risk_engine.CRITERIA if kind == 'evaluations' else ('probability',)
+    inserted = conn.executemany(f'''
+        INSERT INTO {table} (asset_id, expert_id, {', '.join(columns)})
+        VALUES (?, ?, {', '.join('?' * len(columns))})
+        ON CONFLICT (asset_id, expert_id) DO NOTHING
+    ''', valid).rowcount
+    if inserted < len(valid):
+        valid = _skip_concurrent(conn, table, valid, inserted, numbers, errors)
+
+    affected = sorted({row[0] for row in valid})
+    if affected:
+        aggregation.recompute(conn, affected)
+    risk_snapshot.refresh_assets(conn, affected)
+    errors.sort()
+    return {'inserted': len(valid), 'assets': len(affected), 'errors': errors}
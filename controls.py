@@ -0,0 +1,186 @@
+import risk_engine
+
+# Несколько мер контроля на запись анализа рисков (risk_controls: запись × мера контроля × эффективность меры).
+# Меры действуют независимо, поэтому совокупная эффективность записи — 1 − Π(1 − eᵢ).
+# Расчёт пакетный: связи читаются плоскими массивами, произведение по записям считается как сумма
+# log(1 − eᵢ) по группам (np.bincount), без цикла Python по записям.
+# Совокупная эффективность хранится в risk_analysis.control_effectiveness, откуда её читают все расчёты
+# (снимок рисков, моделирование, сценарии); запись без мер контроля сохраняет эффективность, введённую в форме.
+# risk_analysis.control_measure_id — основная мера записи (выбирается в форме анализа рисков).
+# Предлагаемые меры (implemented = 0) в эффективности не учитываются: из них подбираются меры
+# для внедрения в пределах бюджета (portfolio.py).
+
+# Точность хранения совокупной эффективности: одна мера с эффективностью 0.7 даёт ровно 0.7
+DECIMALS = 6
+
+# Основная мера записи — первая из внедрённых
+_FIRST_IMPLEMENTED = 'SELECT MIN(control_measure_id) FROM risk_controls WHERE risk_id = ? AND implemented = 1'
+
+
+# Совокупная эффективность size групп: groups — номер группы каждой связи, effectiveness — эффективность меры.
+# Группы без связей получают 0.
+def combine(groups, effectiveness, size):
+    import numpy as np
+
+    # log1p(−1) = −inf, exp(−inf) = 0: мера с эффективностью 1 даёт совокупную эффективность 1
+    with np.errstate(divide='ignore'):
+        log_remaining = np.log1p(-np.asarray(effectiveness, dtype=float))
+    return 1 - np.exp(np.bincount(groups, weights=log_remaining, minlength=size))
+
+
+# Идентификаторы записей во временной таблице, чтобы обойтись без ограничения на число параметров
+def _stage_risk_ids(conn, risk_ids):
+    conn.execute('CREATE TEMP TABLE IF NOT EXISTS recompute_risks (risk_id INTEGER PRIMARY KEY)')
+    conn.execute('DELETE FROM temp.recompute_risks')
+    conn.executemany('INSERT OR IGNORE INTO temp.recompute_risks (risk_id) VALUES (?)', ((risk_id,) for risk_id in risk_ids))
+
+
+# Внедрённые меры контроля для всех (risk_ids=None) или указанных записей: плоские массивы id записи и эффективности.
+# Строки читаются сразу в массив (np.fromiter), без промежуточного списка кортежей.
+def load_links(conn, risk_ids=None):
+    import itertools
+    import numpy as np
+
+    where = ''
+    if risk_ids is not None:
+        _stage_risk_ids(conn, risk_ids)
+        where = 'AND risk_id IN (SELECT risk_id FROM temp.recompute_risks)'
+    values = np.fromiter(itertools.chain.from_iterable(conn.execute(f'''
+        SELECT risk_id, effectiveness FROM risk_controls WHERE implemented = 1 {where} ORDER BY risk_id
+    ''')), dtype=float).reshape(-1, 2)
+    return {'risk_ids': values[:, 0].astype(np.int64), 'effectiveness': values[:, 1]}
+
+
+# Совокупная эффективность по связям: (id записей по возрастанию, эффективность)
+def combined_effectiveness(links):
+    import numpy as np
+
+    risk_ids, groups = np.unique(links['risk_ids'], return_inverse=True)
+    return risk_ids, np.round(combine(groups.reshape(-1), links['effectiveness'], len(risk_ids)), DECIMALS)
+
+
+# Пересчёт совокупной эффективности в risk_analysis для записей с внедрёнными мерами: всех (risk_ids=None)
+# или из указанных. Возвращает id активов изменённых записей для обновления снимка рисков.
+# Фиксация транзакции остаётся за вызывающим кодом.
+def refresh(conn, risk_ids=None):
+    ids, values = combined_effectiveness(load_links(conn, risk_ids))
+    combined = dict(zip(ids.tolist(), values.tolist()))
+    # Временная таблица для указанных записей уже заполнена в load_links
+    source = 'risk_controls WHERE implemented = 1' if risk_ids is None else 'temp.recompute_risks'
+    changed, assets = [], set()
+    for risk_id, asset_id, effectiveness in conn.execute(f'''
+        SELECT id, asset_id, control_effectiveness FROM risk_analysis WHERE id IN (SELECT risk_id FROM {source})
+    '''):
+        if risk_id in combined and combined[risk_id] != effectiveness:
+            changed.append((combined[risk_id], risk_id))
+            assets.add(asset_id)
+    conn.executemany('UPDATE risk_analysis SET control_effectiveness = ? WHERE id = ?', changed)
+    return sorted(asset_id for asset_id in assets if asset_id is not None)
+
+
+# Меры контроля записи: [(id меры, название, эффективность, внедрена)] по названию
+def risk_controls(conn, risk_id):
+    return conn.execute('''
+        SELECT rc.control_measure_id, cm.name, rc.effectiveness, rc.implemented
+        FROM risk_controls rc
+        JOIN control_measures cm ON cm.id = rc.control_measure_id
+        WHERE rc.risk_id = ?
+        ORDER BY cm.name
+    ''', (risk_id,)).fetchall()
+
+
+# Строки (id записи, id меры, эффективность, внедрена)
+def _upsert(conn, rows):
+    conn.executemany('''
+        INSERT INTO risk_controls (risk_id, control_measure_id, effectiveness, implemented)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT (risk_id, control_measure_id) DO UPDATE SET
+            effectiveness = excluded.effectiveness,
+            implemented = excluded.implemented
+    ''', rows)
+
+
+# Добавление меры к записи или изменение её эффективности и состояния (внедрена или предлагается).
+# Если у записи нет основной меры, ею становится эта внедрённая мера. Возвращает id активов для обновления снимка рисков.
+def set_control(conn, risk_id, control_measure_id, effectiveness, implemented=True):
+    previous = conn.execute('SELECT implemented FROM risk_controls WHERE risk_id = ? AND control_measure_id = ?',
+                            (risk_id, control_measure_id)).fetchone()
+    _upsert(conn, [(risk_id, control_measure_id, effectiveness, int(implemented))])
+    if not implemented:
+        # Внедрённая мера переведена в предлагаемые: эффективность записи пересчитывается, как при удалении
+        return _after_removal(conn, risk_id, control_measure_id) if previous and previous[0] else []
+    conn.execute('UPDATE risk_analysis SET control_measure_id = ? WHERE id = ? AND control_measure_id IS NULL',
+                 (control_measure_id, risk_id))
+    return refresh(conn, [risk_id])
+
+
+# Основная мера и эффективность записи после того, как мера перестала быть внедрённой
+def _after_removal(conn, risk_id, control_measure_id):
+    conn.execute(f'''
+        UPDATE risk_analysis
+        SET control_measure_id = ({_FIRST_IMPLEMENTED})
+        WHERE id = ? AND control_measure_id = ?
+    ''', (risk_id, risk_id, control_measure_id))
+    if conn.execute('SELECT 1 FROM risk_controls WHERE risk_id = ? AND implemented = 1 LIMIT 1', (risk_id,)).fetchone() is None:
+        conn.execute('UPDATE risk_analysis SET control_effectiveness = NULL WHERE id = ?', (risk_id,))
+        return [row[0] for row in conn.execute('SELECT asset_id FROM risk_analysis WHERE id = ?', (risk_id,))]
+    return refresh(conn, [risk_id])
+
+
+# Удаление меры из записи; если она была основной, основной становится другая внедрённая мера записи.
+# Запись без оставшихся внедрённых мер получает пустую эффективность.
+# Возвращает id активов для обновления снимка рисков или None, если такой меры у записи нет.
+def remove_control(conn, risk_id, control_measure_id):
+    previous = conn.execute('SELECT implemented FROM risk_controls WHERE risk_id = ? AND control_measure_id = ?',
+                            (risk_id, control_measure_id)).fetchone()
+    if previous is None:
+        return None
+    conn.execute('DELETE FROM risk_controls WHERE risk_id = ? AND control_measure_id = ?', (risk_id, control_measure_id))
+    return _after_removal(conn, risk_id, control_measure_id) if previous[0] else []
+
+
+# Внедрение предлагаемых мер control_measure_ids во всех записях, где они предложены.
+# Записи без основной меры получают основной первую внедрённую. Возвращает id активов для обновления снимка рисков.
+def implement(conn, control_measure_ids):
+    control_measure_ids = list(control_measure_ids)
+    risk_ids = set()
+    for start in range(0, len(control_measure_ids), risk_engine.CHUNK_SIZE):
+        chunk = control_measure_ids[start:start + risk_engine.CHUNK_SIZE]
+        placeholders = ', '.join('?' * len(chunk))
+        risk_ids.update(row[0] for row in conn.execute(f'''
+            SELECT risk_id FROM risk_controls WHERE implemented = 0 AND control_measure_id IN ({placeholders})
+        ''', chunk))
+        conn.execute(f'UPDATE risk_controls SET implemented = 1 WHERE implemented = 0 AND control_measure_id IN ({placeholders})', chunk)
+    if not risk_ids:
+        return []
+    risk_ids = sorted(risk_ids)
+    conn.executemany(f'UPDATE risk_analysis SET control_measure_id = ({_FIRST_IMPLEMENTED}) WHERE id = ? AND control_measure_id IS NULL',
+                     [(risk_id, risk_id) for risk_id in risk_ids])
+    return refresh(conn, risk_ids)
+
+
+# Основная мера из формы анализа рисков для записей rows [(id записи, прежняя основная мера)]:
+# мера control_measure_id с эффективностью effectiveness заменяет прежнюю основную, остальные меры записей сохраняются.
+# Без меры основной становится другая мера записи. У записей с мерами эффективность пересчитывается по ним,
+# у записей без мер остаётся введённой в форме. Возвращает id активов для обновления снимка рисков.
+def set_primary(conn, rows, control_measure_id, effectiveness):
+    conn.executemany('DELETE FROM risk_controls WHERE risk_id = ? AND control_measure_id = ?',
+                     [(risk_id, previous) for risk_id, previous in rows
+                      if previous is not None and previous != control_measure_id])
+    if control_measure_id is not None:
+        _upsert(conn, [(risk_id, control_measure_id, effectiveness or 0, 1) for risk_id, _ in rows])
+    conn.executemany(f'''
+        UPDATE risk_analysis
+        SET control_measure_id = IFNULL(?, ({_FIRST_IMPLEMENTED}))
+        WHERE id = ?
+    ''', [(control_measure_id, risk_id, risk_id) for risk_id, _ in rows])
+    return refresh(conn, [risk_id for risk_id, _ in rows])
+
+
+# Удаление всех мер записей (принятая мера не предполагает контролей или записи удаляются).
+# Эффективность записей не меняется: её задаёт форма.
+def clear_controls(conn, risk_ids):
+    risk_ids = list(risk_ids)
+    for start in range(0, len(risk_ids), risk_engine.CHUNK_SIZE):
+        chunk = risk_ids[start:start + risk_engine.CHUNK_SIZE]
+        conn.execute(f'DELETE FROM risk_controls WHERE risk_id IN ({", ".join("?" * len(chunk))})', chunk)
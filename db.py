@@ -0,0 +1,57 @@
+import os
+import sqlite3
+
+from flask import current_app, g
+
+# Подключение к базе данных SQLite.
+# В пределах запроса (или команды flask) используется одно соединение, которое хранится в g
+# и закрывается по окончании контекста приложения. Путь к базе задаётся переменной окружения
+# RISK_ASSESSMENT_DB (по умолчанию risk_assessment.db в текущем каталоге).
+
+DEFAULT_PATH = 'risk_assessment.db'
+
+# Ожидание освобождения блокировки записи другим процессом, мс
+BUSY_TIMEOUT_MS = 5000
+
+# Настройки соединения:
+#   journal_mode=WAL     — читатели не блокируют писателя и наоборот;
+#   synchronous=NORMAL   — в режиме WAL безопасно при сбое процесса, fsync только при контрольной точке;
+#   mmap_size            — чтение страниц через отображение файла в память (256 МБ);
+#   cache_size           — кэш страниц соединения (отрицательное значение — в КиБ, 16 МБ).
+PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('busy_timeout', BUSY_TIMEOUT_MS),
+    ('synchronous', 'NORMAL'),
+    ('mmap_size', 256 * 1024 * 1024),
+    ('cache_size', -16 * 1024),
+)
+
+
+def database_path():
+    return os.environ.get('RISK_ASSESSMENT_DB', DEFAULT_PATH)
+
+
+# Новое соединение с применёнными PRAGMAS (для скриптов и кода вне контекста приложения)
+def connect(path=None):
+    conn = sqlite3.connect(path or database_path(), timeout=BUSY_TIMEOUT_MS / 1000)
+    for name, value in PRAGMAS:
+        conn.execute(f'PRAGMA {name} = {value}')
+    return conn
+
+
+# Соединение текущего запроса; открывается при первом обращении
+def get_db():
+    if 'db' not in g:
+        g.db = connect(current_app.config['DATABASE'])
+    return g.db
+
+
+def close_db(exception=None):
+    conn = g.pop('db', None)
+    if conn is not None:
+        conn.close()
+
+
+def init_app(app):
+    app.config.setdefault('DATABASE', database_path())
+    app.teardown_appcontext(close_db)
@@ -0,0 +1,105 @@
+import csv
+import io
+import json
+
+import risk_engine
+import risk_scenarios
+
+# Потоковая выгрузка реестра рисков (соединение risk_analysis со справочниками).
+# Строки читаются курсором порциями по FETCH_SIZE; риски каждой порции рассчитываются
+# risk_scenarios.compute_rows — так же, как на странице критичности и в /risk_scenarios.json
+# (вероятность угрозы для актива, иначе общая вероятность актива; эффективность защиты своей записи).
+# Порция сразу отдаётся потребителю, поэтому расход памяти не зависит от размера реестра.
+
+FETCH_SIZE = 1000
+
+EXPORT_COLUMNS = (
+    'risk_id', 'asset_id', 'asset', 'asset_owner', 'threat', 'vulnerability', 'vulnerability_category',
+    'taken_measure', 'control_measure', 'control_effectiveness',
+    'impact', 'likelihood', 'risk_score', 'residual_risk', 'risk_level',
+)
+
+_EXPORT_QUERY = '''
+    SELECT ra.id, a.id, a.name, ao.name, t.name, v.name, v.category, tm.name, cm.name, ra.control_effectiveness,
+           ra.threat_id
+    FROM risk_analysis ra
+    JOIN assets a ON ra.asset_id = a.id
+    LEFT JOIN asset_owners ao ON ra.asset_owner_id = ao.id
+    LEFT JOIN threats t ON ra.threat_id = t.id
+    LEFT JOIN vulnerabilities v ON ra.vulnerability_id = v.id
+    LEFT JOIN taken_measures tm ON ra.taken_measure_id = tm.id
+    LEFT JOIN control_measures cm ON ra.control_measure_id = cm.id
+    ORDER BY ra.id
+'''
+
+
+# Генератор строк реестра в порядке EXPORT_COLUMNS; у записей без рассчитанного риска
+# (нет весов критериев, полного набора оценок или вероятности) показатели риска пустые
+def iter_register(conn):
+    weights = conn.execute(f'SELECT {", ".join(risk_engine.CRITERIA)} FROM criteria_weights').fetchone()
+    cursor = conn.cursor()
+    cursor.arraysize = FETCH_SIZE
+    cursor.execute(_EXPORT_QUERY)
+    while True:
+        rows = cursor.fetchmany()
+        if not rows:
+            break
+        if weights:
+            result = risk_scenarios.compute_rows(conn, [(row[0], row[1], row[10], row[9]) for row in rows], weights)
+        for i, row in enumerate(rows):
+            if not weights or not result['valid'][i]:
+                yield row[:10] + (None,) * 5
+                continue
+            yield row[:10] + (
+                float(result['impact'][i]),
+                float(result['probability'][i]),
+                float(result['risk_score'][i]),
+                float(result['residual_risk'][i]),
+                risk_engine.RISK_LEVELS[int(result['level'][i])][0],
+            )
+
+
+# Объединение мелких фрагментов в порции примерно по chunk_size символов
+def _chunked(parts, chunk_size=64 * 1024):
+    chunk = []
+    size = 0
+    for part in parts:
+        chunk.append(part)
+        size += len(part)
+        if size >= chunk_size:
+            yield ''.join(chunk)
+            chunk = []
+            size = 0
+    if chunk:
+        yield ''.join(chunk)
+
+
+def _ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(dict(zip(EXPORT_COLUMNS, row)), ensure_ascii=False) + '\n'
+
+
+def _csv_lines(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def iter_ndjson(rows):
+    return _chunked(_ndjson_lines(rows))
+
+
+def iter_csv(rows):
+    return _chunked(_csv_lines(rows))
+
+
+FORMATS = {
+    'ndjson': (iter_ndjson, 'application/x-ndjson'),
+    'csv': (iter_csv, 'text/csv'),
+}
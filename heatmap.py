@@ -0,0 +1,251 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from xml.sax.saxutils import escape
+
+# numpy, matplotlib и пул процессов импортируются внутри функций, чтобы не замедлять запуск рабочих процессов
+
+# Цветовая палитра тепловой карты: Зелёный, Жёлтый, Красный
+HEATMAP_COLORS = ('#4CAF50', '#FFC107', '#F44336')
+# Границы для Низкий (1.0–3.9), Средний (4.0–6.9), Высокий (7.0–9.0)
+HEATMAP_BOUNDARIES = (1.0, 3.9, 6.9, 9.0)
+
+# Способы отрисовки: собственный SVG (по умолчанию) или matplotlib/seaborn (PNG)
+BACKENDS = {'svg': 'svg', 'matplotlib': 'png'}
+
+# Файлы кэша называются по хэшу входных данных: heatmap_<sha256>.svg|png
+_CACHED_FILE = re.compile(r'^heatmap_[0-9a-f]{64}\.(svg|png)$')
+# Любые другие heatmap_*.png (например, старые heatmap_<uuid4>.png) считаются осиротевшими.
+# Незавершённые временные файлы старше этого возраста (сек) удаляются при очистке
+_STALE_TMP_AGE = 3600
+
+
+# Ключ тепловой карты: хэш от названий, impact, остаточных рисков и границ уровней
+def heatmap_key(names, impacts, residual_risks, backend='svg'):
+    payload = json.dumps({
+        'backend': backend,
+        'names': list(names),
+        'impacts': [float(value) for value in impacts],
+        'residual_risks': [float(value) for value in residual_risks],
+        'boundaries': HEATMAP_BOUNDARIES,
+        'colors': HEATMAP_COLORS,
+    }, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+# Отрисовка тепловой карты остаточных рисков в PNG-файл через matplotlib/seaborn.
+# Библиотеки импортируются только здесь: при отрисовке в SVG они не нужны.
+def render_png(path, names, impacts, residual_risks):
+    import numpy as np
+
+    # Set Matplotlib backend to Agg before importing pyplot
+    import matplotlib
+    matplotlib.use('Agg')  # Non-interactive backend
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    from matplotlib.colors import ListedColormap, BoundaryNorm
+
+    data = np.array([impacts, residual_risks]).T
+    cmap = ListedColormap(HEATMAP_COLORS)
+    norm = BoundaryNorm(HEATMAP_BOUNDARIES, cmap.N, clip=True)
+
+    plt.figure(figsize=(8, 4))
+    sns.heatmap(data, xticklabels=['Impact', 'Остаточный риск'], yticklabels=names, annot=True, cmap=cmap, norm=norm, cbar=False)
+    plt.title("Тепловая карта остаточных рисков")
+    plt.tight_layout()
+    plt.savefig(path, format='png')
+    plt.close()
+
+
+# Индексы цветов по правилам BoundaryNorm(HEATMAP_BOUNDARIES, len(HEATMAP_COLORS), clip=True):
+# значения вне границ прижимаются к крайним цветам, интервалы полуоткрытые [b_i, b_i+1)
+def color_indices(values):
+    import numpy as np
+
+    values = np.clip(np.asarray(values, dtype=float), HEATMAP_BOUNDARIES[0], HEATMAP_BOUNDARIES[-1])
+    return np.clip(np.digitize(values, HEATMAP_BOUNDARIES) - 1, 0, len(HEATMAP_COLORS) - 1)
+
+
+# Цвет подписи в ячейке выбирается по яркости фона, как в seaborn
+def _relative_luminance(color):
+    rgb = [int(color[i:i + 2], 16) / 255 for i in (1, 3, 5)]
+    rgb = [c / 12.92 if c <= .03928 else ((c + .055) / 1.055) ** 2.4 for c in rgb]
+    return .2126 * rgb[0] + .7152 * rgb[1] + .0722 * rgb[2]
+
+
+_TEXT_COLORS = tuple('#262626' if _relative_luminance(color) > .408 else '#FFFFFF' for color in HEATMAP_COLORS)
+
+# Геометрия SVG (пиксели)
+_SVG_CELL_WIDTH = 140
+_SVG_CELL_HEIGHT = 22
+_SVG_CHAR_WIDTH = 7
+_SVG_MAX_LABEL_WIDTH = 320
+_SVG_TITLE_HEIGHT = 32
+_SVG_HEADER_HEIGHT = 24
+
+
+# Построение SVG-документа тепловой карты без matplotlib: одна строка на актив,
+# столбцы Impact и Остаточный риск, подписи значений в формате seaborn (.2g)
+def svg_document(names, impacts, residual_risks):
+    import numpy as np
+
+    data = np.column_stack([np.asarray(impacts, dtype=float), np.asarray(residual_risks, dtype=float)])
+    colors = color_indices(data).tolist()
+    labels = [[format(value, '.2g') for value in row] for row in data.tolist()]
+
+    longest = max((len(name) for name in names), default=0)
+    label_width = min(_SVG_MAX_LABEL_WIDTH, longest * _SVG_CHAR_WIDTH + 12)
+    top = _SVG_TITLE_HEIGHT + _SVG_HEADER_HEIGHT
+    width = label_width + 2 * _SVG_CELL_WIDTH + 10
+    height = top + len(names) * _SVG_CELL_HEIGHT + 10
+
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" viewBox="0 0 {width} {height}" '
+        f'font-family="DejaVu Sans, Arial, sans-serif" font-size="12">',
+        f'<text x="{width / 2}" y="{_SVG_TITLE_HEIGHT - 10}" text-anchor="middle" font-size="14">'
+        'Тепловая карта остаточных рисков</text>',
+    ]
+    for column, title in enumerate(('Impact', 'Остаточный риск')):
+        x = label_width + column * _SVG_CELL_WIDTH + _SVG_CELL_WIDTH / 2
+        parts.append(f'<text x="{x}" y="{top - 8}" text-anchor="middle">{title}</text>')
+    for row, name in enumerate(names):
+        y = top + row * _SVG_CELL_HEIGHT
+        middle = y + _SVG_CELL_HEIGHT / 2
+        parts.append(f'<text x="{label_width - 6}" y="{middle}" text-anchor="end" dominant-baseline="central">{escape(name)}</text>')
+        for column in range(2):
+            x = label_width + column * _SVG_CELL_WIDTH
+            color = colors[row][column]
+            parts.append(
+                f'<rect x="{x}" y="{y}" width="{_SVG_CELL_WIDTH}" height="{_SVG_CELL_HEIGHT}" fill="{HEATMAP_COLORS[color]}"/>'
+                f'<text x="{x + _SVG_CELL_WIDTH / 2}" y="{middle}" text-anchor="middle" dominant-baseline="central" '
+                f'fill="{_TEXT_COLORS[color]}">{labels[row][column]}</text>'
+            )
+    parts.append('</svg>')
+    return '\n'.join(parts)
+
+
+# Отрисовка тепловой карты в SVG-файл
+def render_svg(path, names, impacts, residual_risks):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(svg_document(names, impacts, residual_risks))
+
+
+_RENDERERS = {'svg': render_svg, 'matplotlib': render_png}
+
+
+def heatmap_filename(names, impacts, residual_risks, backend='svg'):
+    return f"heatmap_{heatmap_key(names, impacts, residual_risks, backend)}.{BACKENDS[backend]}"
+
+
+# Отрисовка в кэш: запись во временный файл и атомарная замена, чтобы параллельный запрос
+# не увидел недописанный файл; после отрисовки кэш ограничивается max_entries файлами.
+# Выполняется в процессе-отрисовщике, поэтому функция должна оставаться на уровне модуля.
+def _render_to_store(directory, filename, names, impacts, residual_risks, max_entries, backend='svg'):
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, filename)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    _RENDERERS[backend](tmp_path, names, impacts, residual_risks)
+    os.replace(tmp_path, path)
+    evict(directory, max_entries)
+    return filename
+
+
+# Возвращает имя файла, если тепловая карта уже есть в кэше, обновляя время доступа (LRU)
+def lookup(directory, filename):
+    path = os.path.join(directory, filename)
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        return None
+    return filename
+
+
+# Синхронный вариант: возвращает имя файла тепловой карты, отрисовывая её только при отсутствии в кэше
+def cached_heatmap(directory, names, impacts, residual_risks, max_entries, backend='svg'):
+    filename = heatmap_filename(names, impacts, residual_risks, backend)
+    if lookup(directory, filename):
+        return filename
+    return _render_to_store(directory, filename, names, impacts, residual_risks, max_entries, backend)
+
+
+# Пул процессов-отрисовщиков (один на рабочий процесс сервера) и задачи, ожидающие отрисовки
+_executor = None
+_pending = {}
+_lock = threading.Lock()
+
+
+def _get_executor(workers):
+    global _executor
+    if _executor is None:
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        # spawn вместо fork: рабочий процесс сервера многопоточный
+        _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+    return _executor
+
+
+# Неблокирующий запрос тепловой карты: возвращает ('ready', filename), ('pending', filename)
+# или ('error', filename). SVG строится за миллисекунды и отрисовывается сразу; отрисовка
+# через matplotlib ставится в очередь пула не более одного раза на ключ.
+def request_heatmap(directory, names, impacts, residual_risks, max_entries, workers=1, backend='svg'):
+    if backend == 'svg':
+        return 'ready', cached_heatmap(directory, names, impacts, residual_risks, max_entries, backend)
+    filename = heatmap_filename(names, impacts, residual_risks, backend)
+    if lookup(directory, filename):
+        return 'ready', filename
+    with _lock:
+        future = _pending.get(filename)
+        if future is not None and future.done():
+            del _pending[filename]
+            if future.exception() is not None:
+                return 'error', filename
+            return 'ready', filename
+        if future is None:
+            _pending[filename] = _get_executor(workers).submit(
+                _render_to_store, directory, filename, list(names), list(impacts), list(residual_risks), max_entries, backend)
+    return 'pending', filename
+
+
+# Удаление наименее недавно использованных файлов кэша сверх max_entries
+def evict(directory, max_entries):
+    entries = []
+    for entry in os.scandir(directory):
+        if _CACHED_FILE.match(entry.name):
+            try:
+                entries.append((entry.stat().st_mtime, entry.path))
+            except FileNotFoundError:
+                continue
+    entries.sort(reverse=True)
+    removed = 0
+    for _, path in entries[max_entries:]:
+        try:
+            os.remove(path)
+            removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+# Очистка каталога: осиротевшие тепловые карты (старые uuid-файлы, брошенные временные файлы) и вытеснение по LRU
+def cleanup(directory, max_entries):
+    if not os.path.isdir(directory):
+        return 0
+    removed = 0
+    now = time.time()
+    for entry in os.scandir(directory):
+        if not entry.name.startswith('heatmap_') or _CACHED_FILE.match(entry.name):
+            continue
+        if entry.name.endswith('.tmp'):
+            if now - entry.stat().st_mtime < _STALE_TMP_AGE:
+                continue
+        elif not entry.name.endswith(('.png', '.svg')):
+            continue
+        try:
+            os.remove(entry.path)
+            removed += 1
+        except FileNotFoundError:
+            pass
+    return removed + evict(directory, max_entries)
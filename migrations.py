@@ -0,0 +1,489 @@
+# Версионированные миграции схемы базы данных.
+# Применённые версии записываются в таблицу schema_version; каждая миграция выполняется
+# в собственной транзакции (BEGIN IMMEDIATE), поэтому несколько процессов, запущенных одновременно,
+# не применят одну миграцию дважды. Миграции написаны так, чтобы их можно было применить
+# и к базе, созданной до появления schema_version (CREATE ... IF NOT EXISTS).
+# Опубликованные миграции не изменяются: изменения схемы добавляются новой миграцией в конец MIGRATIONS.
+# Миграции содержат только SQL схемы и переноса данных и не вызывают код приложения, который меняется вместе
+# со схемой; производные данные (средние оценки, снимок рисков) пересчитываются после применения всех
+# миграций (bootstrap.refresh_derived).
+
+
+# 1. Исходная схема (таблицы, которые раньше создавал init_db)
+def _initial_schema(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS assets (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE,
+            life_health REAL,
+            economy REAL,
+            ecology REAL,
+            dependency REAL,
+            social REAL,
+            international REAL,
+            threat_probability REAL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL UNIQUE,
+            password_hash TEXT NOT NULL,
+            role TEXT NOT NULL CHECK(role IN ('admin', 'expert')),
+            expert_id INTEGER,
+            FOREIGN KEY (expert_id) REFERENCES experts(id)
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS experts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS asset_evaluations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            asset_id INTEGER,
+            expert_id INTEGER,
+            life_health REAL,
+            economy REAL,
+            ecology REAL,
+            dependency REAL,
+            social REAL,
+            international REAL,
+            FOREIGN KEY (asset_id) REFERENCES assets(id),
+            FOREIGN KEY (expert_id) REFERENCES experts(id)
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS criteria_weights (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            life_health REAL,
+            economy REAL,
+            ecology REAL,
+            dependency REAL,
+            social REAL,
+            international REAL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS threat_probabilities (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            asset_id INTEGER,
+            expert_id INTEGER,
+            probability REAL,
+            FOREIGN KEY (asset_id) REFERENCES assets(id),
+            FOREIGN KEY (expert_id) REFERENCES experts(id)
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS asset_owners (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS threats (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS vulnerabilities (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE,
+            category TEXT NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS taken_measures (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS control_measures (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS risk_analysis (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            asset_id INTEGER,
+            asset_owner_id INTEGER,
+            threat_id INTEGER,
+            vulnerability_id INTEGER,
+            taken_measure_id INTEGER,
+            control_measure_id INTEGER,
+            control_effectiveness REAL,
+            FOREIGN KEY (asset_id) REFERENCES assets(id),
+            FOREIGN KEY (asset_owner_id) REFERENCES asset_owners(id),
+            FOREIGN KEY (threat_id) REFERENCES threats(id),
+            FOREIGN KEY (vulnerability_id) REFERENCES vulnerabilities(id),
+            FOREIGN KEY (taken_measure_id) REFERENCES taken_measures(id),
+            FOREIGN KEY (control_measure_id) REFERENCES control_measures(id)
+        )
+    ''')
+
+
+# 2. Материализованный снимок рисков активов
+def _asset_risk_snapshot(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS asset_risk (
+            asset_id INTEGER PRIMARY KEY,
+            criticality REAL NOT NULL,
+            impact REAL NOT NULL,
+            probability REAL NOT NULL,
+            risk_score REAL NOT NULL,
+            residual_risk REAL NOT NULL,
+            level TEXT NOT NULL,
+            rank INTEGER NOT NULL,
+            FOREIGN KEY (asset_id) REFERENCES assets(id)
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_asset_risk_rank ON asset_risk (rank)')
+
+
+# 3. Индексы по внешним ключам для фильтров, проверок перед удалением и постраничного вывода
+def _foreign_key_indexes(conn):
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_asset_evaluations_expert ON asset_evaluations (expert_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_threat_probabilities_expert ON threat_probabilities (expert_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_risk_analysis_asset ON risk_analysis (asset_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_risk_analysis_owner ON risk_analysis (asset_owner_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_risk_analysis_threat ON risk_analysis (threat_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_risk_analysis_vulnerability ON risk_analysis (vulnerability_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_vulnerabilities_category ON vulnerabilities (category)')
+
+
+# Удаление повторных оценок одного эксперта по одному активу (остаётся последняя запись)
+def _remove_duplicate_pairs(conn, table):
+    conn.execute(f'''
+        DELETE FROM {table}
+        WHERE id NOT IN (SELECT MAX(id) FROM {table} GROUP BY asset_id, expert_id)
+    ''')
+
+
+# 4. Один эксперт — одна оценка и одна вероятность на актив: уникальные индексы вместо проверки COUNT(*).
+# Уникальный индекс (asset_id, expert_id) заменяет прежний неуникальный индекс по тем же столбцам.
+def _unique_expert_assessments(conn):
+    _remove_duplicate_pairs(conn, 'asset_evaluations')
+    _remove_duplicate_pairs(conn, 'threat_probabilities')
+    conn.execute('DROP INDEX IF EXISTS idx_asset_evaluations_asset')
+    conn.execute('DROP INDEX IF EXISTS idx_threat_probabilities_asset')
+    conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS ux_asset_evaluations_asset_expert ON asset_evaluations (asset_id, expert_id)')
+    conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS ux_threat_probabilities_asset_expert ON threat_probabilities (asset_id, expert_id)')
+
+
+# 5. Покрывающий индекс для средней вероятности угроз актива (без обращения к таблице)
+def _threat_probability_covering_index(conn):
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_threat_probabilities_asset_probability ON threat_probabilities (asset_id, probability)')
+
+
+# 6. Версия справочников для сброса кэша справочных данных (reference_data.py).
+# Триггеры увеличивают версию при любом изменении справочников, в том числе из скриптов наполнения;
+# у активов учитывается только изменение названия, а не пересчёт средних оценок.
+def _reference_data_version(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS reference_data_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        )
+    ''')
+    conn.execute('INSERT OR IGNORE INTO reference_data_version (id, version) VALUES (1, 1)')
+    bump = 'BEGIN UPDATE reference_data_version SET version = version + 1 WHERE id = 1; END'
+    for table in ('assets', 'asset_owners', 'threats', 'vulnerabilities', 'taken_measures', 'control_measures'):
+        update = 'UPDATE OF name' if table == 'assets' else 'UPDATE'
+        for event, trigger_event in (('insert', 'INSERT'), ('update', update), ('delete', 'DELETE')):
+            conn.execute(f'CREATE TRIGGER IF NOT EXISTS trg_{table}_{event}_reference_version AFTER {trigger_event} ON {table} {bump}')
+
+
+# 7. Способ агрегирования оценок экспертов (aggregation.py) и компетентность экспертов для взвешенного среднего
+def _aggregation_settings(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS aggregation_settings (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            strategy TEXT NOT NULL CHECK (strategy IN ('mean', 'median', 'trimmed', 'weighted')),
+            trim REAL NOT NULL CHECK (trim >= 0 AND trim < 0.5)
+        )
+    ''')
+    conn.execute("INSERT OR IGNORE INTO aggregation_settings (id, strategy, trim) VALUES (1, 'mean', 0.2)")
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(experts)')]
+    if 'competence' not in columns:
+        conn.execute('ALTER TABLE experts ADD COLUMN competence REAL NOT NULL DEFAULT 1 CHECK (competence > 0)')
+
+
+# Критерии на момент миграции 8 (risk_engine.CRITERIA может измениться вместе со схемой)
+_AHP_CRITERIA = ('life_health', 'economy', 'ecology', 'dependency', 'social', 'international')
+
+
+# 8. Веса критериев методом анализа иерархий (ahp.py): матрицы парных сравнений экспертов с рассчитанными
+# весами и CR, сумма логарифмов суждений для групповой матрицы и наборы весов с активным набором.
+# Текущие веса из criteria_weights сохраняются как активный набор «Исходные веса».
+def _ahp_weights(conn):
+    weights = ', '.join(f'{criterion} REAL NOT NULL' for criterion in _AHP_CRITERIA)
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS weight_sets (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE,
+            source TEXT NOT NULL CHECK (source IN ('manual', 'ahp')),
+            {weights},
+            consistency_ratio REAL,
+            experts INTEGER,
+            updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            active INTEGER NOT NULL DEFAULT 0 CHECK (active IN (0, 1))
+        )
+    ''')
+    conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS ux_weight_sets_active ON weight_sets (active) WHERE active = 1')
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS ahp_comparisons (
+            expert_id INTEGER PRIMARY KEY,
+            judgments TEXT NOT NULL,
+            {weights},
+            lambda_max REAL NOT NULL,
+            consistency_ratio REAL NOT NULL,
+            updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (expert_id) REFERENCES experts(id)
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS ahp_group (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            experts INTEGER NOT NULL,
+            log_sum TEXT NOT NULL
+        )
+    ''')
+    columns = ', '.join(_AHP_CRITERIA)
+    conn.execute(f'''
+        INSERT INTO weight_sets (name, source, {columns}, active)
+        SELECT 'Исходные веса', 'manual', {columns}, 1
+        FROM criteria_weights
+        WHERE NOT EXISTS (SELECT 1 FROM weight_sets)
+        ORDER BY id
+        LIMIT 1
+    ''')
+
+
+# 9. Вероятности угроз в разрезе (актив, угроза): оценки экспертов и агрегированные значения
+# (threat_likelihoods, пересчитываются aggregation.refresh_threat_likelihoods) для расчёта рисков по сценариям.
+def _threat_scoped_probabilities(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS asset_threat_probabilities (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            asset_id INTEGER NOT NULL,
+            threat_id INTEGER NOT NULL,
+            expert_id INTEGER NOT NULL,
+            probability REAL NOT NULL CHECK (probability >= 1 AND probability <= 3),
+            FOREIGN KEY (asset_id) REFERENCES assets(id),
+            FOREIGN KEY (threat_id) REFERENCES threats(id),
+            FOREIGN KEY (expert_id) REFERENCES experts(id)
+        )
+    ''')
+    conn.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS ux_asset_threat_probabilities_asset_threat_expert
+        ON asset_threat_probabilities (asset_id, threat_id, expert_id)
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_asset_threat_probabilities_expert ON asset_threat_probabilities (expert_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_asset_threat_probabilities_threat ON asset_threat_probabilities (threat_id)')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS threat_likelihoods (
+            asset_id INTEGER NOT NULL,
+            threat_id INTEGER NOT NULL,
+            probability REAL NOT NULL,
+            PRIMARY KEY (asset_id, threat_id)
+        ) WITHOUT ROWID
+    ''')
+
+
+# 10. Несколько мер контроля на запись анализа рисков; прежняя мера записи переносится как первая связь
+def _risk_controls(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS risk_controls (
+            risk_id INTEGER NOT NULL,
+            control_measure_id INTEGER NOT NULL,
+            effectiveness REAL NOT NULL CHECK (effectiveness >= 0 AND effectiveness <= 1),
+            PRIMARY KEY (risk_id, control_measure_id),
+            FOREIGN KEY (risk_id) REFERENCES risk_analysis(id),
+            FOREIGN KEY (control_measure_id) REFERENCES control_measures(id)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_risk_controls_control_measure ON risk_controls (control_measure_id)')
+    conn.execute('''
+        INSERT OR IGNORE INTO risk_controls (risk_id, control_measure_id, effectiveness)
+        SELECT id, control_measure_id, IFNULL(control_effectiveness, 0)
+        FROM risk_analysis
+        WHERE control_measure_id IS NOT NULL
+          AND IFNULL(control_effectiveness, 0) BETWEEN 0 AND 1
+    ''')
+
+
+# 11. Стоимость мер контроля и предлагаемые (ещё не внедрённые) меры записей для подбора мер в пределах бюджета
+def _control_portfolio(conn):
+    conn.execute('ALTER TABLE control_measures ADD COLUMN cost REAL CHECK (cost >= 0)')
+    conn.execute('ALTER TABLE risk_controls ADD COLUMN implemented INTEGER NOT NULL DEFAULT 1')
+
+
+# 12. Зависимости активов и распространённые по ним риски (propagation.py)
+def _asset_dependencies(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS asset_dependencies (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            asset_id INTEGER NOT NULL,
+            depends_on_id INTEGER NOT NULL,
+            weight REAL NOT NULL DEFAULT 1 CHECK (weight > 0 AND weight <= 1),
+            CHECK (asset_id <> depends_on_id),
+            FOREIGN KEY (asset_id) REFERENCES assets(id),
+            FOREIGN KEY (depends_on_id) REFERENCES assets(id)
+        )
+    ''')
+    conn.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS ux_asset_dependencies_asset_depends_on
+        ON asset_dependencies (asset_id, depends_on_id)
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_asset_dependencies_depends_on ON asset_dependencies (depends_on_id)')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS asset_propagated_risk (
+            asset_id INTEGER PRIMARY KEY,
+            effective_criticality REAL NOT NULL,
+            effective_impact REAL NOT NULL,
+            effective_probability REAL NOT NULL,
+            propagated_residual_risk REAL NOT NULL,
+            level TEXT,
+            FOREIGN KEY (asset_id) REFERENCES assets(id)
+        )
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_asset_propagated_risk_residual
+        ON asset_propagated_risk (propagated_residual_risk DESC, asset_id)
+    ''')
+
+
+# 13. Версия сводок остаточного риска для сброса кэша куба (rollups.py).
+# Версию увеличивают пересчёты снимка рисков и вероятностей угроз, а не триггеры: триггер на каждую строку
+# risk_analysis удваивает время массового импорта.
+def _risk_rollup_version(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS risk_rollup_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        )
+    ''')
+    conn.execute('INSERT OR IGNORE INTO risk_rollup_version (id, version) VALUES (1, 1)')
+
+
+MIGRATIONS = (
+    (1, 'initial_schema', _initial_schema),
+    (2, 'asset_risk_snapshot', _asset_risk_snapshot),
+    (3, 'foreign_key_indexes', _foreign_key_indexes),
+    (4, 'unique_expert_assessments', _unique_expert_assessments),
+    (5, 'threat_probability_covering_index', _threat_probability_covering_index),
+    (6, 'reference_data_version', _reference_data_version),
+    (7, 'aggregation_settings', _aggregation_settings),
+    (8, 'ahp_weights', _ahp_weights),
+    (9, 'threat_scoped_probabilities', _threat_scoped_probabilities),
+    (10, 'risk_controls', _risk_controls),
+    (11, 'control_portfolio', _control_portfolio),
+    (12, 'asset_dependencies', _asset_dependencies),
+    (13, 'risk_rollup_version', _risk_rollup_version),
+)
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def _create_version_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+# Текущая версия схемы (0 — миграции ещё не применялись)
+def current_version(conn):
+    _create_version_table(conn)
+    return conn.execute('SELECT IFNULL(MAX(version), 0) FROM schema_version').fetchone()[0]
+
+
+# Проверка без записи в базу: применены ли все миграции
+def is_current(conn):
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'schema_version'").fetchone() is None:
+        return False
+    return conn.execute('SELECT IFNULL(MAX(version), 0) FROM schema_version').fetchone()[0] >= LATEST_VERSION
+
+
+# Применение недостающих миграций до версии target (по умолчанию — до последней).
+# Возвращает список применённых миграций [(версия, название)].
+def migrate(conn, target=None):
+    if target is None:
+        target = LATEST_VERSION
+    conn.commit()
+    _create_version_table(conn)
+    conn.commit()
+    applied = []
+    for version, name, migration in MIGRATIONS:
+        if version > target:
+            break
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Проверка внутри транзакции: миграцию мог уже применить другой процесс
+            if conn.execute('SELECT 1 FROM schema_version WHERE version = ?', (version,)).fetchone():
+                conn.rollback()
+                continue
+            migration(conn)
+            conn.execute('INSERT INTO schema_version (version, name) VALUES (?, ?)', (version, name))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append((version, name))
+    return applied
+
+
+# Проверка планов выполнения частых запросов: (название, запрос, параметры, индекс, который должен использоваться)
+HOT_QUERIES = (
+    ('средние оценки актива',
+     'SELECT AVG(life_health), AVG(economy), AVG(ecology), AVG(dependency), AVG(social), AVG(international) '
+     'FROM asset_evaluations WHERE asset_id = ?', (1,), 'ux_asset_evaluations_asset_expert'),
+    ('оценка эксперта по активу',
+     'SELECT id FROM asset_evaluations WHERE asset_id = ? AND expert_id = ?', (1, 1), 'ux_asset_evaluations_asset_expert'),
+    ('оценки эксперта',
+     'SELECT COUNT(*) FROM asset_evaluations WHERE expert_id = ?', (1,), 'idx_asset_evaluations_expert'),
+    ('средняя вероятность угроз актива',
+     'SELECT AVG(probability) FROM threat_probabilities WHERE asset_id = ?', (1,), 'idx_threat_probabilities_asset_probability'),
+    ('вероятность эксперта по активу',
+     'SELECT id FROM threat_probabilities WHERE asset_id = ? AND expert_id = ?', (1, 1), 'ux_threat_probabilities_asset_expert'),
+    ('вероятности эксперта',
+     'SELECT COUNT(*) FROM threat_probabilities WHERE expert_id = ?', (1,), 'idx_threat_probabilities_expert'),
+    ('записи анализа рисков актива',
+     'SELECT COUNT(*) FROM risk_analysis WHERE asset_id = ?', (1,), 'idx_risk_analysis_asset'),
+    ('первая запись анализа рисков по активам',
+     'SELECT asset_id, MIN(id) FROM risk_analysis GROUP BY asset_id', (), 'idx_risk_analysis_asset'),
+    ('анализ рисков по владельцу',
+     'SELECT id FROM risk_analysis WHERE asset_owner_id = ?', (1,), 'idx_risk_analysis_owner'),
+    ('анализ рисков по угрозе',
+     'SELECT id FROM risk_analysis WHERE threat_id = ?', (1,), 'idx_risk_analysis_threat'),
+    ('анализ рисков по уязвимости',
+     'SELECT id FROM risk_analysis WHERE vulnerability_id = ?', (1,), 'idx_risk_analysis_vulnerability'),
+    ('уязвимости категории',
+     'SELECT id FROM vulnerabilities WHERE category = ?', ('',), 'idx_vulnerabilities_category'),
+    ('записи с мерой контроля',
+     'SELECT risk_id FROM risk_controls WHERE control_measure_id = ?', (1,), 'idx_risk_controls_control_measure'),
+    ('активы, зависящие от актива',
+     'SELECT asset_id FROM asset_dependencies WHERE depends_on_id = ?', (1,), 'idx_asset_dependencies_depends_on'),
+    ('наибольшие распространённые риски',
+     'SELECT asset_id FROM asset_propagated_risk ORDER BY propagated_residual_risk DESC, asset_id LIMIT 50', (),
+     'idx_asset_propagated_risk_residual'),
+    ('ранжирование критичности',
+     'SELECT asset_id FROM asset_risk ORDER BY rank', (), 'idx_asset_risk_rank'),
+)
+
+
+# Возвращает [(название, индекс, используется ли индекс, план)] для HOT_QUERIES
+def check_query_plans(conn):
+    results = []
+    for name, query, params, index in HOT_QUERIES:
+        plan = ' | '.join(row[-1] for row in conn.execute(f'EXPLAIN QUERY PLAN {query}', params))
+        results.append((name, index, f'INDEX {index}' in plan, plan))
+    return results
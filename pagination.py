@@ -0,0 +1,119 @@
+import base64
+import json
+
+# Постраничный вывод списков по ключу (keyset/seek): следующая страница выбирается условием
+# (sort, id) > (последнее значение, последний id) вместо OFFSET, поэтому стоимость страницы
+# не зависит от её номера и размера таблицы.
+
+DEFAULT_PER_PAGE = 50
+MAX_PER_PAGE = 500
+
+
+def _encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(list(values)).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def _decode_cursor(token):
+    if not token:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except ValueError:
+        return None
+    # Курсор из запроса не доверенный: значение сортировки — скаляр, id — целое число
+    if not isinstance(values, list) or len(values) != 2:
+        return None
+    sort_value, row_id = values
+    if sort_value is not None and not isinstance(sort_value, (str, int, float)):
+        return None
+    if isinstance(row_id, bool) or not isinstance(row_id, int):
+        return None
+    return values
+
+
+# Фильтр по началу названия: диапазон по строке использует индекс, в отличие от LIKE
+def prefix_range(value):
+    return value, value + '\uffff'
+
+
+def _per_page(args):
+    try:
+        per_page = int(args.get('per_page', DEFAULT_PER_PAGE))
+    except (TypeError, ValueError):
+        return DEFAULT_PER_PAGE
+    return max(1, min(per_page, MAX_PER_PAGE))
+
+
+# Выборка одной страницы списка.
+# spec — описание списка:
+#   columns       — выбираемые столбцы;
+#   from          — FROM с соединениями;
+#   id            — уникальный столбец, завершающий порядок сортировки;
+#   sorts         — {имя параметра sort: выражение SQL} (выражения не должны давать NULL);
+#   default_sort  — сортировка по умолчанию;
+#   filters       — {имя параметра: (условие SQL, функция преобразования значения)}.
+# args — параметры запроса (sort, dir, per_page, after/before и фильтры);
+# where/params — дополнительные обязательные условия (например, только оценки текущего эксперта).
+def paginate(conn, spec, args, where=(), params=()):
+    sort = args.get('sort')
+    if sort not in spec['sorts']:
+        sort = spec['default_sort']
+    direction = 'desc' if args.get('dir') == 'desc' else 'asc'
+    per_page = _per_page(args)
+
+    conditions = list(where)
+    values = list(params)
+    filters = {}
+    for name, (condition, convert) in spec['filters'].items():
+        raw = (args.get(name) or '').strip()
+        if not raw:
+            continue
+        try:
+            value = convert(raw)
+        except ValueError:
+            continue
+        filters[name] = raw
+        conditions.append(condition)
+        values.extend(value if isinstance(value, tuple) else (value,))
+
+    sort_expr = spec['sorts'][sort]
+    id_expr = spec['id']
+    after = _decode_cursor(args.get('after'))
+    before = _decode_cursor(args.get('before'))
+    backwards = before is not None
+    # Для перехода назад порядок и сравнение переворачиваются, а строки потом разворачиваются обратно
+    ascending = (direction == 'asc') != backwards
+    position = before if backwards else after
+    if position is not None:
+        conditions.append(f"({sort_expr}, {id_expr}) {'>' if ascending else '<'} (?, ?)")
+        values.extend(position)
+    order = 'ASC' if ascending else 'DESC'
+
+    query = f"SELECT {spec['columns']}, {sort_expr}, {id_expr} FROM {spec['from']}"
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(f'({condition})' for condition in conditions)
+    query += f' ORDER BY {sort_expr} {order}, {id_expr} {order} LIMIT ?'
+    rows = conn.execute(query, values + [per_page + 1]).fetchall()
+
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+    keys = [row[-2:] for row in rows]
+    rows = [row[:-2] for row in rows]
+
+    if backwards:
+        next_cursor = _encode_cursor(keys[-1]) if rows else None
+        prev_cursor = _encode_cursor(keys[0]) if rows and has_more else None
+    else:
+        next_cursor = _encode_cursor(keys[-1]) if rows and has_more else None
+        prev_cursor = _encode_cursor(keys[0]) if rows and position is not None else None
+    return {
+        'rows': rows,
+        'next': next_cursor,
+        'prev': prev_cursor,
+        'sort': sort,
+        'dir': direction,
+        'per_page': per_page,
+        'filters': filters,
+    }
@@ -1,5 +1,7 @@
 import sqlite3
 
+import db
+
 # Список мер контроля для вставки
 control_measures = [
     "A.5.1.1 Policies for information Security",
@@ -120,7 +122,7 @@ control_measures = [
 
 def populate_control_measures():
     # Подключение к базе данных
-    with sqlite3.connect('risk_assessment.db') as conn:
+    with db.connect() as conn:
         cursor = conn.cursor()
         
         # Проверка наличия таблицы control_measures
@@ -1,5 +1,7 @@
 import sqlite3
 
+import db
+
 # Список уязвимостей с категориями
 vulnerabilities = [
     ("Information", "Отсутствие 'logout' под оставление работником рабочей станции"),
@@ -198,7 +200,7 @@ vulnerabilities = [
 
 def populate_vulnerabilities():
     # Подключение к базе данных
-    with sqlite3.connect('risk_assessment.db') as conn:
+    with db.connect() as conn:
         cursor = conn.cursor()
         
         # Проверка наличия таблицы vulnerabilities
@@ -0,0 +1,260 @@
+import heapq
+import math
+
+import controls
+import risk_engine
+import risk_scenarios
+
+# Подбор мер контроля для внедрения в пределах бюджета.
+# Кандидаты — предлагаемые меры записей анализа рисков (risk_controls.implemented = 0), для которых задана
+# стоимость (control_measures.cost). Мера внедряется целиком: во всех записях, где она предложена, остаточный
+# риск записи умножается на (1 − e), как в совокупной эффективности 1 − Π(1 − eᵢ) (controls.py).
+# Цель — наименьший суммарный остаточный риск записей при стоимости выбранных мер не выше бюджета.
+# Риск записи до подбора — риск с учётом только внедрённых мер: у записи без внедрённых мер эффективность,
+# введённая в форме, после внедрения первой меры заменяется совокупной (controls.refresh).
+#
+# Жадный метод выбирает меру с наибольшим снижением риска на единицу стоимости. Снижение от меры может только
+# уменьшаться по мере выбора других мер (они снижают риск тех же записей), поэтому оценки в очереди с приоритетом
+# пересчитываются лениво — только для меры на вершине очереди. Результат сравнивается с лучшей одиночной мерой.
+# Точный метод для небольшого числа кандидатов — перебор с отсечением по верхней границе (непрерывный рюкзак
+# по снижениям оставшихся мер: снижение от их совместного внедрения не больше суммы снижений по отдельности).
+# Динамика по бюджету здесь неточна: снижения от мер, предложенных для одних и тех же записей, не складываются.
+
+METHODS = ('auto', 'greedy', 'exact')
+METHOD_GREEDY, METHOD_EXACT = 'greedy', 'exact'
+# Наибольшее число мер-кандидатов, при котором auto выбирает точный метод
+EXACT_LIMIT = 12
+# Наибольшее число узлов перебора; при превышении возвращается лучший найденный выбор (без гарантии оптимальности)
+EXACT_NODES = 5000
+EPSILON = 1e-12
+
+
+# Задача подбора: меры-кандидаты (id, название, стоимость), их связи с записями (упорядочены по мере),
+# текущий остаточный риск записей с кандидатами и риск с учётом только внедрённых мер, от которого считается
+# снижение. None, если веса критериев не заданы.
+def load(conn):
+    import numpy as np
+
+    weights = conn.execute(f'SELECT {", ".join(risk_engine.CRITERIA)} FROM criteria_weights').fetchone()
+    if not weights:
+        return None
+    result = risk_scenarios.compute(risk_scenarios.load(conn), risk_engine.load_register(conn), weights)
+    residual_all = np.where(result['valid'], result['residual_risk'], 0.0)
+
+    links = np.array(conn.execute('''
+        SELECT rc.control_measure_id, rc.risk_id, rc.effectiveness
+        FROM risk_controls rc
+        JOIN control_measures cm ON cm.id = rc.control_measure_id
+        WHERE rc.implemented = 0 AND cm.cost IS NOT NULL
+        ORDER BY rc.control_measure_id, rc.risk_id
+    ''').fetchall(), dtype=float).reshape(-1, 3)
+    control_ids, link_control = np.unique(links[:, 0].astype(np.int64), return_inverse=True)
+    risk_ids, link_risk = np.unique(links[:, 1].astype(np.int64), return_inverse=True)
+
+    # Риск записей с кандидатами (результат risk_scenarios упорядочен по id записи)
+    positions = np.minimum(np.searchsorted(result['ids'], risk_ids), max(len(result['ids']) - 1, 0))
+    current = np.zeros(len(risk_ids))
+    risk_score = np.zeros(len(risk_ids))
+    if len(result['ids']):
+        known = (result['ids'][positions] == risk_ids) & result['valid'][positions]
+        current[known] = residual_all[positions[known]]
+        risk_score[known] = result['risk_score'][positions[known]]
+    # Совокупная эффективность внедрённых мер этих записей
+    implemented_ids, effectiveness = controls.combined_effectiveness(controls.load_links(conn, risk_ids.tolist()))
+    residual = risk_score.copy()
+    found = np.isin(risk_ids, implemented_ids)
+    residual[found] *= 1 - effectiveness[np.searchsorted(implemented_ids, risk_ids[found])]
+
+    measures = {}
+    for start in range(0, len(control_ids), risk_engine.CHUNK_SIZE):
+        chunk = control_ids[start:start + risk_engine.CHUNK_SIZE].tolist()
+        measures.update((row[0], row[1:]) for row in conn.execute(f'''
+            SELECT id, name, cost FROM control_measures WHERE id IN ({', '.join('?' * len(chunk))})
+        ''', chunk))
+    unpriced = conn.execute('''
+        SELECT COUNT(DISTINCT rc.control_measure_id)
+        FROM risk_controls rc
+        JOIN control_measures cm ON cm.id = rc.control_measure_id
+        WHERE rc.implemented = 0 AND cm.cost IS NULL
+    ''').fetchone()[0]
+    link_control = link_control.reshape(-1)
+    return {
+        'control_ids': control_ids,
+        'names': [measures[control_id][0] for control_id in control_ids.tolist()],
+        'cost': np.array([measures[control_id][1] for control_id in control_ids.tolist()], dtype=float),
+        'link_control': link_control,
+        'offsets': np.searchsorted(link_control, np.arange(len(control_ids) + 1)),
+        'link_risk': link_risk.reshape(-1),
+        'effectiveness': links[:, 2],
+        'residual': residual,
+        'current': current,
+        'total_residual': float(residual_all.sum()),
+        'unpriced': unpriced,
+    }
+
+
+# Снижение суммарного остаточного риска от каждой меры при остаточном риске записей residual
+def _gains(problem, residual):
+    import numpy as np
+
+    return np.bincount(problem['link_control'], weights=residual[problem['link_risk']] * problem['effectiveness'],
+                       minlength=len(problem['control_ids']))
+
+
+def _gain(problem, residual, control):
+    start, end = problem['offsets'][control], problem['offsets'][control + 1]
+    return float(residual[problem['link_risk'][start:end]] @ problem['effectiveness'][start:end])
+
+
+# Остаточный риск записей после внедрения меры (в том же массиве)
+def _apply(problem, residual, control):
+    start, end = problem['offsets'][control], problem['offsets'][control + 1]
+    residual[problem['link_risk'][start:end]] *= 1 - problem['effectiveness'][start:end]
+
+
+def _ratio(gain, cost):
+    return gain / cost if cost > 0 else math.inf
+
+
+# Жадный подбор с ленивым пересчётом: [(мера, снижение риска)] в порядке выбора
+def greedy(problem, budget):
+    residual = problem['residual'].copy()
+    cost = problem['cost'].tolist()
+    gains = _gains(problem, residual).tolist()
+    queue = [(-_ratio(gain, cost[control]), control) for control, gain in enumerate(gains)
+             if gain > EPSILON and cost[control] <= budget]
+    heapq.heapify(queue)
+    selected, spent = [], 0.0
+    while queue:
+        _, control = heapq.heappop(queue)
+        if cost[control] > budget - spent + EPSILON:
+            # Остаток бюджета только уменьшается: мера больше не поместится
+            continue
+        gain = _gain(problem, residual, control)
+        if gain <= EPSILON:
+            continue
+        ratio = _ratio(gain, cost[control])
+        if queue and ratio < -queue[0][0]:
+            heapq.heappush(queue, (-ratio, control))
+            continue
+        _apply(problem, residual, control)
+        selected.append((control, gain))
+        spent += cost[control]
+
+    # Лучшая одиночная мера: жадный выбор по отношению может упустить одну дорогую и самую полезную меру
+    single = max((control for control, gain in enumerate(gains) if cost[control] <= budget),
+                 key=lambda control: gains[control], default=None)
+    if single is not None and gains[single] > sum(gain for _, gain in selected) + EPSILON:
+        return [(single, gains[single])]
+    return selected
+
+
+# Точный подбор перебором с отсечениями: ([(мера, снижение риска)] в порядке выбора, доказана ли оптимальность)
+def exact(problem, budget):
+    import numpy as np
+
+    cost = problem['cost']
+    initial = _gains(problem, problem['residual'])
+    order = [control for control in np.argsort(-initial / np.maximum(cost, EPSILON), kind='stable').tolist()
+             if initial[control] > EPSILON and cost[control] <= budget]
+    best = greedy(problem, budget)
+    best_gain = [sum(gain for _, gain in best)]
+    best_selection = [best]
+    nodes = [0]
+
+    # Верхняя граница снижения от мер order[position:] при остатке бюджета remaining; снижение также
+    # не больше остаточного риска записей этих мер (важно, когда меры предложены для одних и тех же записей)
+    def bound(residual, position, remaining):
+        candidates = order[position:]
+        if not candidates:
+            return 0.0
+        gains = _gains(problem, residual)[candidates]
+        costs = cost[candidates]
+        touched = np.zeros(len(residual), dtype=bool)
+        for control in candidates:
+            touched[problem['link_risk'][problem['offsets'][control]:problem['offsets'][control + 1]]] = True
+        limit = float(residual[touched].sum())
+        total = 0.0
+        for index in np.argsort(-gains / np.maximum(costs, EPSILON), kind='stable').tolist():
+            if costs[index] <= remaining:
+                total += gains[index]
+                remaining -= costs[index]
+            else:
+                return min(total + gains[index] * remaining / costs[index], limit)
+        return min(total, limit)
+
+    def search(position, residual, spent, gain, chosen):
+        nodes[0] += 1
+        if nodes[0] > EXACT_NODES:
+            return
+        if gain > best_gain[0] + EPSILON:
+            best_gain[0] = gain
+            best_selection[0] = list(chosen)
+        if position == len(order) or gain + bound(residual, position, budget - spent) <= best_gain[0] + EPSILON:
+            return
+        control = order[position]
+        if cost[control] <= budget - spent + EPSILON:
+            gain_control = _gain(problem, residual, control)
+            taken = residual.copy()
+            _apply(problem, taken, control)
+            chosen.append((control, gain_control))
+            search(position + 1, taken, spent + cost[control], gain + gain_control, chosen)
+            chosen.pop()
+        search(position + 1, residual, spent, gain, chosen)
+
+    search(0, problem['residual'].copy(), 0.0, 0.0, [])
+    return best_selection[0], nodes[0] <= EXACT_NODES
+
+
+# Подбор мер методом method ('auto' — точный при числе кандидатов не больше EXACT_LIMIT):
+# (выбор, метод, доказана ли оптимальность)
+def optimize(problem, budget, method='auto'):
+    if method not in METHODS:
+        raise ValueError(f'Неизвестный метод: {method}')
+    if not math.isfinite(budget) or budget < 0:
+        raise ValueError('Бюджет должен быть неотрицательным числом')
+    if method == 'auto':
+        method = METHOD_EXACT if len(problem['control_ids']) <= EXACT_LIMIT else METHOD_GREEDY
+    if method == METHOD_EXACT:
+        selection, optimal = exact(problem, budget)
+        return selection, method, optimal
+    return greedy(problem, budget), method, False
+
+
+# Ответ для шаблона и JSON: выбранные меры и сводка
+def result_rows(problem, selection, budget, method, optimal):
+    import numpy as np
+
+    offsets = problem['offsets']
+    rows = []
+    for control, gain in selection:
+        rows.append({
+            'control_measure_id': int(problem['control_ids'][control]),
+            'control_measure': problem['names'][control],
+            'cost': round(float(problem['cost'][control]), 2),
+            'risks': int(offsets[control + 1] - offsets[control]),
+            'risk_reduction': round(gain, 4),
+        })
+    # Итог по записям, затронутым выбранными мерами: их риск заменяется риском после внедрения
+    residual = problem['residual'].copy()
+    touched = np.zeros(len(residual), dtype=bool)
+    for control, _ in selection:
+        _apply(problem, residual, control)
+        touched[problem['link_risk'][offsets[control]:offsets[control + 1]]] = True
+    reduction = float(problem['current'][touched].sum() - residual[touched].sum())
+    spent = sum(float(problem['cost'][control]) for control, _ in selection)
+    summary = {
+        'budget': budget,
+        'method': method,
+        'optimal': optimal,
+        'candidates': len(problem['control_ids']),
+        'unpriced_candidates': problem['unpriced'],
+        'candidate_risks': len(problem['residual']),
+        'selected': len(selection),
+        'spent': round(spent, 2),
+        'risk_reduction': round(reduction, 4),
+        'total_residual_risk_before': round(problem['total_residual'], 4),
+        'total_residual_risk_after': round(problem['total_residual'] - reduction, 4),
+        'candidate_residual_risk': round(float(problem['current'].sum()), 4),
+    }
+    return {'summary': summary, 'controls': rows}
@@ -0,0 +1,370 @@
+import risk_engine
+
+# Распространение риска по зависимостям активов (asset_dependencies: актив asset_id зависит от актива depends_on_id
+# с весом 0–1 — долей функций актива, которая зависит от другого актива; например, услуга → оборудование → помещение).
+# Критичность передаётся от зависимого актива к активу, от которого он зависит: оборудование, на котором работает
+# критичная услуга, само критично — эффективная критичность c'(b) = max(c(b), max w·c'(a)) по активам a, зависящим от b.
+# Остаточная вероятность (остаточный риск / impact из снимка asset_risk) передаётся в обратную сторону: отказ
+# помещения затрагивает оборудование и услуги — q'(a) = max(q(a), max w·q'(b)) по активам b, от которых зависит a.
+# Распространённый остаточный риск — (1 + c'/10·2)·q', как остаточный риск в risk_engine.
+# Берётся максимум произведений весов по путям, а не сумма: сумма по многим зависимым активам неограниченно растёт,
+# а в циклах зависимостей значения усиливали бы сами себя; максимум не превышает исходных значений и от циклов не зависит.
+#
+# Полный пересчёт: граф читается плоскими массивами numpy в виде CSR (рёбра упорядочены по активу-источнику,
+# смещения по активам), значения распространяются фронтом — на каждом шаге обходятся только рёбра от активов,
+# значение которых изменилось.
+# Пересчёт после изменения оценок актива или ребра — локальный, по индексам asset_dependencies: сбрасываются только
+# активы, значение которых получено через изменённые (оно в точности равно w·значение источника), и от них
+# распространяются значения дальше. Если затронуто больше LOCAL_LIMIT активов, выполняется полный пересчёт.
+# Таблицы создаются миграцией (migrations.py).
+
+# Допустимый диапазон веса зависимости
+WEIGHT_RANGE = (0, 1)
+# Наибольшее число активов локального пересчёта; при большем числе пересчитывается весь граф
+LOCAL_LIMIT = 5000
+# Значение по умолчанию и наибольшее значение параметра top
+DEFAULT_TOP = 50
+MAX_TOP = 1000
+
+# Направления распространения: (столбец значения, столбец источника ребра, столбец получателя ребра)
+CRITICALITY = ('effective_criticality', 'asset_id', 'depends_on_id')
+PROBABILITY = ('effective_probability', 'depends_on_id', 'asset_id')
+
+
+# Граф в формате CSR по активу-источнику: source, target, weight упорядочены по source,
+# рёбра актива i — позиции indptr[i]:indptr[i + 1]
+def _csr(source, target, weight, size):
+    import numpy as np
+
+    order = np.argsort(source, kind='stable')
+    source = source[order]
+    return {
+        'indptr': np.searchsorted(source, np.arange(size + 1)),
+        'source': source,
+        'target': target[order],
+        'weight': weight[order],
+    }
+
+
+# Позиции рёбер, выходящих из активов frontier, одним массивом
+def _out_edges(graph, frontier):
+    import numpy as np
+
+    starts = graph['indptr'][frontier]
+    lengths = graph['indptr'][frontier + 1] - starts
+    return np.repeat(starts - (np.cumsum(lengths) - lengths), lengths) + np.arange(lengths.sum())
+
+
+# Максимум произведений весов по путям от исходных значений base
+def _propagate(graph, base):
+    import numpy as np
+
+    value = base.copy()
+    edges = np.arange(len(graph['source']))
+    while len(edges):
+        targets = graph['target'][edges]
+        pushed = graph['weight'][edges] * value[graph['source'][edges]]
+        better = pushed > value[targets]
+        if not better.any():
+            break
+        np.maximum.at(value, targets[better], pushed[better])
+        edges = _out_edges(graph, np.unique(targets[better]))
+    return value
+
+
+# Граф зависимостей и исходные значения из снимка рисков. Активы — все активы снимка и все концы рёбер;
+# актив без строки в снимке (нет полного набора оценок или вероятности) имеет исходные значения 0.
+def load(conn):
+    import itertools
+    import numpy as np
+
+    edges = np.fromiter(itertools.chain.from_iterable(conn.execute(
+        'SELECT asset_id, depends_on_id, weight FROM asset_dependencies'
+    )), dtype=float).reshape(-1, 3)
+    snapshot = np.fromiter(itertools.chain.from_iterable(conn.execute(
+        'SELECT asset_id, criticality, impact, residual_risk FROM asset_risk ORDER BY asset_id'
+    )), dtype=float).reshape(-1, 4)
+    dependent = edges[:, 0].astype(np.int64)
+    dependency = edges[:, 1].astype(np.int64)
+    snapshot_ids = snapshot[:, 0].astype(np.int64)
+    ids = np.union1d(snapshot_ids, np.union1d(dependent, dependency))
+
+    positions = np.searchsorted(ids, snapshot_ids)
+    criticality = np.zeros(len(ids))
+    criticality[positions] = snapshot[:, 1]
+    probability = np.zeros(len(ids))
+    probability[positions] = snapshot[:, 3] / snapshot[:, 2]
+    has_risk = np.zeros(len(ids), dtype=bool)
+    has_risk[positions] = True
+
+    dependent = np.searchsorted(ids, dependent)
+    dependency = np.searchsorted(ids, dependency)
+    return {
+        'ids': ids,
+        'criticality': criticality,
+        'probability': probability,
+        'has_risk': has_risk,
+        'edges': len(edges),
+        # Критичность — от зависимого актива к активу, от которого он зависит; вероятность — обратно
+        'to_dependencies': _csr(dependent, dependency, edges[:, 2], len(ids)),
+        'to_dependents': _csr(dependency, dependent, edges[:, 2], len(ids)),
+    }
+
+
+# Эффективная критичность и эффективная вероятность всех активов графа
+def compute(graph):
+    return (_propagate(graph['to_dependencies'], graph['criticality']),
+            _propagate(graph['to_dependents'], graph['probability']))
+
+
+# Строка asset_propagated_risk:
+# (id актива, эффективная критичность, impact, эффективная вероятность, распространённый остаточный риск, уровень).
+# Уровень не определён у актива без собственного риска, на который не распространился риск других активов.
+def _row(asset_id, criticality, probability, has_risk):
+    impact = 1 + (criticality / 10) * 2
+    residual_risk = impact * probability
+    level = risk_engine.risk_level(residual_risk)[0] if has_risk or probability > 0 else None
+    return asset_id, criticality, impact, probability, residual_risk, level
+
+
+def _insert_rows(conn, rows):
+    conn.executemany('''
+        INSERT OR REPLACE INTO asset_propagated_risk
+            (asset_id, effective_criticality, effective_impact, effective_probability, propagated_residual_risk, level)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', rows)
+
+
+def _full_rows(graph):
+    criticality, probability = compute(graph)
+    return [_row(*values) for values in zip(graph['ids'].tolist(), criticality.tolist(), probability.tolist(),
+                                             graph['has_risk'].tolist())]
+
+
+# Полный пересчёт распространённых рисков всех активов. Возвращает {'assets': ..., 'edges': ...}.
+# Фиксация транзакции остаётся за вызывающим кодом.
+def refresh_all(conn):
+    graph = load(conn)
+    conn.execute('DELETE FROM asset_propagated_risk')
+    _insert_rows(conn, _full_rows(graph))
+    return {'assets': len(graph['ids']), 'edges': graph['edges']}
+
+
+# Полный пересчёт с записью только изменившихся строк (когда локальный пересчёт затрагивает слишком много активов)
+def _refresh_changed(conn):
+    graph = load(conn)
+    stored = {row[0]: row for row in conn.execute('''
+        SELECT asset_id, effective_criticality, effective_impact, effective_probability, propagated_residual_risk, level
+        FROM asset_propagated_risk
+    ''')}
+    rows = _full_rows(graph)
+    _insert_rows(conn, [row for row in rows if stored.pop(row[0], None) != row])
+    _delete_rows(conn, list(stored))
+    return len(rows)
+
+
+def _delete_rows(conn, asset_ids):
+    for start in range(0, len(asset_ids), risk_engine.CHUNK_SIZE):
+        chunk = asset_ids[start:start + risk_engine.CHUNK_SIZE]
+        conn.execute(f'DELETE FROM asset_propagated_risk WHERE asset_id IN ({", ".join("?" * len(chunk))})', chunk)
+
+
+# Идентификаторы активов во временной таблице для запросов по индексам asset_dependencies
+def _stage(conn, asset_ids):
+    conn.execute('CREATE TEMP TABLE IF NOT EXISTS propagation_assets (asset_id INTEGER PRIMARY KEY)')
+    conn.execute('DELETE FROM temp.propagation_assets')
+    conn.executemany('INSERT OR IGNORE INTO temp.propagation_assets (asset_id) VALUES (?)',
+                     ((asset_id,) for asset_id in asset_ids))
+
+
+# Рёбра направления direction (источник, получатель, вес), у которых столбец column — один из asset_ids
+def _edges(conn, direction, asset_ids, column):
+    _, source, target = direction
+    _stage(conn, asset_ids)
+    return conn.execute(f'''
+        SELECT {source}, {target}, weight FROM asset_dependencies
+        WHERE {column} IN (SELECT asset_id FROM temp.propagation_assets)
+    ''').fetchall()
+
+
+# Дочитывание сохранённых значений направления direction в словарь value для активов, которых в нём ещё нет
+def _load_values(conn, direction, value, asset_ids):
+    missing = [asset_id for asset_id in set(asset_ids) if asset_id not in value]
+    if not missing:
+        return
+    _stage(conn, missing)
+    value.update(conn.execute(f'''
+        SELECT asset_id, {direction[0]} FROM asset_propagated_risk
+        WHERE asset_id IN (SELECT asset_id FROM temp.propagation_assets)
+    '''))
+    # Актив без сохранённой строки (появился в графе) входит в start и получает значение при сбросе
+    for asset_id in missing:
+        value.setdefault(asset_id, 0.0)
+
+
+# Локальный пересчёт одного направления после изменения исходных значений или входящих рёбер активов start
+# (load_base(активы) — их исходные значения {id актива: значение}, отсутствующие — 0).
+# Возвращает {id актива: новое значение} для пересчитанных активов или None, если затронуто больше LOCAL_LIMIT активов.
+def _local_update(conn, direction, start, load_base):
+    value = {}
+    _load_values(conn, direction, value, start)
+    # Активы, значение которых получено через изменённые: сохранённое значение равно w·значение источника
+    tainted, frontier = set(start), list(start)
+    while frontier:
+        edges = _edges(conn, direction, frontier, direction[1])
+        _load_values(conn, direction, value, [target for _, target, _ in edges])
+        frontier = []
+        for source, target, weight in edges:
+            if target not in tainted and value[target] == weight * value[source]:
+                tainted.add(target)
+                frontier.append(target)
+        if len(tainted) > LOCAL_LIMIT:
+            return None
+
+    base = load_base(tainted)
+    for asset_id in tainted:
+        value[asset_id] = base.get(asset_id, 0.0)
+    edges = _edges(conn, direction, tainted, direction[2])
+    _load_values(conn, direction, value, [source for source, _, _ in edges])
+    for source, target, weight in edges:
+        if source not in tainted:
+            value[target] = max(value[target], weight * value[source])
+
+    # Распространение от сброшенных активов: значения остальных активов могут только вырасти
+    changed, frontier = set(tainted), set(tainted)
+    while frontier:
+        edges = _edges(conn, direction, frontier, direction[1])
+        _load_values(conn, direction, value, [target for _, target, _ in edges])
+        frontier = set()
+        for source, target, weight in edges:
+            pushed = weight * value[source]
+            if pushed > value[target]:
+                value[target] = pushed
+                frontier.add(target)
+        changed |= frontier
+        if len(changed) > LOCAL_LIMIT:
+            return None
+    return {asset_id: value[asset_id] for asset_id in changed}
+
+
+# Исходные значения из снимка рисков для активов asset_ids: {id актива: (критичность, вероятность)}
+def _load_base(conn, asset_ids):
+    _stage(conn, asset_ids)
+    return {asset_id: (criticality, residual_risk / impact) for asset_id, criticality, impact, residual_risk in conn.execute('''
+        SELECT asset_id, criticality, impact, residual_risk FROM asset_risk
+        WHERE asset_id IN (SELECT asset_id FROM temp.propagation_assets)
+    ''')}
+
+
+# Пересчёт после изменения оценок (снимка рисков) или рёбер активов asset_ids: локально, с записью только
+# изменившихся строк. Возвращает число пересчитанных активов.
+# Фиксация транзакции остаётся за вызывающим кодом.
+def refresh_assets(conn, asset_ids):
+    asset_ids = sorted(set(asset_ids))
+    if not asset_ids:
+        return 0
+    if conn.execute('SELECT 1 FROM asset_propagated_risk LIMIT 1').fetchone() is None:
+        return refresh_all(conn)['assets']
+
+    # Активы, которых больше нет в графе (удалены или потеряли строку снимка и все рёбра)
+    present = set(_load_base(conn, asset_ids))
+    present.update(asset_id for row in _edges(conn, CRITICALITY, asset_ids, 'asset_id') for asset_id in row[:2])
+    present.update(asset_id for row in _edges(conn, CRITICALITY, asset_ids, 'depends_on_id') for asset_id in row[:2])
+    removed = [asset_id for asset_id in asset_ids if asset_id not in present]
+    _delete_rows(conn, removed)
+    start = [asset_id for asset_id in asset_ids if asset_id in present]
+    if not start:
+        return 0
+
+    criticality = _local_update(conn, CRITICALITY, start, lambda tainted: {
+        asset_id: values[0] for asset_id, values in _load_base(conn, tainted).items()})
+    probability = None if criticality is None else _local_update(conn, PROBABILITY, start, lambda tainted: {
+        asset_id: values[1] for asset_id, values in _load_base(conn, tainted).items()})
+    if probability is None:
+        return _refresh_changed(conn)
+
+    touched = sorted(set(criticality) | set(probability))
+    _stage(conn, touched)
+    stored = {row[0]: row for row in conn.execute('''
+        SELECT asset_id, effective_criticality, effective_impact, effective_probability, propagated_residual_risk, level
+        FROM asset_propagated_risk WHERE asset_id IN (SELECT asset_id FROM temp.propagation_assets)
+    ''')}
+    base = _load_base(conn, touched)
+    rows = []
+    for asset_id in touched:
+        old = stored.get(asset_id)
+        row = _row(asset_id,
+                   criticality[asset_id] if asset_id in criticality else old[1],
+                   probability[asset_id] if asset_id in probability else old[3],
+                   asset_id in base)
+        if row != old:
+            rows.append(row)
+    _insert_rows(conn, rows)
+    return len(touched)
+
+
+# Добавление или изменение зависимости asset_id → depends_on_id. Возвращает id активов для refresh_assets.
+def set_dependency(conn, asset_id, depends_on_id, weight):
+    if asset_id == depends_on_id:
+        raise ValueError('Актив не может зависеть от самого себя')
+    if not (WEIGHT_RANGE[0] < weight <= WEIGHT_RANGE[1]):
+        raise ValueError(f'Вес зависимости должен быть больше {WEIGHT_RANGE[0]} и не больше {WEIGHT_RANGE[1]}')
+    conn.execute('''
+        INSERT INTO asset_dependencies (asset_id, depends_on_id, weight) VALUES (?, ?, ?)
+        ON CONFLICT (asset_id, depends_on_id) DO UPDATE SET weight = excluded.weight
+    ''', (asset_id, depends_on_id, weight))
+    return [asset_id, depends_on_id]
+
+
+# Удаление зависимости по id. Возвращает id активов для refresh_assets (пустой список, если её нет).
+def remove_dependency(conn, dependency_id):
+    row = conn.execute('SELECT asset_id, depends_on_id FROM asset_dependencies WHERE id = ?', (dependency_id,)).fetchone()
+    if row is None:
+        return []
+    conn.execute('DELETE FROM asset_dependencies WHERE id = ?', (dependency_id,))
+    return list(row)
+
+
+# Удаление всех зависимостей актива (перед удалением актива). Возвращает id активов для refresh_assets.
+def remove_asset(conn, asset_id):
+    neighbours = [row[0] for row in conn.execute('''
+        SELECT depends_on_id FROM asset_dependencies WHERE asset_id = ?
+        UNION SELECT asset_id FROM asset_dependencies WHERE depends_on_id = ?
+    ''', (asset_id, asset_id))]
+    conn.execute('DELETE FROM asset_dependencies WHERE asset_id = ? OR depends_on_id = ?', (asset_id, asset_id))
+    return neighbours + [asset_id]
+
+
+# Активы с наибольшим распространённым остаточным риском (или один актив asset_id) для шаблона и JSON
+def result_rows(conn, top=DEFAULT_TOP, asset_id=None):
+    where, params = '', [top]
+    if asset_id is not None:
+        where, params = 'WHERE p.asset_id = ?', [asset_id, top]
+    rows = conn.execute(f'''
+        SELECT p.asset_id, a.name, r.criticality, p.effective_criticality, r.residual_risk,
+               p.propagated_residual_risk, p.effective_probability, p.level,
+               (SELECT COUNT(*) FROM asset_dependencies d WHERE d.asset_id = p.asset_id),
+               (SELECT COUNT(*) FROM asset_dependencies d WHERE d.depends_on_id = p.asset_id)
+        FROM asset_propagated_risk p
+        JOIN assets a ON a.id = p.asset_id
+        LEFT JOIN asset_risk r ON r.asset_id = p.asset_id
+        {where}
+        ORDER BY p.propagated_residual_risk DESC, p.asset_id
+        LIMIT ?
+    ''', params).fetchall()
+
+    def rounded(value):
+        return None if value is None else round(value, 2)
+
+    return [{
+        'asset_id': row[0],
+        'asset': row[1],
+        'criticality': rounded(row[2]),
+        'effective_criticality': rounded(row[3]),
+        'residual_risk': rounded(row[4]),
+        'propagated_residual_risk': rounded(row[5]),
+        'effective_probability': rounded(row[6]),
+        'level': row[7],
+        'depends_on': row[8],
+        'dependents': row[9],
+    } for row in rows]
@@ -0,0 +1,63 @@
+import hashlib
+import json
+import threading
+
+# Кэш справочных данных для форм анализа рисков (активы, владельцы, угрозы, уязвимости, меры).
+# Данные хранятся в памяти процесса вместе с версией из таблицы reference_data_version,
+# которую увеличивают триггеры при изменении справочников. На каждый запрос выполняется
+# один запрос версии; справочники перечитываются, только если версия изменилась.
+
+CATALOGS = (
+    ('assets', 'SELECT id, name FROM assets ORDER BY id'),
+    ('asset_owners', 'SELECT id, name FROM asset_owners ORDER BY id'),
+    ('threats', 'SELECT id, name FROM threats ORDER BY id'),
+    ('vulnerabilities', 'SELECT id, name, category FROM vulnerabilities ORDER BY category, name'),
+    ('taken_measures', 'SELECT id, name FROM taken_measures ORDER BY id'),
+    ('control_measures', 'SELECT id, name FROM control_measures ORDER BY id'),
+)
+
+# Кэш по пути к базе: {путь: {'version', 'catalogs', 'payload', 'etag'}}
+_cache = {}
+_lock = threading.Lock()
+
+
+def current_version(conn):
+    return conn.execute('SELECT version FROM reference_data_version WHERE id = 1').fetchone()[0]
+
+
+def _load(conn, version):
+    catalogs = {name: conn.execute(query).fetchall() for name, query in CATALOGS}
+    payload = json.dumps({'version': version, **catalogs}, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return {
+        'version': version,
+        'catalogs': catalogs,
+        'payload': payload,
+        'etag': hashlib.sha256(payload).hexdigest()[:32],
+    }
+
+
+# Справочные данные базы path; при изменении версии перечитываются один раз на процесс
+def get(conn, path):
+    version = current_version(conn)
+    entry = _cache.get(path)
+    if entry is not None and entry['version'] == version:
+        return entry
+    with _lock:
+        entry = _cache.get(path)
+        if entry is None or entry['version'] != version:
+            entry = _load(conn, version)
+            _cache[path] = entry
+    return entry
+
+
+# Категории уязвимостей в алфавитном порядке
+def categories(entry):
+    return sorted({category for _, _, category in entry['catalogs']['vulnerabilities']})
+
+
+# Название записи справочника по id (None, если записи нет)
+def name_of(entry, catalog, item_id):
+    for row in entry['catalogs'][catalog]:
+        if row[0] == item_id:
+            return row[1]
+    return None
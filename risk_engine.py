@@ -0,0 +1,135 @@
+# numpy импортируется внутри функций: модуль загружается при старте рабочего процесса,
+# а numpy нужен только маршрутам, которые считают риски
+
+# Критерии оценки актива в порядке столбцов таблиц assets и criteria_weights
+CRITERIA = ('life_health', 'economy', 'ecology', 'dependency', 'social', 'international')
+
+# Уровни риска: (название, интерпретация)
+RISK_LEVELS = (
+    ("Низкий", "Допустимый, контрольный"),
+    ("Средний", "Требует мер по снижению"),
+    ("Высокий", "Требует приоритетного устранения"),
+)
+LEVEL_LOW, LEVEL_MEDIUM, LEVEL_HIGH = 0, 1, 2
+
+
+# Определение уровня риска для одного значения остаточного риска
+def risk_level(residual_risk):
+    if 1 <= residual_risk <= 3.9:
+        return RISK_LEVELS[LEVEL_LOW]
+    elif 4 <= residual_risk <= 6.9:
+        return RISK_LEVELS[LEVEL_MEDIUM]
+    return RISK_LEVELS[LEVEL_HIGH]
+
+
+# Векторное определение уровней риска (коды LEVEL_*), те же границы, что в risk_level
+def risk_level_codes(residual_risks):
+    import numpy as np
+
+    residual_risks = np.asarray(residual_risks, dtype=float)
+    codes = np.full(residual_risks.shape, LEVEL_HIGH, dtype=np.int8)
+    codes[(residual_risks >= 4) & (residual_risks <= 6.9)] = LEVEL_MEDIUM
+    codes[(residual_risks >= 1) & (residual_risks <= 3.9)] = LEVEL_LOW
+    return codes
+
+
+# Максимальное число параметров в одном запросе с IN (...)
+CHUNK_SIZE = 500
+
+
+# Загрузка реестра активов одним запросом: оценки, вероятность и эффективность защиты.
+# Эффективность берётся из первой (по id) записи анализа рисков актива.
+# Если передан asset_ids, загружаются только эти активы (пакетами по CHUNK_SIZE).
+def load_register(conn, asset_ids=None):
+    import numpy as np
+
+    query = '''
+        SELECT a.id, a.name, a.life_health, a.economy, a.ecology, a.dependency, a.social, a.international,
+               a.threat_probability, ra.control_effectiveness
+        FROM assets a
+        LEFT JOIN (SELECT asset_id, MIN(id) AS first_id FROM risk_analysis {where} GROUP BY asset_id) f ON f.asset_id = a.id
+        LEFT JOIN risk_analysis ra ON ra.id = f.first_id
+        {where_assets}
+        ORDER BY a.id
+    '''
+    if asset_ids is None:
+        rows = conn.execute(query.format(where='', where_assets='')).fetchall()
+    else:
+        asset_ids = sorted(set(asset_ids))
+        rows = []
+        for start in range(0, len(asset_ids), CHUNK_SIZE):
+            chunk = asset_ids[start:start + CHUNK_SIZE]
+            placeholders = ', '.join('?' * len(chunk))
+            rows.extend(conn.execute(query.format(
+                where=f'WHERE asset_id IN ({placeholders})',
+                where_assets=f'WHERE a.id IN ({placeholders})',
+            ), chunk + chunk).fetchall())
+    if not rows:
+        return {
+            'ids': np.empty(0, dtype=np.int64),
+            'names': [],
+            'scores': np.empty((0, len(CRITERIA))),
+            'probability': np.empty(0),
+            'effectiveness': np.empty(0),
+        }
+    # None превращается в NaN при приведении к float
+    values = np.array([row[2:] for row in rows], dtype=float)
+    return {
+        'ids': np.array([row[0] for row in rows], dtype=np.int64),
+        'names': [row[1] for row in rows],
+        'scores': values[:, :len(CRITERIA)],
+        'probability': values[:, len(CRITERIA)],
+        'effectiveness': np.nan_to_num(values[:, len(CRITERIA) + 1], nan=0.0),
+    }
+
+
+# Расчёт критичности, impact, риска, остаточного риска и ранга для всех активов за один проход.
+# Активы без полного набора оценок или без вероятности исключаются; результат упорядочен по рангу.
+def compute_register(register, weights):
+    import numpy as np
+
+    scores = register['scores']
+    probability = register['probability']
+    valid = ~np.isnan(scores).any(axis=1) & ~np.isnan(probability)
+    idx = np.flatnonzero(valid)
+
+    criticality = scores[idx] @ np.asarray(weights, dtype=float)
+    impact = 1 + (criticality / 10) * 2
+    risk_score = impact * probability[idx]
+    residual_risk = risk_score * (1 - register['effectiveness'][idx])
+
+    # Стабильная сортировка по округлённой критичности, как на странице критичности
+    order = np.argsort(-np.round(criticality, 2), kind='stable')
+    idx = idx[order]
+    return {
+        'ids': register['ids'][idx],
+        'names': [register['names'][i] for i in idx],
+        'criticality': criticality[order],
+        'impact': impact[order],
+        'probability': probability[idx],
+        'risk_score': risk_score[order],
+        'residual_risk': residual_risk[order],
+        'level': risk_level_codes(residual_risk[order]),
+        'rank': np.arange(1, len(idx) + 1),
+    }
+
+
+# Строки для шаблона criticality.html:
+# (название, критичность, impact, вероятность, риск, остаточный риск, уровень, интерпретация, ранг, id актива)
+def ranked_rows(result):
+    columns = zip(
+        result['names'],
+        result['criticality'].tolist(),
+        result['impact'].tolist(),
+        result['probability'].tolist(),
+        result['risk_score'].tolist(),
+        result['residual_risk'].tolist(),
+        result['level'].tolist(),
+        result['rank'].tolist(),
+        result['ids'].tolist(),
+    )
+    return [
+        (name, round(criticality, 2), round(impact, 2), round(probability, 2), round(risk_score, 2),
+         round(residual_risk, 2), *RISK_LEVELS[level], rank, asset_id)
+        for name, criticality, impact, probability, risk_score, residual_risk, level, rank, asset_id in columns
+    ]
@@ -0,0 +1,185 @@
+import risk_engine
+
+# Риски по сценариям — записям анализа рисков (актив, угроза, уязвимость).
+# Impact сценария — по критичности актива; вероятность — агрегированная вероятность угрозы для актива
+# (threat_likelihoods), а если эксперты её не оценивали — общая вероятность угроз актива (assets.threat_probability);
+# остаточный риск учитывает эффективность защиты своей записи анализа рисков.
+# Все сценарии рассчитываются векторно по массивам; наибольшие top выбираются np.argpartition,
+# и в строки Python (с названиями из базы) превращаются только они.
+
+DEFAULT_TOP = 50
+MAX_TOP = 1000
+
+# Источник вероятности сценария
+SOURCE_THREAT, SOURCE_ASSET = 'threat', 'asset'
+
+
+# Вероятности угроз для пар (актив, угроза) из threat_likelihoods; NaN — эксперты угрозу для актива не оценивали.
+# Вероятность сопоставляется в numpy по упорядоченному ключу (актив, угроза), а не соединением в запросе:
+# при сотнях тысяч записей поиск по первичному ключу threat_likelihoods для каждой строки заметно дороже.
+# С only_assets читаются только вероятности активов из asset_ids (расчёт части реестра).
+def threat_probabilities(conn, asset_ids, threat_ids, only_assets=False):
+    import numpy as np
+
+    query = 'SELECT asset_id, threat_id, probability FROM threat_likelihoods {where} ORDER BY asset_id, threat_id'
+    if only_assets:
+        assets = np.unique(asset_ids[~np.isnan(asset_ids)]).astype(np.int64).tolist()
+        rows = []
+        for start in range(0, len(assets), risk_engine.CHUNK_SIZE):
+            chunk = assets[start:start + risk_engine.CHUNK_SIZE]
+            placeholders = ', '.join('?' * len(chunk))
+            rows.extend(conn.execute(query.format(where=f'WHERE asset_id IN ({placeholders})'), chunk).fetchall())
+    else:
+        rows = conn.execute(query.format(where='')).fetchall()
+    likelihoods = np.array(rows, dtype=float).reshape(-1, 3)
+    threat_probability = np.full(len(asset_ids), np.nan)
+    if len(likelihoods):
+        stride = max(np.nanmax(threat_ids, initial=0), likelihoods[:, 1].max()) + 1
+        known_keys = likelihoods[:, 0] * stride + likelihoods[:, 1]
+        keys = asset_ids * stride + threat_ids
+        positions = np.minimum(np.searchsorted(known_keys, np.nan_to_num(keys, nan=-1)), len(known_keys) - 1)
+        found = known_keys[positions] == keys
+        threat_probability[found] = likelihoods[positions[found], 2]
+    return threat_probability
+
+
+# Сценарии из строк (id, asset_id, threat_id, control_effectiveness), упорядоченных по id
+def _scenarios(conn, rows, only_assets):
+    import numpy as np
+
+    # None превращается в NaN при приведении к float
+    values = np.array(rows, dtype=float).reshape(-1, 4)
+    asset_ids, threat_ids = values[:, 1], values[:, 2]
+    return {
+        'ids': values[:, 0].astype(np.int64),
+        'asset_ids': asset_ids,
+        'threat_ids': threat_ids,
+        'effectiveness': np.nan_to_num(values[:, 3], nan=0.0),
+        'threat_probability': threat_probabilities(conn, asset_ids, threat_ids, only_assets),
+    }
+
+
+# Загрузка сценариев: id записи, актив, угроза, эффективность защиты и вероятность угрозы для актива
+def load(conn):
+    rows = conn.execute('''
+        SELECT id, asset_id, threat_id, control_effectiveness
+        FROM risk_analysis
+        ORDER BY id
+    ''').fetchall()
+    return _scenarios(conn, rows, only_assets=False)
+
+
+# Расчёт части сценариев (страница, порция выгрузки) по строкам (id, asset_id, threat_id, control_effectiveness):
+# оценки активов и вероятности угроз читаются только для активов этих строк, результат — как у compute
+def compute_rows(conn, rows, weights):
+    import numpy as np
+
+    scenarios = _scenarios(conn, rows, only_assets=True)
+    asset_ids = scenarios['asset_ids']
+    register = risk_engine.load_register(conn, np.unique(asset_ids[~np.isnan(asset_ids)]).astype(np.int64).tolist())
+    return compute(scenarios, register, weights)
+
+
+# Расчёт всех сценариев: register — risk_engine.load_register, weights — веса критериев.
+# Сценарии активов без полного набора оценок или без вероятности получают NaN и не попадают в top.
+def compute(scenarios, register, weights):
+    import numpy as np
+
+    asset_impact = 1 + (register['scores'] @ np.asarray(weights, dtype=float) / 10) * 2
+    asset_ids = scenarios['asset_ids']
+    impact = np.full(len(asset_ids), np.nan)
+    asset_probability = np.full(len(asset_ids), np.nan)
+    if len(register['ids']):
+        positions = np.minimum(np.searchsorted(register['ids'], np.nan_to_num(asset_ids, nan=-1)), len(register['ids']) - 1)
+        known = register['ids'][positions] == asset_ids
+        impact[known] = asset_impact[positions[known]]
+        asset_probability[known] = register['probability'][positions[known]]
+    scoped = ~np.isnan(scenarios['threat_probability'])
+    probability = np.where(scoped, scenarios['threat_probability'], asset_probability)
+    risk_score = impact * probability
+    residual_risk = risk_score * (1 - scenarios['effectiveness'])
+    valid = ~np.isnan(residual_risk)
+    return {
+        'ids': scenarios['ids'],
+        'asset_ids': asset_ids,
+        'threat_ids': scenarios['threat_ids'],
+        'impact': impact,
+        'probability': probability,
+        'scoped': scoped,
+        'risk_score': risk_score,
+        'effectiveness': scenarios['effectiveness'],
+        'residual_risk': residual_risk,
+        'level': risk_engine.risk_level_codes(np.nan_to_num(residual_risk)),
+        'valid': valid,
+    }
+
+
+# Индексы top сценариев с наибольшим остаточным риском (при равенстве — по id записи),
+# с необязательным отбором по активу и угрозе
+def top_indices(result, top, asset_id=None, threat_id=None):
+    import numpy as np
+
+    mask = result['valid']
+    if asset_id is not None:
+        mask = mask & (result['asset_ids'] == asset_id)
+    if threat_id is not None:
+        mask = mask & (result['threat_ids'] == threat_id)
+    candidates = np.flatnonzero(mask)
+    if top < len(candidates):
+        candidates = candidates[np.argpartition(-result['residual_risk'][candidates], top - 1)[:top]]
+    order = np.lexsort((result['ids'][candidates], -result['residual_risk'][candidates]))
+    return candidates[order]
+
+
+# Строки для выбранных сценариев с названиями из базы (запрос только по этим записям)
+def result_rows(conn, result, indices):
+    ids = result['ids'][indices].tolist()
+    names = {}
+    for start in range(0, len(ids), risk_engine.CHUNK_SIZE):
+        chunk = ids[start:start + risk_engine.CHUNK_SIZE]
+        placeholders = ', '.join('?' * len(chunk))
+        for row in conn.execute(f'''
+            SELECT ra.id, a.name, ao.name, t.name, v.name, v.category
+            FROM risk_analysis ra
+            LEFT JOIN assets a ON a.id = ra.asset_id
+            LEFT JOIN asset_owners ao ON ao.id = ra.asset_owner_id
+            LEFT JOIN threats t ON t.id = ra.threat_id
+            LEFT JOIN vulnerabilities v ON v.id = ra.vulnerability_id
+            WHERE ra.id IN ({placeholders})
+        ''', chunk):
+            names[row[0]] = row[1:]
+    rows = []
+    for i, risk_id in zip(indices.tolist(), ids):
+        asset, owner, threat, vulnerability, category = names.get(risk_id, (None,) * 5)
+        level = int(result['level'][i])
+        rows.append({
+            'risk_id': risk_id,
+            'asset_id': int(result['asset_ids'][i]),
+            'asset': asset,
+            'asset_owner': owner,
+            'threat': threat,
+            'vulnerability': vulnerability,
+            'vulnerability_category': category,
+            'impact': round(float(result['impact'][i]), 4),
+            'probability': round(float(result['probability'][i]), 4),
+            'probability_source': SOURCE_THREAT if result['scoped'][i] else SOURCE_ASSET,
+            'risk_score': round(float(result['risk_score'][i]), 4),
+            'control_effectiveness': round(float(result['effectiveness'][i]), 4),
+            'residual_risk': round(float(result['residual_risk'][i]), 4),
+            'level': risk_engine.RISK_LEVELS[level][0],
+        })
+    return rows
+
+
+# Сводка по всем сценариям: число сценариев, рассчитанных, с вероятностью по угрозе и по уровням риска
+def summary(result):
+    import numpy as np
+
+    valid = result['valid']
+    counts = np.bincount(result['level'][valid], minlength=len(risk_engine.RISK_LEVELS))
+    return {
+        'scenarios': len(result['ids']),
+        'computed': int(valid.sum()),
+        'threat_scoped': int((valid & result['scoped']).sum()),
+        'levels': {name: int(count) for (name, _), count in zip(risk_engine.RISK_LEVELS, counts.tolist())},
+    }
@@ -0,0 +1,120 @@
+import propagation
+import risk_engine
+import rollups
+
+# Материализованный снимок рисков активов (таблица asset_risk).
+# Обновляется только для затронутых активов при изменении оценок, вероятностей,
+# записей анализа рисков или весов критериев; страница критичности читает его одним запросом.
+# Вслед за снимком пересчитываются риски, распространённые по зависимостям активов (propagation.py),
+# и сбрасывается кэш сводок остаточного риска (rollups.py).
+# Таблица создаётся миграцией (migrations.py).
+
+
+def _load_weights(conn):
+    return conn.execute('''
+        SELECT life_health, economy, ecology, dependency, social, international FROM criteria_weights
+    ''').fetchone()
+
+
+def _snapshot_rows(result, ranks):
+    return list(zip(
+        result['ids'].tolist(),
+        result['criticality'].tolist(),
+        result['impact'].tolist(),
+        result['probability'].tolist(),
+        result['risk_score'].tolist(),
+        result['residual_risk'].tolist(),
+        [risk_engine.RISK_LEVELS[level][0] for level in result['level'].tolist()],
+        ranks,
+    ))
+
+
+def _insert_rows(conn, rows):
+    conn.executemany('''
+        INSERT INTO asset_risk (asset_id, criticality, impact, probability, risk_score, residual_risk, level, rank)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+
+
+# Пересчёт рангов по всему снимку; обновляются только строки, у которых ранг изменился
+def _rerank(conn):
+    import numpy as np
+
+    rows = conn.execute('SELECT asset_id, criticality, rank FROM asset_risk ORDER BY asset_id').fetchall()
+    if not rows:
+        return
+    ids, criticality, old_ranks = (np.array(column) for column in zip(*rows))
+    order = np.argsort(-np.round(criticality.astype(float), 2), kind='stable')
+    ranks = np.empty(len(rows), dtype=np.int64)
+    ranks[order] = np.arange(1, len(rows) + 1)
+    changed = np.flatnonzero(ranks != old_ranks)
+    conn.executemany('UPDATE asset_risk SET rank = ? WHERE asset_id = ?',
+                     zip(ranks[changed].tolist(), ids[changed].tolist()))
+
+
+# Полное перестроение снимка (например, после изменения весов критериев)
+def refresh_all(conn):
+    rollups.invalidate(conn)
+    conn.execute('DELETE FROM asset_risk')
+    weights = _load_weights(conn)
+    if weights:
+        result = risk_engine.compute_register(risk_engine.load_register(conn), weights)
+        _insert_rows(conn, _snapshot_rows(result, result['rank'].tolist()))
+    propagation.refresh_all(conn)
+
+
+# Обновление снимка для указанных активов. Ранги остальных активов пересчитываются,
+# только если у затронутых активов изменилась округлённая критичность или состав снимка.
+# Фиксация транзакции остаётся за вызывающим кодом.
+def refresh_assets(conn, asset_ids):
+    asset_ids = sorted(set(asset_ids))
+    if not asset_ids:
+        return
+    rollups.invalidate(conn)
+    weights = _load_weights(conn)
+    if not weights:
+        return
+    result = risk_engine.compute_register(risk_engine.load_register(conn, asset_ids), weights)
+
+    old = {}
+    for start in range(0, len(asset_ids), risk_engine.CHUNK_SIZE):
+        chunk = asset_ids[start:start + risk_engine.CHUNK_SIZE]
+        placeholders = ', '.join('?' * len(chunk))
+        old.update((asset_id, (criticality, rank)) for asset_id, criticality, rank in conn.execute(
+            f'SELECT asset_id, criticality, rank FROM asset_risk WHERE asset_id IN ({placeholders})', chunk))
+        conn.execute(f'DELETE FROM asset_risk WHERE asset_id IN ({placeholders})', chunk)
+
+    ids = result['ids'].tolist()
+    criticality = result['criticality'].tolist()
+    unchanged = len(old) == len(ids) and all(
+        asset_id in old and round(old[asset_id][0], 2) == round(value, 2)
+        for asset_id, value in zip(ids, criticality)
+    )
+    if unchanged:
+        _insert_rows(conn, _snapshot_rows(result, [old[asset_id][1] for asset_id in ids]))
+    else:
+        _insert_rows(conn, _snapshot_rows(result, [0] * len(ids)))
+        _rerank(conn)
+    propagation.refresh_assets(conn, asset_ids)
+
+
+# Заполнение снимка, если таблица пуста, а активы уже есть (первый запуск на существующей базе)
+def ensure_snapshot(conn):
+    if conn.execute('SELECT 1 FROM asset_risk LIMIT 1').fetchone() is None:
+        refresh_all(conn)
+
+
+# Ранжированные строки для страницы критичности в формате risk_engine.ranked_rows
+def ranked_rows(conn):
+    interpretations = dict(risk_engine.RISK_LEVELS)
+    rows = conn.execute('''
+        SELECT a.name, r.criticality, r.impact, r.probability, r.risk_score, r.residual_risk, r.level, r.rank, r.asset_id
+        FROM asset_risk r
+        JOIN assets a ON a.id = r.asset_id
+        ORDER BY r.rank
+    ''').fetchall()
+    return [
+        (name, round(criticality, 2), round(impact, 2), round(probability, 2), round(risk_score, 2),
+         round(residual_risk, 2), level, interpretations[level], rank, asset_id)
+        for name, criticality, impact, probability, risk_score, residual_risk, level, rank, asset_id in rows
+    ]
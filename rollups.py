@@ -0,0 +1,252 @@
+import threading
+import time
+
+import reference_data
+import risk_engine
+import risk_scenarios
+
+# Сводки остаточного риска по владельцам активов, угрозам и категориям уязвимостей.
+# Риски всех сценариев (risk_scenarios) один раз сворачиваются в куб: ячейка — сочетание
+# (владелец, угроза, категория) с аддитивными показателями (число записей, суммы, уровни, гистограмма)
+# и максимумом. Сводка по любому измерению с отбором по остальным считается по ячейкам куба,
+# а не по записям, поэтому занимает миллисекунды.
+# Куб хранится в памяти процесса вместе с версией из таблицы risk_rollup_version, которую увеличивает
+# invalidate при пересчёте снимка рисков и вероятностей угроз, и версией справочников (reference_data):
+# на каждый запрос выполняются два запроса версий, куб перестраивается только после изменений.
+
+# Измерения: параметр by → (название, каталог справочников с названиями, параметр отбора)
+DIMENSIONS = {
+    'owner': ('Владелец актива', 'asset_owners', 'owner_id'),
+    'threat': ('Угроза', 'threats', 'threat_id'),
+    'category': ('Категория уязвимости', None, 'category'),
+}
+DEFAULT_DIMENSION = 'owner'
+# Гистограмма остаточного риска: интервалы шириной 1, последний — от HISTOGRAM_BINS − 1 и выше
+HISTOGRAM_BINS = 10
+# Код отсутствующего значения (запись без владельца, угрозы или уязвимости)
+MISSING = -1
+MISSING_NAME = 'Не указан'
+
+# Кэш по пути к базе: {путь: {'version', 'cube', 'seconds'}}; version — (версия сводок, версия справочников)
+_cache = {}
+_lock = threading.Lock()
+
+
+# Отметка об изменении рисков сценариев; выполняется в транзакции изменения и фиксируется вместе с ней
+def invalidate(conn):
+    conn.execute('UPDATE risk_rollup_version SET version = version + 1 WHERE id = 1')
+
+
+def current_version(conn):
+    return conn.execute('SELECT version FROM risk_rollup_version WHERE id = 1').fetchone()[0]
+
+
+# Владелец и id уязвимости сценариев в порядке ids; записи сопоставляются по id, отсутствующие — MISSING
+def _load_links(conn, ids):
+    import itertools
+    import numpy as np
+
+    links = np.fromiter(itertools.chain.from_iterable(conn.execute(f'''
+        SELECT id, IFNULL(asset_owner_id, {MISSING}), IFNULL(vulnerability_id, {MISSING}) FROM risk_analysis ORDER BY id
+    ''')), dtype=np.int64).reshape(-1, 3)
+    if np.array_equal(links[:, 0], ids):
+        return links[:, 1], links[:, 2]
+    # Между чтениями записи добавили или удалили
+    owners = np.full(len(ids), MISSING, dtype=np.int64)
+    vulnerabilities = np.full(len(ids), MISSING, dtype=np.int64)
+    if len(links):
+        positions = np.minimum(np.searchsorted(links[:, 0], ids), len(links) - 1)
+        found = links[positions, 0] == ids
+        owners[found] = links[positions[found], 1]
+        vulnerabilities[found] = links[positions[found], 2]
+    return owners, vulnerabilities
+
+
+# Коды категорий (индексы в categories) по id уязвимостей; уязвимости нет в справочнике — MISSING
+def _category_codes(vulnerabilities, catalog, categories):
+    import numpy as np
+
+    codes = {category: code for code, category in enumerate(categories)}
+    lookup = np.full(max([int(vulnerabilities.max(initial=0))] + [row[0] for row in catalog]) + 2, MISSING, dtype=np.int64)
+    for vulnerability_id, _, category in catalog:
+        lookup[vulnerability_id + 1] = codes[category]
+    return lookup[vulnerabilities + 1]
+
+
+# Построение куба по всем сценариям; None, если веса критериев не заданы
+def build(conn, refdata):
+    import numpy as np
+
+    weights = conn.execute(f'SELECT {", ".join(risk_engine.CRITERIA)} FROM criteria_weights').fetchone()
+    if not weights:
+        return None
+    result = risk_scenarios.compute(risk_scenarios.load(conn), risk_engine.load_register(conn), weights)
+    owners, vulnerabilities = _load_links(conn, result['ids'])
+    categories = reference_data.categories(refdata)
+    dimensions = {
+        'owner': owners,
+        'threat': np.nan_to_num(result['threat_ids'], nan=MISSING).astype(np.int64),
+        'category': _category_codes(vulnerabilities, refdata['catalogs']['vulnerabilities'], categories),
+    }
+
+    # Ячейка — номер уникального составного ключа (значения сдвинуты на 1, чтобы MISSING стал нулём)
+    keys = np.zeros(len(owners), dtype=np.int64)
+    strides = {}
+    for name, values in dimensions.items():
+        strides[name] = int(values.max(initial=0)) + 2
+        keys = keys * strides[name] + values + 1
+    cell_keys, cells = np.unique(keys, return_inverse=True)
+    cells = cells.reshape(-1)
+    cube_keys = {}
+    for name in reversed(list(dimensions)):
+        cell_keys, cube_keys[name] = np.divmod(cell_keys, strides[name])
+        cube_keys[name] -= 1
+
+    count = len(cube_keys['owner'])
+    valid = result['valid']
+    residual_risk = np.where(valid, result['residual_risk'], 0.0)
+    residual_max = np.full(count, -np.inf)
+    np.maximum.at(residual_max, cells[valid], residual_risk[valid])
+    bins = np.clip(np.floor(residual_risk).astype(np.int64), 0, HISTOGRAM_BINS - 1)
+    levels = len(risk_engine.RISK_LEVELS)
+    return {
+        'keys': cube_keys,
+        'categories': categories,
+        'names': {
+            name: {row[0]: row[1] for row in refdata['catalogs'][catalog]}
+            for name, (_, catalog, _) in DIMENSIONS.items() if catalog
+        },
+        'records': np.bincount(cells, minlength=count),
+        'computed': np.bincount(cells, weights=valid, minlength=count),
+        'residual_risk': np.bincount(cells, weights=residual_risk, minlength=count),
+        'risk_score': np.bincount(cells, weights=np.where(valid, result['risk_score'], 0.0), minlength=count),
+        'residual_max': residual_max,
+        'levels': np.bincount(cells * levels + result['level'], weights=valid,
+                              minlength=count * levels).reshape(count, levels),
+        'histogram': np.bincount(cells * HISTOGRAM_BINS + bins, weights=valid,
+                                 minlength=count * HISTOGRAM_BINS).reshape(count, HISTOGRAM_BINS),
+    }
+
+
+# Куб базы path; перестраивается один раз на процесс после изменения рисков или справочников.
+# None, если веса критериев не заданы.
+def get(conn, path):
+    # Версия читается до данных: изменение во время построения приведёт к перестроению при следующем запросе
+    version = current_version(conn)
+    refdata = reference_data.get(conn, path)
+    key = (version, refdata['version'])
+    entry = _cache.get(path)
+    if entry is not None and entry['version'] == key:
+        return entry
+    with _lock:
+        entry = _cache.get(path)
+        if entry is None or entry['version'] != key:
+            start = time.perf_counter()
+            cube = build(conn, refdata)
+            if cube is None:
+                return None
+            entry = {'version': key, 'cube': cube, 'seconds': time.perf_counter() - start}
+            _cache[path] = entry
+    return entry
+
+
+def _name(cube, by, key):
+    if key == MISSING:
+        return MISSING_NAME
+    if by == 'category':
+        return cube['categories'][key]
+    return cube['names'][by].get(key, MISSING_NAME)
+
+
+# Ключ значения измерения для ответа: id владельца или угрозы, название категории; None — значение не указано
+def _public_key(cube, by, key):
+    if key == MISSING:
+        return None
+    if by == 'category':
+        return cube['categories'][key]
+    return key
+
+
+# Отбор из параметров запроса: {измерение: код}. Id владельца и угрозы — числа, категория — название;
+# значение, которого нет в кубе (нечисловой id, неизвестная категория), даёт код None и пустую сводку.
+def parse_filters(cube, args):
+    filters = {}
+    for name, (_, _, parameter) in DIMENSIONS.items():
+        value = args.get(parameter)
+        if value is None or value == '':
+            continue
+        if name == 'category':
+            filters[name] = cube['categories'].index(value) if value in cube['categories'] else None
+        else:
+            try:
+                filters[name] = int(value)
+            except ValueError:
+                filters[name] = None
+    return filters
+
+
+# Описание отбора для ответа: [{'dimension', 'key', 'name'}]
+def describe_filters(cube, filters):
+    return [
+        {'dimension': name, 'key': _public_key(cube, name, code) if code is not None else None,
+         'name': _name(cube, name, code) if code is not None else MISSING_NAME}
+        for name, code in filters.items()
+    ]
+
+
+def _measures(records, computed, residual_risk, risk_score, residual_max, levels, histogram, total):
+    return {
+        'records': int(records),
+        'computed': int(computed),
+        'residual_risk_sum': round(float(residual_risk), 4),
+        'residual_risk_mean': round(float(residual_risk / computed), 4) if computed else None,
+        'residual_risk_max': round(float(residual_max), 4) if computed else None,
+        'risk_score_sum': round(float(risk_score), 4),
+        'share': round(float(residual_risk / total), 4) if total else None,
+        'levels': {name: int(value) for (name, _), value in zip(risk_engine.RISK_LEVELS, levels)},
+        'histogram': [int(value) for value in histogram],
+    }
+
+
+# Сводка по измерению by с отбором filters {измерение: код}; строки по убыванию суммы остаточного риска
+def rollup(cube, by, filters=None):
+    import numpy as np
+
+    mask = np.ones(len(cube['records']), dtype=bool)
+    for name, code in (filters or {}).items():
+        if code is None:
+            mask[:] = False
+        else:
+            mask &= cube['keys'][name] == code
+    cells = np.flatnonzero(mask)
+    keys, groups = np.unique(cube['keys'][by][cells], return_inverse=True)
+    groups = groups.reshape(-1)
+    count = len(keys)
+
+    def grouped(values):
+        return np.bincount(groups, weights=values[cells], minlength=count)
+
+    residual_risk = grouped(cube['residual_risk'])
+    residual_max = np.full(count, -np.inf)
+    np.maximum.at(residual_max, groups, cube['residual_max'][cells])
+    columns = (
+        grouped(cube['records']),
+        grouped(cube['computed']),
+        residual_risk,
+        grouped(cube['risk_score']),
+        residual_max,
+        np.stack([grouped(column) for column in cube['levels'].T], axis=1),
+        np.stack([grouped(column) for column in cube['histogram'].T], axis=1),
+    )
+    total = float(residual_risk.sum())
+    rows = []
+    for i, key in enumerate(keys.tolist()):
+        rows.append({
+            'key': _public_key(cube, by, key),
+            'name': _name(cube, by, key),
+            **_measures(*(column[i] for column in columns), total),
+        })
+    rows.sort(key=lambda row: (-row['residual_risk_sum'], row['name']))
+    totals = _measures(*(column.sum(axis=0) for column in columns[:4]), residual_max.max(initial=-np.inf),
+                       *(column.sum(axis=0) for column in columns[5:]), total)
+    return {'rows': rows, 'totals': totals}
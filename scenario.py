@@ -0,0 +1,286 @@
+import math
+
+import risk_engine
+import risk_scenarios
+
+# Сценарии «что если» для решений по обработке рисков.
+# Переопределения (принятая мера, мера контроля, эффективность защиты, веса критериев) применяются
+# к копии реестра в памяти, после чего остаточные риски, уровни и ранги всех активов пересчитываются
+# векторно (risk_engine.compute_register) и сравниваются с текущими. Таблицы базы не изменяются.
+# Эффективность переопределяется у каждой подходящей записи анализа рисков поверх её совокупной
+# эффективности мер контроля (controls.py); риски всех записей пересчитываются как в risk_scenarios
+# и суммируются по активам. Остаточный риск актива, как и в снимке рисков, считается по первой записи,
+# поэтому переопределение записей, кроме первой, меняет только сумму рисков записей актива.
+#
+# Сценарий (словарь, например из JSON):
+#   {
+#     "overrides": [
+#       {"where": {"vulnerability_category": "Service"}, "set": {"control_effectiveness": 0.7}},
+#       {"where": {"asset_id": [1, 2]}, "set": {"taken_measure_id": 3, "control_measure_id": 5}}
+#     ],
+#     "weights": {"life_health": 0.5, "economy": 0.2}
+#   }
+# Условия where объединяются по «и»; значение условия — число (строка для категории) или список.
+# Переопределения применяются по порядку к записям анализа рисков; как и в маршрутах анализа рисков,
+# мера контроля сохраняется только при принятой мере MINIMIZATION_MEASURE.
+# Веса, не указанные в сценарии, остаются текущими.
+
+FILTERS = ('asset_id', 'asset_owner_id', 'threat_id', 'vulnerability_id', 'vulnerability_category',
+           'taken_measure_id', 'control_measure_id')
+FIELDS = ('taken_measure_id', 'control_measure_id', 'control_effectiveness')
+MINIMIZATION_MEASURE = 'Минимизация рисков и выбор контролей'
+
+
+# Снимок данных для сценариев: реестр активов, записи анализа рисков и текущие веса.
+# None, если веса критериев не заданы.
+def load_state(conn):
+    import numpy as np
+
+    weights = conn.execute(f'SELECT {", ".join(risk_engine.CRITERIA)} FROM criteria_weights').fetchone()
+    if not weights:
+        return None
+    rows = conn.execute('''
+        SELECT ra.id, ra.asset_id, ra.asset_owner_id, ra.threat_id, ra.vulnerability_id,
+               ra.taken_measure_id, ra.control_measure_id, ra.control_effectiveness, v.category
+        FROM risk_analysis ra
+        LEFT JOIN vulnerabilities v ON v.id = ra.vulnerability_id
+        ORDER BY ra.id
+    ''').fetchall()
+    # None превращается в NaN при приведении к float
+    values = np.array([row[:8] for row in rows], dtype=float).reshape(-1, 8)
+    analysis = {
+        'asset_id': values[:, 1],
+        'asset_owner_id': values[:, 2],
+        'threat_id': values[:, 3],
+        'vulnerability_id': values[:, 4],
+        'taken_measure_id': values[:, 5],
+        'control_measure_id': values[:, 6],
+        'control_effectiveness': values[:, 7],
+        'vulnerability_category': np.array([row[8] for row in rows], dtype=object),
+    }
+    minimization = conn.execute('SELECT id FROM taken_measures WHERE name = ?', (MINIMIZATION_MEASURE,)).fetchone()
+    asset_ids, threat_ids = values[:, 1], values[:, 3]
+    return {
+        'register': risk_engine.load_register(conn),
+        'analysis': analysis,
+        # Записи в форме risk_scenarios.load по тем же строкам, что и analysis
+        'scenarios': {
+            'ids': values[:, 0].astype(np.int64),
+            'asset_ids': asset_ids,
+            'threat_ids': threat_ids,
+            'effectiveness': np.nan_to_num(values[:, 7], nan=0.0),
+            'threat_probability': risk_scenarios.threat_probabilities(conn, asset_ids, threat_ids),
+        },
+        'weights': np.asarray(weights, dtype=float),
+        'taken_measures': {row[0] for row in conn.execute('SELECT id FROM taken_measures')},
+        'control_measures': {row[0] for row in conn.execute('SELECT id FROM control_measures')},
+        'minimization_measure': minimization[0] if minimization else None,
+    }
+
+
+def _as_list(value):
+    return list(value) if isinstance(value, (list, tuple)) else [value]
+
+
+def _id(value, name):
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value) or value != int(value):
+        raise ValueError(f'{name} должно быть целым числом')
+    return int(value)
+
+
+# Проверка и приведение сценария: (список (условия, значения), веса)
+def parse(state, scenario):
+    import numpy as np
+
+    if not isinstance(scenario, dict):
+        raise ValueError('Сценарий должен быть объектом')
+    overrides = []
+    for number, override in enumerate(scenario.get('overrides') or [], 1):
+        if not isinstance(override, dict):
+            raise ValueError(f'Переопределение {number}: ожидается объект')
+        where = override.get('where') or {}
+        values = override.get('set') or {}
+        if not isinstance(where, dict) or not isinstance(values, dict):
+            raise ValueError(f'Переопределение {number}: where и set должны быть объектами')
+        unknown = (set(where) - set(FILTERS)) | (set(values) - set(FIELDS))
+        if unknown:
+            raise ValueError(f'Переопределение {number}: неизвестные поля {", ".join(sorted(unknown))}')
+        if not values:
+            raise ValueError(f'Переопределение {number}: не указано, что изменить')
+        try:
+            conditions = {
+                name: [str(item) for item in _as_list(value)] if name == 'vulnerability_category'
+                else [_id(item, name) for item in _as_list(value)]
+                for name, value in where.items()
+            }
+            changes = {}
+            for name, value in values.items():
+                if name == 'control_effectiveness':
+                    if isinstance(value, bool) or not isinstance(value, (int, float)) or not (0 <= value <= 1):
+                        raise ValueError('Эффективность защиты должна быть числом от 0 до 1')
+                    changes[name] = float(value)
+                elif value is None:
+                    changes[name] = None
+                else:
+                    value = _id(value, name)
+                    known = state['taken_measures'] if name == 'taken_measure_id' else state['control_measures']
+                    if value not in known:
+                        raise ValueError(f'{name} {value} не найден')
+                    changes[name] = value
+        except ValueError as e:
+            raise ValueError(f'Переопределение {number}: {e}')
+        overrides.append((conditions, changes))
+
+    weights = state['weights'].copy()
+    requested = scenario.get('weights') or {}
+    if isinstance(requested, (list, tuple)):
+        if len(requested) != len(risk_engine.CRITERIA):
+            raise ValueError(f'Нужно {len(risk_engine.CRITERIA)} весов критериев')
+        requested = dict(zip(risk_engine.CRITERIA, requested))
+    if not isinstance(requested, dict):
+        raise ValueError('Веса должны быть объектом или списком')
+    for name, value in requested.items():
+        if name not in risk_engine.CRITERIA:
+            raise ValueError(f'Неизвестный критерий: {name}')
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value) or value < 0:
+            raise ValueError(f'Вес {name} должен быть неотрицательным числом')
+        weights[risk_engine.CRITERIA.index(name)] = value
+    return overrides, np.asarray(weights, dtype=float)
+
+
+# Применение переопределений к копии записей анализа рисков; возвращает (записи, маски подходящих записей по переопределениям)
+def apply_overrides(state, overrides):
+    import numpy as np
+
+    analysis = {name: column.copy() for name, column in state['analysis'].items()}
+    masks = []
+    for conditions, changes in overrides:
+        mask = np.ones(len(analysis['asset_id']), dtype=bool)
+        for name, values in conditions.items():
+            mask &= np.isin(analysis[name], values)
+        for name, value in changes.items():
+            analysis[name][mask] = np.nan if value is None else value
+        if 'taken_measure_id' in changes and changes['taken_measure_id'] != state['minimization_measure']:
+            analysis['control_measure_id'][mask] = np.nan
+        masks.append(mask)
+    return analysis, masks
+
+
+# Эффективность защиты по активам реестра: из первой (по id) записи анализа рисков, как в risk_engine.load_register
+def _effectiveness(register, analysis):
+    import numpy as np
+
+    effectiveness = np.zeros(len(register['ids']))
+    asset_ids = analysis['asset_id']
+    known = ~np.isnan(asset_ids)
+    first_assets, first_rows = np.unique(asset_ids[known], return_index=True)
+    values = analysis['control_effectiveness'][known][first_rows]
+    positions = np.searchsorted(register['ids'], first_assets.astype(np.int64))
+    in_register = positions < len(register['ids'])
+    in_register[in_register] = register['ids'][positions[in_register]] == first_assets[in_register]
+    effectiveness[positions[in_register]] = np.nan_to_num(values[in_register], nan=0.0)
+    return effectiveness
+
+
+# Пересчёт сценария: текущие и сценарные значения по всем активам с оценками и вероятностью, в порядке id
+def run(state, overrides, weights):
+    import numpy as np
+
+    analysis, masks = apply_overrides(state, overrides)
+    register = state['register']
+    effectiveness = _effectiveness(register, analysis)
+    baseline = risk_engine.compute_register(register, state['weights'])
+    scenario = risk_engine.compute_register(dict(register, effectiveness=effectiveness), weights)
+
+    # Риски записей анализа рисков до и после; записи активов без оценок или вероятности не рассчитываются
+    scenarios = state['scenarios']
+    rows_before = risk_scenarios.compute(scenarios, register, state['weights'])
+    rows_after = risk_scenarios.compute(
+        dict(scenarios, effectiveness=np.nan_to_num(analysis['control_effectiveness'], nan=0.0)), register, weights)
+    valid = rows_before['valid']
+
+    # Оба расчёта содержат одни и те же активы (полнота оценок сценарий не меняет); выравнивание по id
+    before = np.argsort(baseline['ids'])
+    after = np.argsort(scenario['ids'])
+    ids = baseline['ids'][before]
+    positions = np.searchsorted(register['ids'], ids)
+
+    # Суммы рисков записей по активам результата. Запись с вероятностью по угрозе рассчитывается и у актива
+    # без общей вероятности угроз, которого в результате нет, — она учитывается только в changed_rows.
+    row_assets = np.minimum(np.searchsorted(ids, np.nan_to_num(scenarios['asset_ids'], nan=-1)), max(len(ids) - 1, 0))
+    in_result = valid & (ids[row_assets] == scenarios['asset_ids']) if len(ids) else np.zeros_like(valid)
+
+    def asset_sums(rows):
+        return np.bincount(row_assets[in_result], weights=rows['residual_risk'][in_result], minlength=len(ids))
+
+    return {
+        'ids': ids,
+        'names': [baseline['names'][i] for i in before],
+        'effectiveness': (register['effectiveness'][positions], effectiveness[positions]),
+        'criticality': (baseline['criticality'][before], scenario['criticality'][after]),
+        'residual_risk': (baseline['residual_risk'][before], scenario['residual_risk'][after]),
+        'level': (baseline['level'][before], scenario['level'][after]),
+        'rank': (baseline['rank'][before], scenario['rank'][after]),
+        'scenario_residual_risk': (asset_sums(rows_before), asset_sums(rows_after)),
+        'changed_rows': int((rows_before['residual_risk'][valid] != rows_after['residual_risk'][valid]).sum()),
+        'affected_rows': [int(mask.sum()) for mask in masks],
+        'computed_rows': [int((mask & valid).sum()) for mask in masks],
+    }
+
+
+# Ответ для JSON: активы по рангу в сценарии и сводка изменений уровней
+def result_rows(result):
+    levels = [name for name, _ in risk_engine.RISK_LEVELS]
+    rows = []
+    transitions = {}
+    columns = zip(
+        result['ids'].tolist(), result['names'],
+        *(value.tolist() for pair in ('effectiveness', 'criticality', 'residual_risk', 'level', 'rank', 'scenario_residual_risk')
+          for value in result[pair]),
+    )
+    for (asset_id, name, effectiveness_before, effectiveness_after, criticality_before, criticality_after,
+         residual_before, residual_after, level_before, level_after, rank_before, rank_after,
+         scenario_before, scenario_after) in columns:
+        if level_before != level_after:
+            key = f'{levels[level_before]} → {levels[level_after]}'
+            transitions[key] = transitions.get(key, 0) + 1
+        rows.append({
+            'asset_id': asset_id,
+            'asset': name,
+            'effectiveness_before': round(effectiveness_before, 4),
+            'effectiveness_after': round(effectiveness_after, 4),
+            'criticality_before': round(criticality_before, 4),
+            'criticality_after': round(criticality_after, 4),
+            'residual_risk_before': round(residual_before, 4),
+            'residual_risk_after': round(residual_after, 4),
+            'residual_risk_delta': round(residual_after - residual_before, 4),
+            'level_before': levels[level_before],
+            'level_after': levels[level_after],
+            'rank_before': rank_before,
+            'rank_after': rank_after,
+            # Положительное значение — актив поднялся в рейтинге
+            'rank_delta': rank_before - rank_after,
+            # Сумма остаточных рисков всех записей анализа рисков актива
+            'scenario_residual_risk_before': round(scenario_before, 4),
+            'scenario_residual_risk_after': round(scenario_after, 4),
+            'scenario_residual_risk_delta': round(scenario_after - scenario_before, 4),
+        })
+    rows.sort(key=lambda row: row['rank_after'])
+    summary = {
+        'assets': len(rows),
+        'affected_rows': result['affected_rows'],
+        # Подходящие записи с рассчитанным риском; переопределения без таких записей ничего не меняют
+        'computed_rows': result['computed_rows'],
+        'ineffective_overrides': [number for number, count in enumerate(result['computed_rows'], 1) if count == 0],
+        'changed_rows': result['changed_rows'],
+        'changed_scenario_residual_risk': sum(1 for row in rows if row['scenario_residual_risk_delta'] != 0),
+        'changed_residual_risk': sum(1 for row in rows if row['residual_risk_delta'] != 0),
+        'changed_level': sum(transitions.values()),
+        'changed_rank': sum(1 for row in rows if row['rank_delta'] != 0),
+        'level_transitions': transitions,
+        'total_residual_risk_before': round(float(result['residual_risk'][0].sum()), 4),
+        'total_residual_risk_after': round(float(result['residual_risk'][1].sum()), 4),
+        'total_scenario_residual_risk_before': round(float(result['scenario_residual_risk'][0].sum()), 4),
+        'total_scenario_residual_risk_after': round(float(result['scenario_residual_risk'][1].sum()), 4),
+    }
+    return {'summary': summary, 'assets': rows}
@@ -0,0 +1,140 @@
+import risk_engine
+
+# Чувствительность рейтинга активов к весам критериев.
+# Векторы весов выбираются на симплексе вокруг текущего из распределения Дирихле с параметрами
+# concentration × доли текущих весов: среднее равно текущим весам, разброс уменьшается с ростом concentration.
+# Критичность всех активов для порции векторов считается одним матричным произведением
+# (активы × критерии) @ (критерии × векторы), ранги — сортировкой по каждому столбцу так же,
+# как в risk_engine.compute_register (по округлённой критичности, при равенстве — по id).
+# По каждому активу накапливаются минимальный, максимальный и средний ранг и доля векторов,
+# при которых актив входит в первые top позиций.
+
+DEFAULT_SAMPLES = 2000
+MAX_SAMPLES = 20000
+DEFAULT_CONCENTRATION = 100.0
+DEFAULT_TOP = 10
+
+# Максимальное число элементов матрицы критичности (активы × векторы) в одной порции
+CELL_CHUNK = 2000000
+
+
+# Случайные векторы весов вокруг weights с той же суммой; первый вектор — сами текущие веса
+def sample_weights(weights, samples, concentration, rng):
+    import numpy as np
+
+    weights = np.asarray(weights, dtype=float)
+    total = weights.sum()
+    # Нулевой вес недопустим для распределения Дирихле: такой критерий остаётся нулевым
+    active = weights > 0
+    sampled = np.zeros((samples, len(weights)))
+    sampled[0] = weights
+    if samples > 1:
+        # Сумма весов сохраняется, чтобы шкала критичности (и округление при ранжировании) не менялась
+        sampled[1:, active] = rng.dirichlet(concentration * weights[active] / total, samples - 1) * total
+    return sampled
+
+
+# Ранги (с 1) для каждого столбца матрицы критичности
+def _ranks(criticality):
+    import numpy as np
+
+    order = np.argsort(-np.round(criticality, 2), axis=0, kind='stable')
+    ranks = np.empty_like(order)
+    np.put_along_axis(ranks, order, np.arange(1, criticality.shape[0] + 1)[:, None], axis=0)
+    return ranks
+
+
+# Анализ для активов с полным набором оценок: статистика рангов по samples векторам весов.
+# seed — зерно генератора (одинаковые данные и seed дают одинаковый результат).
+def analyze(register, weights, samples=DEFAULT_SAMPLES, concentration=DEFAULT_CONCENTRATION, top=DEFAULT_TOP, seed=None):
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    valid = np.flatnonzero(~np.isnan(register['scores']).any(axis=1) & ~np.isnan(register['probability']))
+    scores = register['scores'][valid]
+    sampled = sample_weights(weights, samples, concentration, rng)
+
+    count = len(valid)
+    rank_min = np.full(count, count + 1, dtype=np.int64)
+    rank_max = np.zeros(count, dtype=np.int64)
+    rank_sum = np.zeros(count)
+    rank_squares = np.zeros(count)
+    top_hits = np.zeros(count, dtype=np.int64)
+    same_top = 0
+    current_rank = np.zeros(count, dtype=np.int64)
+    spearman = np.empty(samples)
+
+    chunk = max(1, CELL_CHUNK // max(count, 1))
+    for start in range(0, samples, chunk):
+        ranks = _ranks(scores @ sampled[start:start + chunk].T)
+        if start == 0:
+            current_rank = ranks[:, 0].copy()
+        rank_min = np.minimum(rank_min, ranks.min(axis=1))
+        rank_max = np.maximum(rank_max, ranks.max(axis=1))
+        rank_sum += ranks.sum(axis=1)
+        rank_squares += (ranks.astype(float) ** 2).sum(axis=1)
+        top_hits += (ranks <= top).sum(axis=1)
+        same_top += int(((ranks <= top) == (current_rank <= top)[:, None]).all(axis=0).sum())
+        # Ранговая корреляция Спирмена с текущим рейтингом (ранги без совпадений)
+        differences = ((ranks - current_rank[:, None]).astype(float) ** 2).sum(axis=0)
+        spearman[start:start + ranks.shape[1]] = (1 - 6 * differences / (count * (count ** 2 - 1))) if count > 1 else 1.0
+
+    mean_rank = rank_sum / samples
+    return {
+        'ids': register['ids'][valid],
+        'names': [register['names'][i] for i in valid],
+        'current_rank': current_rank,
+        'rank_min': rank_min,
+        'rank_max': rank_max,
+        'rank_mean': mean_rank,
+        'rank_std': np.sqrt(np.maximum(rank_squares / samples - mean_rank ** 2, 0)),
+        'top_probability': top_hits / samples,
+        'spearman': spearman,
+        'stable_top_share': same_top / samples,
+        'weights': sampled,
+    }
+
+
+# Ответ для шаблона и JSON: активы по текущему рангу и сводка по выборке весов
+def result_rows(result, top):
+    import numpy as np
+
+    rows = []
+    columns = zip(
+        result['ids'].tolist(), result['names'], result['current_rank'].tolist(), result['rank_min'].tolist(),
+        result['rank_max'].tolist(), result['rank_mean'].tolist(), result['rank_std'].tolist(),
+        result['top_probability'].tolist(),
+    )
+    for asset_id, name, rank, rank_min, rank_max, rank_mean, rank_std, top_probability in columns:
+        rows.append({
+            'asset_id': asset_id,
+            'asset': name,
+            'rank': rank,
+            'rank_min': rank_min,
+            'rank_max': rank_max,
+            'rank_range': rank_max - rank_min,
+            'rank_mean': round(rank_mean, 2),
+            'rank_std': round(rank_std, 2),
+            'top_probability': round(top_probability, 4),
+        })
+    rows.sort(key=lambda row: row['rank'])
+    weights = result['weights']
+    criteria = [
+        {
+            'criterion': criterion,
+            'current': round(float(weights[0, i]), 4),
+            'p5': round(float(np.percentile(weights[:, i], 5)), 4),
+            'p95': round(float(np.percentile(weights[:, i], 95)), 4),
+        }
+        for i, criterion in enumerate(risk_engine.CRITERIA)
+    ]
+    spearman = result['spearman']
+    summary = {
+        'assets': len(rows),
+        'top': top,
+        'spearman_mean': round(float(spearman.mean()), 4) if len(spearman) else None,
+        'spearman_p5': round(float(np.percentile(spearman, 5)), 4) if len(spearman) else None,
+        # Доля векторов весов, при которых первые top позиций занимают те же активы (в любом порядке)
+        'stable_top_share': round(result['stable_top_share'], 4),
+    }
+    return {'summary': summary, 'criteria': criteria, 'assets': rows}
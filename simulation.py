@@ -0,0 +1,172 @@
+import risk_engine
+
+# Моделирование Монте-Карло остаточного риска по разбросу оценок экспертов.
+# В каждом испытании для актива случайно (равновероятно) выбираются оценка одного эксперта
+# (все шесть критериев вместе) и вероятность угрозы одного эксперта; эффективность защиты фиксирована.
+# Поскольку исходы испытания — конечный набор пар (оценка, вероятность), испытания не хранятся:
+# число попаданий в каждую пару разыгрывается сразу мультиномиальным распределением, а процентили
+# считаются по упорядоченным значениям с накопленными частотами. Это даёт то же распределение
+# результатов, что и поштучная генерация draws испытаний, но стоимость не зависит от draws.
+
+DEFAULT_DRAWS = 10000
+MAX_DRAWS = 100000
+PERCENTILES = (5, 50, 95)
+
+# Максимальное число пар (оценка, вероятность) в одной порции активов
+CELL_CHUNK = 2000000
+
+
+# Значения по активам в виде матрицы (актив × эксперт), дополненной NaN, и число значений у каждого актива
+def _pad(group_ids, values, asset_ids):
+    import numpy as np
+
+    counts = np.zeros(len(asset_ids), dtype=np.int64)
+    if len(group_ids) == 0:
+        return np.full((len(asset_ids), 1), np.nan), counts
+    rows = np.searchsorted(asset_ids, group_ids)
+    np.add.at(counts, rows, 1)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    columns = np.arange(len(group_ids)) - starts[rows]
+    matrix = np.full((len(asset_ids), max(int(counts.max()), 1)), np.nan)
+    matrix[rows, columns] = values
+    return matrix, counts
+
+
+# Загрузка исходных данных: критичность по оценке каждого эксперта, вероятности экспертов,
+# эффективность защиты (как в risk_engine.load_register). Активы без оценок или вероятностей исключаются.
+def load_inputs(conn, weights):
+    import numpy as np
+
+    register = risk_engine.load_register(conn)
+    asset_ids = register['ids']
+
+    evaluations = conn.execute(f'''
+        SELECT asset_id, {', '.join(risk_engine.CRITERIA)}
+        FROM asset_evaluations
+        WHERE {' AND '.join(f'{criterion} IS NOT NULL' for criterion in risk_engine.CRITERIA)}
+        ORDER BY asset_id
+    ''').fetchall()
+    evaluations = np.array(evaluations, dtype=float).reshape(-1, len(risk_engine.CRITERIA) + 1)
+    evaluation_assets = evaluations[:, 0].astype(np.int64)
+    known = np.isin(evaluation_assets, asset_ids)
+    criticality = evaluations[known, 1:] @ np.asarray(weights, dtype=float)
+    criticality, evaluation_counts = _pad(evaluation_assets[known], criticality, asset_ids)
+
+    probabilities = np.array(conn.execute('''
+        SELECT asset_id, probability FROM threat_probabilities
+        WHERE probability IS NOT NULL
+        ORDER BY asset_id
+    ''').fetchall(), dtype=float).reshape(-1, 2)
+    probability_assets = probabilities[:, 0].astype(np.int64)
+    known = np.isin(probability_assets, asset_ids)
+    probability, probability_counts = _pad(probability_assets[known], probabilities[known, 1], asset_ids)
+
+    keep = np.flatnonzero((evaluation_counts > 0) & (probability_counts > 0))
+    return {
+        'ids': asset_ids[keep],
+        'names': [register['names'][i] for i in keep],
+        'criticality': criticality[keep],
+        'evaluation_counts': evaluation_counts[keep],
+        'probability': probability[keep],
+        'probability_counts': probability_counts[keep],
+        'effectiveness': register['effectiveness'][keep],
+    }
+
+
+# Процентиль q (0–100) выборки, заданной упорядоченными значениями и накопленными частотами,
+# с линейной интерполяцией, как numpy.percentile на развёрнутой выборке из draws элементов
+def _weighted_percentile(sorted_values, cumulative, draws, q):
+    import numpy as np
+
+    position = (draws - 1) * q / 100
+    lower = np.floor(position)
+    fraction = position - lower
+
+    def value_at(index):
+        cell = (cumulative <= index).sum(axis=1)
+        return np.take_along_axis(sorted_values, cell[:, None], axis=1)[:, 0]
+
+    low_value = value_at(lower)
+    if fraction == 0:
+        return low_value
+    return low_value + fraction * (value_at(min(lower + 1, draws - 1)) - low_value)
+
+
+def _simulate_chunk(rng, inputs, rows, draws):
+    import numpy as np
+
+    criticality = inputs['criticality'][rows]
+    probability = inputs['probability'][rows]
+    n_evaluations = criticality.shape[1]
+    n_probabilities = probability.shape[1]
+
+    impact = 1 + (criticality / 10) * 2
+    residual = (impact[:, :, None] * probability[:, None, :]
+                * (1 - inputs['effectiveness'][rows])[:, None, None]).reshape(len(rows), -1)
+    valid = ((np.arange(n_evaluations) < inputs['evaluation_counts'][rows][:, None])[:, :, None]
+             & (np.arange(n_probabilities) < inputs['probability_counts'][rows][:, None])[:, None, :]).reshape(len(rows), -1)
+    cells = (inputs['evaluation_counts'][rows] * inputs['probability_counts'][rows]).astype(float)
+    counts = rng.multinomial(draws, valid / cells[:, None])
+
+    residual = np.where(valid, residual, np.inf)
+    order = np.argsort(residual, axis=1, kind='stable')
+    sorted_values = np.take_along_axis(residual, order, axis=1)
+    cumulative = np.cumsum(np.take_along_axis(counts, order, axis=1), axis=1)
+
+    finite = np.where(valid, residual, 0.0)
+    high = risk_engine.risk_level_codes(finite) == risk_engine.LEVEL_HIGH
+    return {
+        'mean': (counts * finite).sum(axis=1) / draws,
+        'percentiles': [_weighted_percentile(sorted_values, cumulative, draws, q) for q in PERCENTILES],
+        'high_probability': (counts * (high & valid)).sum(axis=1) / draws,
+    }
+
+
+# Моделирование для всех активов из load_inputs: draws испытаний на актив, seed — зерно генератора
+# (одинаковые данные и seed дают одинаковый результат). Возвращает массивы по активам в порядке id.
+def simulate(inputs, draws=DEFAULT_DRAWS, seed=None):
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    total = len(inputs['ids'])
+    cells_per_asset = max(inputs['criticality'].shape[1] * inputs['probability'].shape[1], 1)
+    chunk = max(1, CELL_CHUNK // cells_per_asset)
+
+    mean = np.empty(total)
+    percentiles = np.empty((len(PERCENTILES), total))
+    high_probability = np.empty(total)
+    for start in range(0, total, chunk):
+        rows = np.arange(start, min(start + chunk, total))
+        result = _simulate_chunk(rng, inputs, rows, draws)
+        mean[rows] = result['mean']
+        for i, values in enumerate(result['percentiles']):
+            percentiles[i, rows] = values
+        high_probability[rows] = result['high_probability']
+    return {
+        'ids': inputs['ids'],
+        'names': inputs['names'],
+        'evaluation_counts': inputs['evaluation_counts'],
+        'probability_counts': inputs['probability_counts'],
+        'mean': mean,
+        'percentiles': percentiles,
+        'high_probability': high_probability,
+    }
+
+
+# Строки результата: словари с p5/p50/p95, средним и вероятностью уровня «Высокий», по убыванию p95
+def result_rows(result):
+    rows = []
+    for i, asset_id in enumerate(result['ids'].tolist()):
+        row = {
+            'asset_id': asset_id,
+            'asset': result['names'][i],
+            'evaluations': int(result['evaluation_counts'][i]),
+            'probabilities': int(result['probability_counts'][i]),
+            'mean': round(float(result['mean'][i]), 4),
+        }
+        for q, values in zip(PERCENTILES, result['percentiles']):
+            row[f'p{q}'] = round(float(values[i]), 4)
+        row['high_probability'] = round(float(result['high_probability'][i]), 4)
+        rows.append(row)
+    rows.sort(key=lambda row: (-row[f'p{PERCENTILES[-1]}'], row['asset_id']))
+    return rows